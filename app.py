@@ -2,56 +2,195 @@
 
 # Place this route after app and db initialization
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, abort, current_app, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 import os
-import shutil
 from datetime import datetime
-from sqlalchemy import text
+from sqlalchemy import insert, select, case, cast, func, literal_column, table, column, tuple_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import joinedload
 from secrets import token_hex
-import requests
+import base64
+import hashlib
+import json
+import binascii
+import math
+import re
+from collections import namedtuple
+from cache import LRUCache, VersionedValue
+from fragments import FragmentCache, templates_stamp
+from geocode import Geocoder
+from images import ImageProcessor
+from instrumentation import Instrumentation
+from profiling import RequestProfiler, settings_from_env as profile_settings_from_env
+from uploads import is_content_path, save_upload
+from db_engine import current_profile, engine_options, install_pragmas
 
 
-app = Flask(__name__)
-app.secret_key = "REMOVE_ME" #token_hex(32)
+# Extensions are created unbound and attached to an app in create_app(), so
+# importing this module (models, query helpers) doesn't build an application.
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = "login"
+geocoder = Geocoder()
+image_processor = ImageProcessor()
+# Per-worker entries are also dropped when any process moves the shared stamp
+fragment_cache = FragmentCache(version=lambda: _cache_version('fragments'))
+instrumentation = Instrumentation()
+request_profiler = RequestProfiler()
 
-# Database configuration: use the instance folder DB if available
-os.makedirs(app.instance_path, exist_ok=True)
-db_path = os.path.join(app.instance_path, 'amcho_pasro.db')
-# If migrating from an older DB name, copy any existing .db in instance to the new path
-if not os.path.exists(db_path):
-    try:
-        for _fname in os.listdir(app.instance_path):
-            if _fname.lower().endswith('.db'):
-                _src = os.path.join(app.instance_path, _fname)
-                if os.path.abspath(_src) != os.path.abspath(db_path):
-                    shutil.copyfile(_src, db_path)
-                break
-    except Exception:
-        # Non-fatal: on error we'll create a fresh DB later
-        pass
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Upload configuration
-UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB max file size
 
-# Create upload directory if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+def default_config(app):
+    """Configuration defaults; anything passed to create_app() overrides them."""
+    # The DB lives in the instance folder; its schema is managed by
+    # migrations.py (`python db_manager.py migrate`), never at startup
+    db_path = os.path.join(app.instance_path, 'amcho_pasro.db')
+    return {
+        'SECRET_KEY': "REMOVE_ME", #token_hex(32)
+        'DATABASE_PATH': db_path,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        # SQLite tuning (WAL, busy timeout, cache...) and pool sizing; see db_engine.py
+        'SQLITE_PROFILE': current_profile(),
 
-db = SQLAlchemy(app)
+        # Upload configuration
+        'UPLOAD_FOLDER': os.path.join(app.root_path, 'static', 'uploads'),
+        'MAX_CONTENT_LENGTH': 5 * 1024 * 1024,  # 5MB max file size
+        # Batch product API (/api/products/batch): items per request and request
+        # size, which covers all of the batch's images together
+        'PRODUCT_BATCH_MAX_ITEMS': 200,
+        'PRODUCT_BATCH_MAX_CONTENT_LENGTH': 50 * 1024 * 1024,
+        # Resized upload variants are rendered in the background (see images.py)
+        'IMAGE_PROCESSING_ASYNC': True,
+        'IMAGE_WORKERS': 2,
+        'IMAGE_QUALITY': 80,
 
-login_manager = LoginManager(app)
-login_manager.login_view = "login"
+        # Geocoding proxy: upstream, timeouts and cache (see geocode.py)
+        'NOMINATIM_URL': 'https://nominatim.openstreetmap.org',
+        'NOMINATIM_USER_AGENT': 'AmchoPasroApp/1.0 (+http://localhost)',
+        'GEOCODE_TIMEOUT': (3.05, 5),
+        'GEOCODE_CACHE_PATH': os.path.join(app.instance_path, 'geocode_cache.db'),
+        'GEOCODE_CACHE_TTL': 7 * 24 * 3600,
+        'GEOCODE_REVERSE_PRECISION': 4,
+        # Nominatim policy: at most 1 request/second. One budget for every
+        # process on the host (workers and geocode_service.py), no bursts
+        'GEOCODE_RATE_LIMIT': 1.0,
+        'GEOCODE_RATE_BURST': 1,
+        # Browsers may reuse geocode answers this long (seconds) without asking again
+        'GEOCODE_HTTP_MAX_AGE': 24 * 3600,
+        # Async geocode service (see geocode_service.py). When GEOCODE_SERVICE_URL
+        # is set the store finder calls it instead of the blocking views here
+        'GEOCODE_SERVICE_URL': None,
+        'GEOCODE_SERVICE_TIMEOUT': (2, 4),  # (connect, read) seconds
+        'GEOCODE_SERVICE_CONNECTIONS': 8,
+        # Access-Control-Allow-Origin for the service when it runs on another origin
+        'GEOCODE_SERVICE_CORS_ORIGIN': None,
+
+        # Search configuration: only the best N ranked matches are returned
+        'SEARCH_RESULT_LIMIT': 60,
+        # Listing pages are cursor-paginated; PRODUCTS_PER_PAGE is the default page size
+        'PRODUCTS_PER_PAGE': 24,
+        'PRODUCTS_PER_PAGE_MAX': 100,
+        # Store page reviews per page; older ones follow a ?reviews= cursor
+        'STORE_PAGE_REVIEWS': 20,
+        # Store finder API: default search radius (km) and result caps
+        'STORES_NEARBY_RADIUS_KM': 25,
+        'STORES_NEARBY_MAX_RADIUS_KM': 500,
+        'STORES_NEARBY_LIMIT': 50,
+        'STORES_NEARBY_MAX_LIMIT': 500,
+        # Map clustering: grid cells per tile edge, tiles per request and cache lifetime
+        'STORE_CLUSTER_GRID': 4,
+        'STORE_CLUSTER_MAX_TILES': 64,
+        'STORE_CLUSTER_TOP_STORES': 3,
+        'STORE_CLUSTER_CACHE_TTL': 300,
+        # Seconds between checks of the category version stamp (other workers' changes)
+        'CATEGORY_CACHE_CHECK_INTERVAL': 30,
+        # Lifetime of the cached per-category product counts (seconds)
+        'CATEGORY_COUNTS_TTL': 60,
+        # Lifetime of cached login identities (seconds); edits refresh them immediately
+        'USER_CACHE_TTL': 60,
+        # Rendered fragment/page cache (see fragments.py). 'memory' is per
+        # worker and dropped on any write; 'filesystem' shares entries and tag
+        # invalidations between the workers on one host
+        'FRAGMENT_CACHE_BACKEND': 'memory',
+        'FRAGMENT_CACHE_TTL': 300,
+        'FRAGMENT_CACHE_SIZE': 2048,
+        'FRAGMENT_CACHE_DIR': os.path.join(app.instance_path, 'fragment_cache'),
+        # Request instrumentation (see instrumentation.py): slow SQL and N+1
+        # warnings, Server-Timing headers (None = debug only) and /metrics
+        'SLOW_QUERY_MS': 100,
+        'QUERY_COUNT_WARN': 50,
+        'SERVER_TIMING': None,
+        # /metrics is opt-in: it exposes endpoint names and traffic figures
+        'METRICS_ENABLED': False,
+        # When set, /metrics requires "Authorization: Bearer <token>"
+        'METRICS_TOKEN': None,
+        # Sampling profiler for hot views (see profiling.py); off unless the
+        # rate is > 0. Rate, mode and endpoints come from the environment
+        **profile_settings_from_env(),
+        'PROFILE_INTERVAL_MS': 5,
+        'PROFILE_DIR': os.path.join(app.instance_path, 'profiles'),
+    }
+
+# Views register here and are bound to the app in create_app(); endpoint names
+# stay the bare function names, as url_for() calls expect.
+_routes = []
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+def create_app(config=None):
+    """Build a configured app: extensions initialised and routes registered.
+
+    Cheap on purpose (no DB connection, schema work or network clients), so
+    pre-fork workers and db_manager.py commands start fast; optional heavy
+    dependencies (requests, Pillow) are imported on first use.
+    """
+    app = Flask(__name__)
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.config.update(default_config(app))
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLITE_PROFILE']))
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Part of cached fragments' keys and page ETags: a deploy with new templates invalidates both
+    app.config['TEMPLATES_STAMP'] = templates_stamp(app)
+
+    db.init_app(app)
+    with app.app_context():
+        install_pragmas(db.engine, app.config['SQLITE_PROFILE'])
+    instrumentation.init_app(app)
+    request_profiler.init_app(app)
+    login_manager.init_app(app)
+    geocoder.init_app(app)
+    geocoder.on_upstream = instrumentation.record_upstream
+    image_processor.init_app(app)
+    fragment_cache.init_app(app)
+    store_cluster_cache.ttl = app.config['STORE_CLUSTER_CACHE_TTL']
+    category_cache.check_interval = app.config['CATEGORY_CACHE_CHECK_INTERVAL']
+    category_count_cache.ttl = app.config['CATEGORY_COUNTS_TTL']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+
+    app.context_processor(inject_globals)
+    app.url_defaults(fingerprint_static_url)
+    app.after_request(static_cache_headers)
+    app.jinja_env.globals.update(
+        product_card=product_card,
+        store_product_card=store_product_card,
+        store_hero_profile=store_hero_profile,
+        store_hero_stats=store_hero_stats,
+        product_detail_panel=product_detail_panel,
+        geocode_endpoint=geocode_endpoint,
+    )
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
 
-@app.context_processor
 def inject_globals():
     """Inject global template variables like current year."""
     return {"current_year": datetime.utcnow().year}
@@ -61,7 +200,7 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
-    user_type = db.Column(db.String(20), nullable=False, default='buyer')  # 'buyer' or 'seller'
+    user_type = db.Column(db.String(20), nullable=False, default='buyer', index=True)  # 'buyer' or 'seller'
     
     # Seller specific fields
     store_name = db.Column(db.String(150), nullable=True)
@@ -72,6 +211,10 @@ class User(UserMixin, db.Model):
     store_longitude = db.Column(db.Float, nullable=True)
     store_address = db.Column(db.Text, nullable=True)
     store_image = db.Column(db.String(255), nullable=True)  # Store profile image
+    store_image_thumb = db.Column(db.String(255), nullable=True)  # Resized variant, set by images.py
+    # Denormalized review aggregates, maintained by add_store_review()
+    store_review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    store_rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<User {self.email}>'
@@ -92,22 +235,28 @@ class User(UserMixin, db.Model):
         return self.is_seller()
     
     def get_store_rating(self):
-        """Calculate average rating for this store"""
-        if not self.is_seller():
-            return None
-
-        reviews = StoreReview.query.filter_by(store_owner_id=self.id).all()
-        if not reviews:
+        """Average rating for this store, from the maintained aggregates"""
+        if not self.is_seller() or not self.store_review_count:
             return None
-
-        total_rating = sum(review.rating for review in reviews)
-        return round(total_rating / len(reviews), 1)
+        return round(self.store_rating_sum / self.store_review_count, 1)
     
     def get_review_count(self):
         """Get total number of reviews for this store"""
         if not self.is_seller():
             return 0
-        return StoreReview.query.filter_by(store_owner_id=self.id).count()
+        return self.store_review_count or 0
+
+    def record_review(self, rating, previous_rating=None):
+        """Apply a new or changed review to the store aggregates.
+
+        Uses SQL-side arithmetic so concurrent reviews can't lose updates;
+        the change commits together with the review row itself.
+        """
+        if previous_rating is None:
+            self.store_review_count = User.store_review_count + 1
+            self.store_rating_sum = User.store_rating_sum + rating
+        else:
+            self.store_rating_sum = User.store_rating_sum + (rating - previous_rating)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -117,14 +266,25 @@ class Product(db.Model):
     # city field removed: use store location from User
     description = db.Column(db.Text, nullable=True)
     image_filename = db.Column(db.String(255), nullable=True)
+    # Resized variants of image_filename, filled in by the background image processor
+    image_thumb = db.Column(db.String(255), nullable=True)
+    image_card = db.Column(db.String(255), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     # Category relationship
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
     
     # Relationship with User
     user = db.relationship('User', backref=db.backref('products', lazy=True))
     category = db.relationship('Category', backref=db.backref('products', lazy=True))
+
+    # Listings are always read newest first, optionally narrowed to one store
+    # or category: each index matches a keyset page (filter, created_at, id)
+    __table_args__ = (
+        db.Index('ix_product_created_at_id', 'created_at', 'id'),
+        db.Index('ix_product_user_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_product_category_created_at', 'category_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<Product {self.title}>'
@@ -140,17 +300,109 @@ class StoreReview(db.Model):
     # Relationships
     store_owner = db.relationship('User', foreign_keys=[store_owner_id], backref=db.backref('store_reviews', lazy=True))
     reviewer = db.relationship('User', foreign_keys=[reviewer_id], backref=db.backref('given_reviews', lazy=True))
+
+    __table_args__ = (
+        # One review per user and store; also serves the "already reviewed?" lookup
+        db.Index('uq_store_review_owner_reviewer', 'store_owner_id', 'reviewer_id', unique=True),
+        # Store page: a store's reviews newest first
+        db.Index('ix_store_review_owner_created_at', 'store_owner_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<StoreReview {self.rating} stars for {self.store_owner.store_name}>'
 
+    @staticmethod
+    def for_store(store_owner_id):
+        return StoreReview.query.filter_by(store_owner_id=store_owner_id).order_by(StoreReview.created_at.desc())
+
+    @staticmethod
+    def by_reviewer(store_owner_id, reviewer_id):
+        return StoreReview.query.filter_by(store_owner_id=store_owner_id, reviewer_id=reviewer_id)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def store_upload(file):
+    """Save an uploaded image into content-addressed storage; returns its stored path."""
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    relpath, _existing = save_upload(file, current_app.config['UPLOAD_FOLDER'], ext)
+    return relpath
+
+def process_product_image(product_id, image_filename):
+    """Queue thumbnail/card variants for a product's uploaded image."""
+    def record(variants):
+        Product.query.filter_by(id=product_id).update({
+            'image_thumb': variants.get('thumb'),
+            'image_card': variants.get('card'),
+        })
+        db.session.commit()
+        fragment_cache.invalidate(f"product:{product_id}")
+
+    image_processor.submit(image_filename, record)
+
+def process_store_image(user):
+    """Queue the thumbnail variant for a seller's uploaded store image."""
+    user_id = user.id
+    image = user.store_image
+
+    def record(variants):
+        # Skip if the store image was replaced again while this one was processing
+        User.query.filter_by(id=user_id, store_image=image).update({
+            'store_image_thumb': variants.get('thumb'),
+        })
+        db.session.commit()
+        fragment_cache.invalidate(f"store:{user_id}")
+
+    image_processor.submit(image, record)
+
+class SessionUser(UserMixin):
+    """Read-only snapshot of the logged-in user for templates and access checks.
+
+    Holds only the columns pages read (no store_address Text, no
+    relationships) so load_user() can serve it from a per-worker cache.
+    Routes that change the user load the row with User.get(current_user.id).
+    """
+    FIELDS = ('id', 'username', 'email', 'user_type', 'store_name', 'store_location',
+              'store_city', 'store_image', 'store_image_thumb')
+
+    def __init__(self, row):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(row, field))
+
+    @classmethod
+    def load(cls, user_id):
+        row = (db.session.query(*(getattr(User, f) for f in cls.FIELDS))
+               .filter(User.id == user_id).first())
+        return cls(row) if row else None
+
+    def is_seller(self):
+        return self.user_type == 'seller'
+
+    def is_fisherman(self):
+        return self.is_seller()
+
+# Identity snapshots keyed by (user id, session revision); lifetime from
+# USER_CACHE_TTL, applied in create_app()
+user_cache = LRUCache(maxsize=4096)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.get(user_id)
+    key = (int(user_id), session.get('user_rev'))
+    user = user_cache.get(key)
+    if user is None:
+        user = SessionUser.load(key[0])
+        if user is not None:
+            user_cache.set(key, user)
+    return user
+
+def invalidate_user():
+    """Refresh the current user's cached identity after changing their row.
+
+    A new revision in the (signed) session changes the cache key, so every
+    worker reloads the snapshot on this user's next request, not just this one.
+    """
+    session['user_rev'] = token_hex(4)
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -162,109 +414,474 @@ class Category(db.Model):
 
     @staticmethod
     def get_by_slug(slug):
-        return Category.query.filter_by(slug=slug).first()
+        return category_cache.get().by_slug.get(slug)
+
+    @staticmethod
+    def get_by_id(category_id):
+        return category_cache.get().by_id.get(category_id)
 
     @staticmethod
     def all():
-        return Category.query.order_by(Category.name.asc()).all()
+        return category_cache.get().ordered
+
+# Categories almost never change, so the whole taxonomy is cached per worker.
+# Lookups return CategoryInfo snapshots (safe to share between requests), not
+# session-bound Category rows.
+CategoryInfo = namedtuple('CategoryInfo', 'id name slug')
+
+class CategoryTaxonomy:
+    """Immutable snapshot of all categories: sorted by name and keyed by id and slug."""
+
+    def __init__(self, categories):
+        self.ordered = categories
+        self.by_id = {c.id: c for c in categories}
+        self.by_slug = {c.slug: c for c in categories}
+
+def _load_categories():
+    rows = db.session.query(Category.id, Category.name, Category.slug).order_by(Category.name.asc())
+    taxonomy = CategoryTaxonomy([CategoryInfo(*row) for row in rows])
+    invalidate_changed_categories(taxonomy)
+    return taxonomy
+
+# The taxonomy this worker loaded last, to tell which categories changed
+_seen_categories = {}
+
+def invalidate_changed_categories(taxonomy):
+    """Drop the fragments tagged with a category renamed or deleted since the last load.
+
+    Every reload goes through here, so changes made by any process (which
+    move the category stamp) reach the fragments on the next stamp check.
+    """
+    changed = [category_id for category_id, info in _seen_categories.items()
+               if taxonomy.by_id.get(category_id) != info]
+    if changed:
+        fragment_cache.invalidate(*(f"category:{category_id}" for category_id in changed))
+    _seen_categories.clear()
+    _seen_categories.update(taxonomy.by_id)
+
+cache_version = table('cache_version', column('name'), column('version'))
+
+def _cache_version(name):
+    """A named counter from `cache_version` (migrations 10 and 12), None if unavailable."""
+    try:
+        return db.session.execute(
+            select(cache_version.c.version).where(cache_version.c.name == name)
+        ).scalar()
+    except OperationalError:
+        # Not migrated yet: reload every check interval instead
+        db.session.rollback()
+        return None
+
+def _category_version():
+    """Counter bumped by triggers on every category write (migration 10)."""
+    return _cache_version('category')
+
+# Check interval comes from CATEGORY_CACHE_CHECK_INTERVAL, applied in create_app()
+category_cache = VersionedValue(_load_categories, _category_version)
+
+def invalidate_categories():
+    """Drop this worker's taxonomy after changing categories; others follow via the version stamp."""
+    category_cache.invalidate()
+
+# Full-text search index over product title/description (SQLite FTS5), kept
+# in sync with `product` by triggers; created by migrations.py
+product_fts = table('product_fts', column('rowid'), column('product_fts'))
+
+def _fts_match_expr(q, column_name=None):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return None
+    expr = " AND ".join(f'"{w}"*' for w in words)
+    if column_name:
+        expr = f"{column_name} : ({expr})"
+    return expr
+
+def _fts_rowids(expr):
+    return select(literal_column('rowid')).select_from(product_fts).where(
+        literal_column('product_fts').op('MATCH')(expr)
+    )
+
+def search_products(query, q, limit):
+    """Return the top `limit` products for `q`, ranked inside the database.
+
+    Ranking mirrors the old in-Python scorer: title match (+100, +50 when the
+    title is exactly the query) > description match (+30) > recency (up to +20
+    for listings newer than 20 days). Falls back to LIKE matching when the FTS
+    index has not been created yet.
+    """
+    if not _fts_match_expr(q):
+        return []
+    try:
+        return product_search_query(query, q, limit).all()
+    except OperationalError:
+        db.session.rollback()
+    return product_search_query(query, q, limit, use_index=False).all()
+
+def product_match(q, use_index=True):
+    """Filter for products matching `q`, from the FTS index or LIKE scans without it."""
+    if use_index:
+        return Product.id.in_(_fts_rowids(_fts_match_expr(q)))
+    return Product.title.ilike(f"%{q}%") | Product.description.ilike(f"%{q}%")
+
+def product_search_query(query, q, limit, use_index=True):
+    """The ranked search statement behind search_products().
+
+    With use_index=False matches come from LIKE scans instead of the FTS index.
+    """
+    ql = q.lower()
+    age_days = func.julianday('now') - func.julianday(Product.created_at)
+    recency = case((age_days < 20, 20 - cast(age_days, db.Integer)), else_=0)
+    exact = case((func.lower(Product.title) == ql, 50), else_=0)
+    if use_index:
+        title_hit = Product.id.in_(_fts_rowids(_fts_match_expr(q, 'title')))
+        desc_hit = Product.id.in_(_fts_rowids(_fts_match_expr(q, 'description')))
+    else:
+        title_hit = Product.title.ilike(f"%{q}%")
+        desc_hit = Product.description.ilike(f"%{q}%")
+    score = (case((title_hit, 100 + exact), else_=0)
+             + case((desc_hit, 30), else_=0) + recency)
+    return (query.filter(product_match(q, use_index))
+            .order_by(score.desc(), Product.created_at.desc())
+            .limit(limit))
+
+def category_counts_query(*criteria):
+    """Products per category id (None = uncategorised) as a single GROUP BY.
+
+    `criteria` narrow the products counted, e.g. product_match() for search
+    facets. Without criteria the count reads only the category index.
+    """
+    return (db.session.query(Product.category_id, func.count(Product.id))
+            .filter(*criteria)
+            .group_by(Product.category_id))
+
+# Catalogue-wide counts only change when products are added; cached briefly
+# per worker (CATEGORY_COUNTS_TTL, applied in create_app()) and cleared by
+# post_product() in the worker that added one.
+category_count_cache = LRUCache(maxsize=1)
+
+def category_counts():
+    """{category id: product count} over the whole catalogue."""
+    counts = category_count_cache.get('all')
+    if counts is None:
+        counts = dict(category_counts_query().all())
+        category_count_cache.set('all', counts)
+    return counts
+
+def search_category_counts(q):
+    """Facet counts for a search: {category id: matching products}, in one query."""
+    if not _fts_match_expr(q):
+        return {}
+    try:
+        return dict(category_counts_query(product_match(q)).all())
+    except OperationalError:
+        db.session.rollback()
+    return dict(category_counts_query(product_match(q, use_index=False)).all())
+
+def encode_cursor(row):
+    """Opaque keyset cursor pointing just after `row` (a product or review) in (created_at, id) order."""
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for malformed cursors."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_raw, id_raw = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_raw), int(id_raw)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+def page_size(raw=None):
+    """Requested page size clamped to PRODUCTS_PER_PAGE_MAX, else the default."""
+    try:
+        size = int(raw) if raw else current_app.config['PRODUCTS_PER_PAGE']
+    except ValueError:
+        size = current_app.config['PRODUCTS_PER_PAGE']
+    return max(1, min(size, current_app.config['PRODUCTS_PER_PAGE_MAX']))
+
+def paginate_products(query, cursor=None, per_page=None):
+    """Keyset-paginate a Product query newest first.
+
+    Seeks past the cursor position with a (created_at, id) row comparison, so
+    every page costs the same regardless of how deep it is. Returns the page
+    items and the cursor for the next page (None on the last page).
+    """
+    per_page = per_page or page_size()
+    position = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether another page follows
+    rows = keyset_page_query(query, position, per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+def keyset_page_query(query, position, limit):
+    """Newest-first page of a Product query starting after `position`.
+
+    `position` is a decoded (created_at, id) cursor or None for the first page.
+    """
+    query = query.order_by(Product.created_at.desc(), Product.id.desc())
+    if position:
+        query = query.filter(tuple_(Product.created_at, Product.id) < position)
+    return query.limit(limit)
+
+def product_list_query():
+    """Products with the category and seller loaded for rendering cards."""
+    return Product.query.options(joinedload(Product.category), joinedload(Product.user))
+
+def resolve_category(category_filter):
+    """Look up a category by numeric id or slug."""
+    if not category_filter:
+        return None
+    if category_filter.isdigit():
+        return Category.get_by_id(int(category_filter))
+    return Category.get_by_slug(category_filter)
+
+# Shared page fragments, rendered once and cached until their tags are
+# invalidated: "product:<id>" (the product row), "store:<id>" (store profile),
+# "store-activity:<id>" (rating, reviews and catalogue figures) and
+# "category:<id>" (the category name/slug shown on the product).
+def product_tags(product, *tags):
+    if product.category_id is not None:
+        tags += (f"category:{product.category_id}",)
+    return (f"product:{product.id}",) + tags
+
+def product_card(product):
+    return fragment_cache.fragment(
+        f"product-card:{product.id}", product_tags(product, f"store:{product.user_id}"),
+        lambda: render_template('_product_card.html', product=product))
+
+def store_product_card(product, store_owner):
+    return fragment_cache.fragment(
+        f"store-product-card:{product.id}", (f"product:{product.id}", f"store:{store_owner.id}"),
+        lambda: render_template('_store_product_card.html', product=product, store_owner=store_owner))
+
+def store_hero_profile(store_owner):
+    return fragment_cache.fragment(
+        f"store-hero-profile:{store_owner.id}",
+        (f"store:{store_owner.id}", f"store-activity:{store_owner.id}"),
+        lambda: render_template('_store_hero_profile.html', store_owner=store_owner))
+
+def store_hero_stats(store_owner, product_stats):
+    return fragment_cache.fragment(
+        f"store-hero-stats:{store_owner.id}", (f"store-activity:{store_owner.id}",),
+        lambda: render_template('_store_hero_stats.html', store_owner=store_owner,
+                                product_stats=product_stats))
+
+def product_detail_panel(product):
+    return fragment_cache.fragment(
+        f"product-detail:{product.id}",
+        product_tags(product, f"store:{product.user_id}", f"store-activity:{product.user_id}"),
+        lambda: render_template('_product_detail.html', product=product))
+
+# HTTP caching. Pages get weak ETags computed from the rows they show before
+# rendering, so a matching revalidation skips the template; JSON responses
+# are tagged from their body. Static URLs carry a content hash (?v=) and
+# uploads are content-addressed, so both are served as immutable.
+STATIC_MAX_AGE = 365 * 24 * 3600
+_static_versions = {}
+
+def static_version(filename):
+    """Short content hash of a static file, cached per worker (rechecked by mtime in debug)."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None:
+        return None
+    try:
+        mtime = os.path.getmtime(path) if current_app.debug else None
+        cached = _static_versions.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:10]
+    except OSError:
+        return None
+    _static_versions[filename] = (mtime, version)
+    return version
+
+def fingerprint_static_url(endpoint, values):
+    """url_for('static', ...) appends ?v=<content hash>; uploads are already fingerprinted."""
+    if endpoint != 'static' or 'v' in values:
+        return
+    filename = values.get('filename', '')
+    if filename.startswith('uploads/'):
+        return
+    version = static_version(filename)
+    if version:
+        values['v'] = version
+
+def static_cache_headers(response):
+    if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+        return response
+    filename = (request.view_args or {}).get('filename', '')
+    if filename.startswith('uploads/'):
+        immutable = is_content_path(filename[len('uploads/'):])
+    else:
+        version = request.args.get('v')
+        # A stale ?v= (old HTML) gets the new bytes, but must not pin them
+        immutable = bool(version) and version == static_version(filename)
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+def row_version(obj, exclude=()):
+    """Column values of a loaded row, as a version for page ETags."""
+    return tuple(getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs
+                 if attr.key not in exclude)
+
+def page_etag(*versions):
+    """Weak ETag for a page rendering `versions` for the current viewer.
+
+    Includes the shared fragment stamp: cached fragments can show rows the
+    page's own versions don't cover (a card's category), and a page must
+    not be revalidated after it was rendered from stale fragments.
+
+    None while flash messages are pending: that page is shown once and
+    must not be reused by a later 304.
+    """
+    if '_flashes' in session:
+        return None
+    viewer = (current_user.get_id(), session.get('user_rev'))
+    raw = repr((current_app.config['TEMPLATES_STAMP'], fragment_cache.stamp(), viewer, versions))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
 
-@app.route("/")
+def not_modified(etag):
+    """A 304 response when the client already has `etag`, else None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(current_app.response_class(status=304), etag)
+
+def with_etag(rv, etag):
+    """Attach a page ETag; per-viewer pages are only reused after revalidation."""
+    response = current_app.make_response(rv)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+def conditional_json(payload, max_age=None):
+    """JSON response with an ETag of its body, answered with 304 when it matches.
+
+    With `max_age` the response is shared and fresh for that long; without,
+    it's private and revalidated on every use.
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@route("/")
+@fragment_cache.cached_page(unless=lambda: current_user.is_authenticated or '_flashes' in session)
 def index():
     # If user is already logged in, redirect to products page
     if current_user.is_authenticated:
         return redirect(url_for("products"))
     return render_template("index.html")
 
-@app.route("/products")
+@route("/products")
 @login_required
 def products():
     q = request.args.get("q", "").strip()
     category_filter = request.args.get("category")  # category slug or id
-    query = Product.query
-    # Join category for eager access if filtering or listing all
-    if category_filter:
-        # Accept either numeric id or slug
-        from sqlalchemy.orm import joinedload
-        query = query.options(joinedload(Product.category))
-        if category_filter.isdigit():
-            query = query.filter(Product.category_id == int(category_filter))
-        else:
-            # look up category by slug
-            cat = Category.query.filter_by(slug=category_filter).first()
-            if cat:
-                query = query.filter(Product.category_id == cat.id)
-    products = []
+    query = product_list_query()
+    current_category = resolve_category(category_filter)
+    if current_category:
+        query = query.filter(Product.category_id == current_category.id)
+    next_cursor = None
     if q:
-        # Get all products matching either field
-        raw_products = query.filter(
-            (Product.title.ilike(f"%{q}%")) |
-            (Product.description.ilike(f"%{q}%"))
-        ).all()
-        # Rank results: title match > description match > recency
-        def score(product):
-            title = (product.title or "").lower()
-            desc = (product.description or "").lower()
-            ql = q.lower()
-            score = 0
-            if ql in title:
-                score += 100
-                # Bonus for exact match
-                if title == ql:
-                    score += 50
-            if ql in desc:
-                score += 30
-            # Recency bonus (newer = higher)
-            age_days = (datetime.utcnow() - product.created_at).days
-            score += max(0, 20 - age_days)
-            return score
-        products = sorted(raw_products, key=score, reverse=True)
+        products = search_products(query, q, current_app.config['SEARCH_RESULT_LIMIT'])
     else:
-        products = query.order_by(Product.created_at.desc()).all()
-    categories = Category.query.order_by(Category.name.asc()).all()
-    current_category = None
-    if category_filter:
-        if category_filter.isdigit():
-            current_category = Category.query.get(int(category_filter))
-        else:
-            current_category = Category.query.filter_by(slug=category_filter).first()
-    return render_template("products.html", products=products, categories=categories, current_category=current_category)
+        products, next_cursor = paginate_products(
+            query, request.args.get("cursor"), page_size(request.args.get("limit"))
+        )
+    categories = Category.all()
+    # Facet counts ignore the category filter so every chip shows its own total
+    facet_counts = search_category_counts(q) if q else category_counts()
+    page_args = {'category': current_category.slug} if current_category else {}
+    return render_template("products.html", products=products, categories=categories,
+                           current_category=current_category, next_cursor=next_cursor,
+                           page_args=page_args, facet_counts=facet_counts,
+                           facet_total=sum(facet_counts.values()))
 
-@app.route('/categories')
+@route("/api/products")
+@login_required
+def api_products():
+    """Next page of product cards for "load more" on listing and store pages.
+
+    Filters: `category` (slug or id) or `store` (seller id). Returns the
+    rendered card HTML plus the cursor for the following page.
+    """
+    query = product_list_query()
+    store_owner = None
+    store_id = request.args.get("store", type=int)
+    if store_id is not None:
+        store_owner = User.query.get_or_404(store_id)
+        query = query.filter(Product.user_id == store_id)
+    category = resolve_category(request.args.get("category"))
+    if category:
+        query = query.filter(Product.category_id == category.id)
+    cursor = request.args.get("cursor")
+    if cursor and decode_cursor(cursor) is None:
+        return jsonify({"error": "invalid cursor"}), 400
+    items, next_cursor = paginate_products(query, cursor, page_size(request.args.get("limit")))
+    if store_owner:
+        html = "".join(store_product_card(p, store_owner) for p in items)
+    else:
+        html = "".join(product_card(p) for p in items)
+    return conditional_json({
+        "html": html,
+        "count": len(items),
+        "ids": [p.id for p in items],
+        "next_cursor": next_cursor,
+    })
+
+@route('/categories')
 @login_required
 def categories_page():
     cats = Category.all()
-    # Count products per category (can use relationship length or query)
+    counts = category_counts()
     cat_infos = []
     for c in cats:
         cat_infos.append({
             'id': c.id,
             'name': c.name,
             'slug': c.slug,
-            'product_count': len(getattr(c, 'products', []) or []),
+            'product_count': counts.get(c.id, 0),
         })
     return render_template('categories.html', categories=cat_infos)
 
-@app.route('/category/<slug>')
+@route('/category/<slug>')
 @login_required
 def category_detail(slug):
     cat = Category.get_by_slug(slug)
     if not cat:
         flash('Category not found', 'error')
         return redirect(url_for('categories_page'))
-    # Show products for this category
-    prods = Product.query.filter_by(category_id=cat.id).order_by(Product.created_at.desc()).all()
+    # Show products for this category, one page at a time
+    query = product_list_query().filter_by(category_id=cat.id)
+    prods, next_cursor = paginate_products(query, request.args.get("cursor"), page_size(request.args.get("limit")))
     cats = Category.all()
-    return render_template('products.html', products=prods, categories=cats, current_category=cat)
+    facet_counts = category_counts()
+    return render_template('products.html', products=prods, categories=cats, current_category=cat,
+                           next_cursor=next_cursor, page_args={'category': cat.slug},
+                           facet_counts=facet_counts, facet_total=sum(facet_counts.values()))
 
-@app.route("/about")
+@route("/about")
 def about():
     return render_template("about.html")
 
-@app.route("/contact")
+@route("/contact")
 def contact():
     return render_template("contact.html")
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     # If user is already logged in, redirect to products page
     if current_user.is_authenticated:
@@ -285,7 +902,7 @@ def login():
     
     return render_template("login.html")
 
-@app.route("/signup", methods=["GET", "POST"])
+@route("/signup", methods=["GET", "POST"])
 def signup():
     # If user is already logged in, redirect to products page
     if current_user.is_authenticated:
@@ -322,7 +939,7 @@ def signup():
     
     return render_template("signup.html")
 
-@app.route("/seller-signup", methods=["GET", "POST"])
+@route("/seller-signup", methods=["GET", "POST"])
 def seller_signup():
     # If user is already logged in, redirect to products page
     if current_user.is_authenticated:
@@ -365,15 +982,9 @@ def seller_signup():
         else:
             password_hash = generate_password_hash(password)
             store_image = None
-            if image_file and image_file.filename != '' and allowed_file(image_file.filename):
-                store_img_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'store_images')
-                if not os.path.exists(store_img_folder):
-                    os.makedirs(store_img_folder)
-                filename = secure_filename(image_file.filename)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_")
-                filename = timestamp + filename
-                image_file.save(os.path.join(store_img_folder, filename))
-                store_image = 'store_images/' + filename
+            uploaded_image = image_file and image_file.filename != '' and allowed_file(image_file.filename)
+            if uploaded_image:
+                store_image = store_upload(image_file)
             else:
                 store_image = "default_store_img.png"  # stored in static/images, referenced directly when no uploaded file
             new_user = User(
@@ -391,12 +1002,47 @@ def seller_signup():
             )
             db.session.add(new_user)
             db.session.commit()
+            invalidate_store_clusters()
+            if uploaded_image:
+                process_store_image(new_user)
             flash("Seller account created successfully! Please log in.", "success")
             return redirect(url_for("login"))
     
     return render_template("seller-signup.html")
 
-@app.route("/post-product", methods=["GET", "POST"])
+def parse_product_fields(fields):
+    """Validate submitted title/price/quantity/description.
+
+    `fields` is a form or a JSON object. Returns (column values, None), or
+    (None, error message) for the first problem found.
+    """
+    title = str(fields.get("title") or "").strip()
+    price = fields.get("price")
+    quantity = fields.get("quantity")
+    if not title or price in (None, ""):
+        return None, "Title and price are required fields"
+    try:
+        price_float = float(price)
+        quantity_int = int(quantity) if quantity not in (None, "") else 1
+    except (TypeError, ValueError, OverflowError):
+        return None, "Please enter valid numbers for price and quantity"
+    if not math.isfinite(price_float):
+        return None, "Please enter valid numbers for price and quantity"
+    # JSON numbers arrive as float/bool; int() would silently truncate them
+    if isinstance(quantity, bool) or (isinstance(quantity, float) and quantity != quantity_int):
+        return None, "Quantity must be a whole number"
+    if price_float <= 0:
+        return None, "Price must be greater than 0"
+    if quantity_int <= 0:
+        return None, "Quantity must be greater than 0"
+    return {
+        "title": title,
+        "price": price_float,
+        "quantity": quantity_int,
+        "description": str(fields.get("description") or "").strip(),
+    }, None
+
+@route("/post-product", methods=["GET", "POST"])
 @login_required
 def post_product():
     # Check if user is a seller
@@ -405,10 +1051,6 @@ def post_product():
         return redirect(url_for("index"))
     
     if request.method == "POST":
-        title = request.form.get("title", "").strip()
-        price = request.form.get("price", "")
-        quantity = request.form.get("quantity", "1")
-        description = request.form.get("description", "").strip()
         category_raw = request.form.get("category")  # may be id
         
         # Handle file upload
@@ -416,68 +1058,131 @@ def post_product():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename != '' and allowed_file(file.filename):
-                prod_img_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'product_images')
-                if not os.path.exists(prod_img_folder):
-                    os.makedirs(prod_img_folder)
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid filename conflicts
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_")
-                filename = timestamp + filename
-                file.save(os.path.join(prod_img_folder, filename))
-                image_filename = 'product_images/' + filename
+                # Stored by content hash: re-uploads of the same photo share one file
+                image_filename = store_upload(file)
         
-        # Validation
-        if not title or not price:
-            flash("Title and price are required fields", "error")
+        fields, error = parse_product_fields(request.form)
+        if error:
+            flash(error, "error")
         else:
-            try:
-                price_float = float(price)
-                quantity_int = int(quantity) if quantity else 1
-                
-                if price_float <= 0:
-                    flash("Price must be greater than 0", "error")
-                elif quantity_int <= 0:
-                    flash("Quantity must be greater than 0", "error")
-                else:
-                    # Create new product
-                    # Resolve category (optional)
-                    category_id = None
-                    if category_raw:
-                        try:
-                            category_id = int(category_raw)
-                            if not Category.query.get(category_id):
-                                category_id = None
-                        except ValueError:
-                            # try slug
-                            cat = Category.query.filter_by(slug=category_raw).first()
-                            if cat:
-                                category_id = cat.id
-                    new_product = Product(
-                        title=title,
-                        price=price_float,
-                        quantity=quantity_int,
-                        description=description,
-                        image_filename=image_filename,
-                        user_id=current_user.id,
-                        category_id=category_id
-                    )
-                    db.session.add(new_product)
-                    db.session.commit()
-                    flash("Product posted successfully!", "success")
-                    return redirect(url_for("products"))
-            except ValueError:
-                flash("Please enter valid numbers for price and quantity", "error")
+            # Create new product
+            # Resolve category (optional)
+            category = resolve_category(category_raw)
+            category_id = category.id if category else None
+            new_product = Product(
+                image_filename=image_filename,
+                user_id=current_user.id,
+                category_id=category_id,
+                **fields
+            )
+            db.session.add(new_product)
+            db.session.commit()
+            category_count_cache.clear()
+            fragment_cache.invalidate(f"store-activity:{current_user.id}")
+            if image_filename:
+                process_product_image(new_product.id, image_filename)
+            flash("Product posted successfully!", "success")
+            return redirect(url_for("products"))
     
-    categories = Category.query.order_by(Category.name.asc()).all()
+    categories = Category.all()
     return render_template("post-product.html", categories=categories)
 
-@app.route("/product/<int:product_id>")
+@route("/api/products/batch", methods=["POST"])
+@login_required
+def post_products_batch():
+    """Create many products in one request, all or none.
+
+    Takes a JSON body, either a list of products or {"products": [...]}, or
+    a multipart form whose `products` field holds that JSON. Each product
+    has the post-product form's fields (title, price, quantity, description,
+    and category as an id or slug). In a multipart form a product's "image"
+    names the file field holding its photo; no two products may share one.
+
+    Every item is validated before anything is stored. Any invalid item
+    rejects the whole batch with a 400, and "results" gives each item's
+    error. Otherwise all products are inserted in one transaction and the
+    201 response lists their ids in request order.
+    """
+    if not current_user.is_seller():
+        return jsonify({"error": "only sellers can post products"}), 403
+    config = current_app.config
+    # Several photos per request: a larger body limit than single uploads
+    request.max_content_length = config['PRODUCT_BATCH_MAX_CONTENT_LENGTH']
+    request.max_form_memory_size = config['PRODUCT_BATCH_MAX_CONTENT_LENGTH']
+    if request.is_json:
+        items = request.get_json(silent=True)
+    else:
+        try:
+            items = json.loads(request.form.get("products", ""))
+        except ValueError:
+            items = None
+    if isinstance(items, dict):
+        items = items.get("products")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "expected a non-empty list of products"}), 400
+    if len(items) > config['PRODUCT_BATCH_MAX_ITEMS']:
+        return jsonify({"error": f"at most {config['PRODUCT_BATCH_MAX_ITEMS']} products per request"}), 400
+
+    # One taxonomy snapshot for the whole batch
+    taxonomy = category_cache.get()
+    rows, results, image_fields = [], [], set()
+    for item in items:
+        if not isinstance(item, dict):
+            rows.append(None)
+            results.append({"ok": False, "error": "Each product must be an object"})
+            continue
+        fields, error = parse_product_fields(item)
+        category_raw = str(item.get("category") or "").strip()
+        category = (taxonomy.by_id.get(int(category_raw)) if category_raw.isdigit()
+                    else taxonomy.by_slug.get(category_raw))
+        image_field = item.get("image")
+        upload = request.files.get(image_field) if isinstance(image_field, str) else None
+        if not error and category_raw and category is None:
+            error = f"Unknown category {category_raw!r}"
+        if not error and image_field and (upload is None or not upload.filename):
+            error = f"No file uploaded in field {image_field!r}"
+        if not error and upload is not None and image_field in image_fields:
+            error = f"Field {image_field!r} is already used by another product"
+        if upload is not None:
+            image_fields.add(image_field)
+        if not error and upload is not None and not allowed_file(upload.filename):
+            error = "Images must be PNG, JPEG or GIF"
+        rows.append(None if error else (fields, category.id if category else None, upload))
+        results.append({"ok": False, "error": error} if error else {"ok": True})
+    if not all(result["ok"] for result in results):
+        return jsonify({"error": "invalid products; nothing was saved", "results": results}), 400
+
+    values = [
+        dict(fields, category_id=category_id, user_id=current_user.id,
+             image_filename=store_upload(upload) if upload is not None else None)
+        for fields, category_id, upload in rows
+    ]
+    # One executemany of a cached INSERT for the whole batch. The transaction
+    # holds the write lock from the first row on, and SQLite gives each row
+    # the next rowid (product.id has no AUTOINCREMENT), so the ids are the
+    # range ending at the last inserted rowid, in `values` order
+    db.session.execute(insert(Product.__table__), values)
+    last_id = db.session.scalar(select(func.last_insert_rowid()))
+    ids = range(last_id - len(values) + 1, last_id + 1)
+    db.session.commit()
+    category_count_cache.clear()
+    fragment_cache.invalidate(f"store-activity:{current_user.id}")
+    for product_id, row, result in zip(ids, values, results):
+        if row["image_filename"]:
+            process_product_image(product_id, row["image_filename"])
+        result.update(id=product_id, url=url_for("product_detail", product_id=product_id))
+    return jsonify({"created": len(ids), "results": results}), 201
+
+@route("/product/<int:product_id>")
 @login_required
 def product_detail(product_id):
-    product = Product.query.get_or_404(product_id)
-    return render_template("product-detail.html", product=product)
+    product = Product.query.options(joinedload(Product.user)).get_or_404(product_id)
+    etag = page_etag(row_version(product), row_version(product.user, exclude=('password_hash',)),
+                     Category.get_by_id(product.category_id))
+    return not_modified(etag) or with_etag(
+        render_template("product-detail.html", product=product), etag)
 
-@app.route("/my-store")
+@route("/my-store")
 @login_required
 def my_store():
     """Convenience route for templates linking to the current user's store.
@@ -490,13 +1195,13 @@ def my_store():
     return redirect(url_for("store_page", store_owner_id=current_user.id))
 
 # Edit store details (seller only)
-@app.route("/edit-store", methods=["GET", "POST"])
+@route("/edit-store", methods=["GET", "POST"])
 @login_required
 def edit_store():
     if not current_user.is_seller():
         flash("Only sellers can edit store details.", "error")
         return redirect(url_for("products"))
-    user = current_user
+    user = User.get(current_user.id)
     if request.method == "POST":
         store_name = request.form.get("store_name", "").strip()
         store_location = request.form.get("store_location", "").strip()
@@ -505,6 +1210,7 @@ def edit_store():
         lng_raw = request.form.get("longitude")
         addr_full = request.form.get("address", "").strip()
         image_file = request.files.get("store_image")
+        new_store_image = False
         try:
             store_lat = float(lat_raw) if lat_raw not in (None, "") else None
         except ValueError:
@@ -515,14 +1221,12 @@ def edit_store():
             store_lng = None
         # Update image if provided
         if image_file and image_file.filename != '' and allowed_file(image_file.filename):
-            store_img_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'store_images')
-            if not os.path.exists(store_img_folder):
-                os.makedirs(store_img_folder)
-            filename = secure_filename(image_file.filename)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_")
-            filename = timestamp + filename
-            image_file.save(os.path.join(store_img_folder, filename))
-            user.store_image = 'store_images/' + filename
+            # The previous image file is left for `db_manager.py gc_uploads` once unreferenced
+            new_image = store_upload(image_file)
+            if new_image != user.store_image:
+                user.store_image = new_image
+                user.store_image_thumb = None
+                new_store_image = True
         # Update fields
         user.store_name = store_name or user.store_name
         user.store_location = store_location or user.store_location
@@ -531,11 +1235,16 @@ def edit_store():
         user.store_longitude = store_lng if store_lng is not None else user.store_longitude
         user.store_address = addr_full or user.store_address
         db.session.commit()
+        invalidate_user()
+        invalidate_store_clusters()
+        fragment_cache.invalidate(f"store:{user.id}")
+        if new_store_image:
+            process_store_image(user)
         flash("Store details updated successfully!", "success")
         return redirect(url_for("my_store"))
     return render_template("edit-store.html", user=user)
 
-@app.route("/store/<int:store_owner_id>")
+@route("/store/<int:store_owner_id>")
 @login_required
 def store_page(store_owner_id):
     store_owner = User.query.get_or_404(store_owner_id)
@@ -545,48 +1254,466 @@ def store_page(store_owner_id):
         flash("This user is not a store owner", "error")
         return redirect(url_for("products"))
     
-    # Get store products
-    store_products = Product.query.filter_by(user_id=store_owner_id).order_by(Product.created_at.desc()).all()
+    # Get one page of store products; catalogue-wide figures come from one aggregate query
+    store_products, next_cursor = paginate_products(
+        Product.query.filter_by(user_id=store_owner_id),
+        request.args.get("cursor"),
+        page_size(request.args.get("limit")),
+    )
+    count, avg_price, first_listed, last_listed = store_product_stats_query(store_owner_id).one()
+    product_stats = {
+        'count': count,
+        'avg_price': avg_price,
+        'first_listed': first_listed,
+        'last_listed': last_listed,
+    }
     
-    # Get store reviews
-    reviews = StoreReview.query.filter_by(store_owner_id=store_owner_id).order_by(StoreReview.created_at.desc()).all()
+    # Reviews are only loaded when the client's copy is out of date; saving
+    # a review (new or edited) moves the newest created_at
+    latest_review = (StoreReview.for_store(store_owner_id)
+                     .with_entities(StoreReview.created_at).limit(1).scalar())
+    etag = page_etag(row_version(store_owner, exclude=('password_hash',)),
+                     [row_version(p) for p in store_products], next_cursor,
+                     tuple(product_stats.values()), latest_review)
+    response = not_modified(etag)
+    if response:
+        return response
+
+    reviews, next_reviews = paginate_reviews(store_owner_id, request.args.get("reviews"))
     
     # Check if current user has already reviewed this store
     existing_review = None
     if current_user.id != store_owner_id:
-        existing_review = StoreReview.query.filter_by(
-            store_owner_id=store_owner_id, 
-            reviewer_id=current_user.id
-        ).first()
+        existing_review = StoreReview.by_reviewer(store_owner_id, current_user.id).first()
     
-    return render_template("store-page.html", 
+    return with_etag(render_template("store-page.html", 
                          store_owner=store_owner, 
                          products=store_products, 
+                         next_cursor=next_cursor,
+                         product_stats=product_stats,
                          reviews=reviews, 
-                         existing_review=existing_review)
+                         next_reviews=next_reviews,
+                         existing_review=existing_review), etag)
+
+def store_reviews_query(store_owner_id, position=None):
+    """A store's reviews newest first, with their reviewers in the same statement.
+
+    `position` is a decoded (created_at, id) cursor; only older reviews follow.
+    """
+    query = (StoreReview.for_store(store_owner_id)
+             .order_by(StoreReview.id.desc())
+             .options(joinedload(StoreReview.reviewer)))
+    if position:
+        query = query.filter(tuple_(StoreReview.created_at, StoreReview.id) < position)
+    return query
+
+def paginate_reviews(store_owner_id, cursor=None, per_page=None):
+    """Keyset-paginate a store's reviews like paginate_products()."""
+    per_page = per_page or current_app.config['STORE_PAGE_REVIEWS']
+    position = decode_cursor(cursor) if cursor else None
+    rows = store_reviews_query(store_owner_id, position).limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+def store_product_stats_query(store_owner_id):
+    """Product count, average price and first/last listing date of one store."""
+    return db.session.query(
+        func.count(Product.id), func.avg(Product.price),
+        func.min(Product.created_at), func.max(Product.created_at),
+    ).filter(Product.user_id == store_owner_id)
+
+def store_summary_query():
+    """Sellers with their rating, review count and product count in one statement.
+
+    Ratings come from the denormalized columns on User; products are counted
+    by a correlated subquery that seeks the (user_id, created_at, id) index
+    for each returned seller, so the cost is a single round trip that grows
+    with the stores selected, not the whole catalogue. Callers can add
+    filters/ordering before executing.
+    """
+    product_count = (
+        select(func.count(Product.id))
+        .where(Product.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    return (
+        db.session.query(
+            User.id, User.username, User.store_name, User.store_city,
+            User.store_location, User.store_address,
+            User.store_latitude, User.store_longitude,
+            User.store_rating_sum,
+            User.store_review_count.label('review_count'),
+            product_count.label('product_count'),
+        )
+        .filter(User.user_type == 'seller')
+    )
+
+def store_summary_dict(row):
+    """Shape a store_summary_query() row for templates and JSON."""
+    return {
+        'id': row.id,
+        'name': row.store_name or row.username,
+        'city': row.store_city,
+        'location': row.store_location,
+        'address': row.store_address,
+        'lat': row.store_latitude,
+        'lng': row.store_longitude,
+        'rating': round(row.store_rating_sum / row.review_count, 1) if row.review_count else None,
+        'reviews': row.review_count,
+        'product_count': row.product_count,
+    }
+
+# Spatial index over seller coordinates (SQLite R-tree), one zero-area box per
+# store kept in sync with `user` by triggers; created by migrations.py
+store_geo = table('store_geo', column('id'), column('min_lat'), column('max_lat'),
+                  column('min_lng'), column('max_lng'))
+
+def haversine_km(a_lat, a_lng, b_lat, b_lng):
+    """Great-circle distance in kilometres."""
+    d_lat = math.radians(b_lat - a_lat)
+    d_lng = math.radians(b_lng - a_lng)
+    h = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(a_lat)) * math.cos(math.radians(b_lat)) * math.sin(d_lng / 2) ** 2)
+    return 6371 * 2 * math.atan2(math.sqrt(h), math.sqrt(1 - h))
+
+def radius_bbox(lat, lng, radius_km):
+    """(south, west, north, east) box enclosing a circle of radius_km around a point."""
+    d_lat = radius_km / 111.32
+    cos_lat = math.cos(math.radians(lat))
+    d_lng = 180 if cos_lat < 1e-6 else min(180, radius_km / (111.32 * cos_lat))
+    south, north = max(-90, lat - d_lat), min(90, lat + d_lat)
+    if d_lng >= 180:
+        return south, -180, north, 180
+    west, east = lng - d_lng, lng + d_lng
+    # Wrap into [-180, 180]; west > east then means the box crosses the antimeridian
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    return south, west, north, east
+
+def parse_bbox(raw):
+    """Parse a "south,west,north,east" string; None when missing or malformed."""
+    try:
+        south, west, north, east = (float(v) for v in raw.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    return south, west, north, east
+
+def _bbox_filter(lat_col, lng_col, bbox):
+    south, west, north, east = bbox
+    lat_ok = lat_col.between(south, north)
+    if west <= east:
+        return lat_ok & lng_col.between(west, east)
+    return lat_ok & ((lng_col >= west) | (lng_col <= east))
+
+def query_stores_in_bbox(bbox, center=None, limit=None, name=None):
+    """Store summary rows inside bbox, nearest to `center` first when given.
+
+    Candidates come from the store_geo R-tree; ordering uses an
+    equirectangular distance approximation computed in SQL so only `limit`
+    rows leave the database. Falls back to a plain column range filter if
+    the R-tree has not been created yet.
+    """
+    try:
+        return stores_in_bbox_query(bbox, center, limit, name).all()
+    except OperationalError:
+        db.session.rollback()
+    return stores_in_bbox_query(bbox, center, limit, name, use_index=False).all()
+
+def _distance_order(center):
+    """Equirectangular squared distance to `center`, for ORDER BY."""
+    k = math.cos(math.radians(center[0])) ** 2
+    d_lat = User.store_latitude - center[0]
+    d_lng = User.store_longitude - center[1]
+    return d_lat * d_lat + k * d_lng * d_lng
+
+def query_stores_in_radius(center, radius_km, limit):
+    """Up to `limit` store rows within radius_km of `center`, nearest first.
+
+    Candidates stream from the box around the circle in approximate distance
+    order and the box corners are dropped by their exact distance, so `limit`
+    counts only stores inside the circle.
+    """
+    bbox = radius_bbox(*center, radius_km)
+
+    def nearest(use_index):
+        rows = []
+        result = db.session.execute(stores_in_bbox_query(bbox, center, use_index=use_index).statement,
+                                    execution_options={'yield_per': limit})
+        try:
+            for row in result:
+                if haversine_km(*center, row.store_latitude, row.store_longitude) <= radius_km:
+                    rows.append(row)
+                    if len(rows) == limit:
+                        break
+        finally:
+            result.close()
+        return rows
 
-@app.route("/stores")
+    try:
+        return nearest(use_index=True)
+    except OperationalError:
+        db.session.rollback()
+    return nearest(use_index=False)
+
+def stores_in_bbox_query(bbox, center=None, limit=None, name=None, use_index=True):
+    """The statement behind query_stores_in_bbox(); use_index=False skips the R-tree."""
+    query = store_summary_query()
+    if name:
+        query = query.filter(User.store_name.ilike(f"%{name}%"))
+    order = _distance_order(center) if center else User.id
+    if use_index:
+        geo_ids = select(store_geo.c.id).where(
+            _bbox_filter(store_geo.c.min_lat, store_geo.c.min_lng, bbox)
+        )
+        query = query.filter(User.id.in_(geo_ids))
+    else:
+        query = query.filter(_bbox_filter(User.store_latitude, User.store_longitude, bbox))
+    return query.order_by(order).limit(limit)
+
+def stores_by_name_query(name, center=None, limit=None):
+    """Sellers whose store name matches, wherever they are.
+
+    Unlike stores_in_bbox_query() this includes stores that have no
+    coordinates yet; with a `center` they sort after the mapped ones.
+    """
+    query = store_summary_query().filter(User.store_name.ilike(f"%{name}%"))
+    if center:
+        query = query.order_by(User.store_latitude.is_(None), _distance_order(center))
+    return query.order_by(User.id).limit(limit)
+
+@route("/api/stores/nearby")
 @login_required
-def store_finder():
-    """Buyer section: show all stores on a map with cards below."""
-    sellers = User.query.filter_by(user_type='seller').all()
+def stores_nearby():
+    """Nearest stores to a point and/or stores inside a map viewport.
+
+    Query params: `lat`/`lng` (+ optional `radius` in km) return stores within
+    that radius sorted by distance; `bbox=south,west,north,east` returns the
+    stores inside the viewport (sorted by distance to lat/lng when given).
+    `q` searches store names everywhere instead, ignoring bbox/radius, and
+    also returns stores without coordinates (`lat`/`lng` null, no distance).
+    `limit` caps the result size.
+    """
+    lat = request.args.get("lat", type=float)
+    lng = request.args.get("lng", type=float)
+    center = (lat, lng) if lat is not None and lng is not None else None
+    if center and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": "lat/lng out of range"}), 400
+    limit = request.args.get("limit", current_app.config['STORES_NEARBY_LIMIT'], type=int)
+    limit = max(1, min(limit, current_app.config['STORES_NEARBY_MAX_LIMIT']))
+    name = request.args.get("q", "").strip()
+    if name:
+        # Not limited to the viewport, so stores without a pin can be found
+        rows = stores_by_name_query(name, center=center, limit=limit + 1).all()
+    elif request.args.get("bbox"):
+        bbox = parse_bbox(request.args.get("bbox"))
+        if bbox is None:
+            return jsonify({"error": "bbox must be south,west,north,east"}), 400
+        rows = query_stores_in_bbox(bbox, center=center, limit=limit + 1)
+    elif center:
+        radius = request.args.get("radius", current_app.config['STORES_NEARBY_RADIUS_KM'], type=float)
+        radius = max(0.1, min(radius, current_app.config['STORES_NEARBY_MAX_RADIUS_KM']))
+        # Filtered by distance before the extra row is counted, so `truncated` is exact
+        rows = query_stores_in_radius(center, radius, limit + 1)
+    else:
+        return jsonify({"error": "lat and lng, or bbox, are required"}), 400
+    truncated = len(rows) > limit
     stores = []
-    for u in sellers:
-        stores.append({
-            'id': u.id,
-            'name': u.store_name or u.username,
-            'city': u.store_city,
-            'location': u.store_location,
-            'address': u.store_address,
-            'lat': u.store_latitude,
-            'lng': u.store_longitude,
-            'rating': u.get_store_rating(),
-            'reviews': u.get_review_count(),
-            'product_count': len(getattr(u, 'products', []) or []),
+    for row in rows[:limit]:
+        store = store_summary_dict(row)
+        if center and row.store_latitude is not None and row.store_longitude is not None:
+            store['distance_km'] = round(haversine_km(lat, lng, row.store_latitude, row.store_longitude), 2)
+        stores.append(store)
+    if center:
+        # Unmapped stores keep their place at the end
+        stores.sort(key=lambda s: s.get('distance_km', math.inf))
+    return conditional_json({"stores": stores, "count": len(stores), "truncated": truncated})
+
+# Per-tile cluster cache: (zoom, x, y) -> list of clusters. Cleared whenever a
+# store's location changes; the TTL bounds staleness across workers.
+# Lifetime comes from STORE_CLUSTER_CACHE_TTL, applied in create_app()
+store_cluster_cache = LRUCache(maxsize=4096)
+
+def invalidate_store_clusters():
+    store_cluster_cache.clear()
+
+def tile_range(bbox, zoom):
+    """Slippy-map (Web Mercator) tile x/y ranges covering bbox at zoom."""
+    south, west, north, east = bbox
+    n = 2 ** zoom
+
+    def tile_x(lng):
+        return min(n - 1, max(0, int((lng + 180) / 360 * n)))
+
+    def tile_y(lat):
+        lat = max(-85.0511, min(85.0511, lat))
+        rad = math.radians(lat)
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(rad)) / math.pi) / 2 * n)))
+
+    if west <= east:
+        xs = list(range(tile_x(west), tile_x(east) + 1))
+    else:
+        xs = list(range(tile_x(west), n)) + list(range(0, tile_x(east) + 1))
+    ys = list(range(tile_y(north), tile_y(south) + 1))
+    return xs, ys
+
+def tile_bbox(zoom, x, y):
+    """(south, west, north, east) of a slippy-map tile."""
+    n = 2 ** zoom
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    south, north = lat(y + 1), lat(y)
+    # Widen the outer tiles so stores beyond the Mercator limit still land in them
+    if y == 0:
+        north = 90
+    if y == n - 1:
+        south = -90
+    return south, x / n * 360 - 180, north, (x + 1) / n * 360 - 180
+
+def tile_cluster_queries(bbox, use_index=True):
+    """The statements behind compute_tile_clusters(): per-cell counts and centroids,
+    and the stores of each cell ranked best first.
+
+    use_index=False skips the R-tree.
+    """
+    south, west, north, east = bbox
+    grid = current_app.config['STORE_CLUSTER_GRID']
+    top_n = current_app.config['STORE_CLUSTER_TOP_STORES']
+    cell_x = func.min(grid - 1, cast((User.store_longitude - west) / ((east - west) / grid), db.Integer))
+    cell_y = func.min(grid - 1, cast((User.store_latitude - south) / ((north - south) / grid), db.Integer))
+    # Half-open ranges so a store on a tile edge belongs to exactly one tile
+    in_tile = ((User.user_type == 'seller')
+               & (User.store_latitude >= south)
+               & ((User.store_latitude < north) if north < 90 else (User.store_latitude <= north))
+               & (User.store_longitude >= west)
+               & ((User.store_longitude < east) if east < 180 else (User.store_longitude <= east)))
+    if use_index:
+        # Let the R-tree pick the candidates; the column ranges stay as an exact check
+        geo_ids = select(store_geo.c.id).where(
+            _bbox_filter(store_geo.c.min_lat, store_geo.c.min_lng, bbox)
+        )
+        in_tile = in_tile & User.id.in_(geo_ids)
+
+    cells = db.session.query(
+        cell_x.label('cx'), cell_y.label('cy'), func.count(User.id),
+        func.avg(User.store_latitude), func.avg(User.store_longitude),
+    ).filter(in_tile).group_by('cx', 'cy')
+
+    avg_rating = case((User.store_review_count > 0,
+                       cast(User.store_rating_sum, db.Float) / User.store_review_count), else_=None)
+    rank = func.row_number().over(
+        partition_by=(cell_x, cell_y),
+        order_by=(func.coalesce(avg_rating, 0).desc(), User.store_review_count.desc(), User.id),
+    )
+    ranked = db.session.query(
+        cell_x.label('cx'), cell_y.label('cy'), User.id, User.username, User.store_name,
+        User.store_latitude, User.store_longitude, avg_rating.label('rating'),
+        User.store_review_count, rank.label('rank'),
+    ).filter(in_tile).subquery()
+    top = db.session.query(ranked).filter(ranked.c.rank <= top_n).order_by(ranked.c.rank)
+    return cells, top
+
+def compute_tile_clusters(zoom, x, y):
+    """Group the stores inside one tile into a GRID x GRID lattice of clusters.
+
+    Counts and centroids are computed with GROUP BY; the best-rated stores per
+    cell are picked with a window function, so both are single statements.
+    """
+    bbox = tile_bbox(zoom, x, y)
+    try:
+        cells_query, top_query = tile_cluster_queries(bbox)
+        cells = cells_query.all()
+    except OperationalError:
+        db.session.rollback()
+        cells_query, top_query = tile_cluster_queries(bbox, use_index=False)
+        cells = cells_query.all()
+    if not cells:
+        return []
+
+    top = {}
+    for row in top_query:
+        top.setdefault((row.cx, row.cy), []).append({
+            'id': row.id,
+            'name': row.store_name or row.username,
+            'lat': row.store_latitude,
+            'lng': row.store_longitude,
+            'rating': round(row.rating, 1) if row.rating is not None else None,
+            'reviews': row.store_review_count,
         })
-    return render_template("store-finder.html", stores=stores)
 
-@app.route("/store/<int:store_owner_id>/review", methods=["POST"])
+    return [
+        {
+            'count': count,
+            'lat': lat,
+            'lng': lng,
+            'top_stores': top.get((cx, cy), []),
+        }
+        for cx, cy, count, lat, lng in cells
+    ]
+
+@route("/api/stores/clusters")
+@login_required
+def stores_clusters():
+    """Server-side map clusters for the tiles covering `bbox` at `zoom`.
+
+    Clusters are computed per slippy-map tile and cached, so panning only
+    computes tiles that haven't been seen recently.
+    """
+    bbox = parse_bbox(request.args.get("bbox"))
+    if bbox is None:
+        return jsonify({"error": "bbox must be south,west,north,east"}), 400
+    zoom = request.args.get("zoom", type=int)
+    if zoom is None:
+        return jsonify({"error": "zoom is required"}), 400
+    zoom = max(0, min(zoom, 20))
+    xs, ys = tile_range(bbox, zoom)
+    if len(xs) * len(ys) > current_app.config['STORE_CLUSTER_MAX_TILES']:
+        return jsonify({"error": "viewport too large for this zoom"}), 400
+    clusters = []
+    for x in xs:
+        for y in ys:
+            key = (zoom, x, y)
+            tile = store_cluster_cache.get(key)
+            if tile is None:
+                tile = compute_tile_clusters(zoom, x, y)
+                store_cluster_cache.set(key, tile)
+            clusters.extend(tile)
+    return conditional_json({
+        "zoom": zoom,
+        "clusters": clusters,
+        "count": sum(c['count'] for c in clusters),
+    })
+
+def store_extent_query():
+    """Number of stores on the map and the bounding box of their locations.
+
+    Only stores with coordinates count: the same ones store_geo indexes and
+    the map can show.
+    """
+    return db.session.query(
+        func.count(User.id),
+        func.min(User.store_latitude), func.min(User.store_longitude),
+        func.max(User.store_latitude), func.max(User.store_longitude),
+    ).filter(User.user_type == 'seller',
+             User.store_latitude.isnot(None), User.store_longitude.isnot(None))
+
+@route("/stores")
+@login_required
+def store_finder():
+    """Buyer section: map of stores with cards below.
+
+    Only the store count and the overall extent are rendered; the map pulls
+    the stores for its current viewport from /api/stores/nearby.
+    """
+    store_count, south, west, north, east = store_extent_query().one()
+    bounds = [[south, west], [north, east]] if south is not None and west is not None else None
+    return render_template("store-finder.html", store_count=store_count, store_bounds=bounds)
+
+@route("/store/<int:store_owner_id>/review", methods=["POST"])
 @login_required
 def add_store_review(store_owner_id):
     store_owner = User.query.get_or_404(store_owner_id)
@@ -597,10 +1724,7 @@ def add_store_review(store_owner_id):
         return redirect(url_for("store_page", store_owner_id=store_owner_id))
     
     # Check if user already reviewed this store
-    existing_review = StoreReview.query.filter_by(
-        store_owner_id=store_owner_id, 
-        reviewer_id=current_user.id
-    ).first()
+    existing_review = StoreReview.by_reviewer(store_owner_id, current_user.id).first()
     
     rating = request.form.get("rating")
     review_text = request.form.get("review_text", "").strip()
@@ -617,10 +1741,11 @@ def add_store_review(store_owner_id):
         
         if existing_review:
             # Update existing review
+            store_owner.record_review(rating, previous_rating=existing_review.rating)
             existing_review.rating = rating
             existing_review.review_text = review_text
             existing_review.created_at = datetime.utcnow()
-            flash("Your review has been updated", "success")
+            message = "Your review has been updated"
         else:
             # Create new review
             new_review = StoreReview(
@@ -630,137 +1755,88 @@ def add_store_review(store_owner_id):
                 review_text=review_text
             )
             db.session.add(new_review)
-            flash("Your review has been added", "success")
+            store_owner.record_review(rating)
+            message = "Your review has been added"
         
         db.session.commit()
+        fragment_cache.invalidate(f"store-activity:{store_owner_id}")
+        flash(message, "success")
         
     except ValueError:
         flash("Invalid rating value", "error")
+    except IntegrityError:
+        # A concurrent submission from the same user created the review first
+        db.session.rollback()
+        flash("You have already reviewed this store", "error")
     
     return redirect(url_for("store_page", store_owner_id=store_owner_id))
 
-@app.route("/api/geocode/search")
+def geocode_endpoint(kind):
+    """URL of a geocode proxy endpoint: the async service when configured, else the view here."""
+    base = current_app.config['GEOCODE_SERVICE_URL']
+    if base:
+        return f"{base.rstrip('/')}/api/geocode/{kind}"
+    return url_for(f"geocode_{kind}")
+
+@route("/api/geocode/search")
 def geocode_search():
     """Server-side proxy to Nominatim search to avoid CORS in browser."""
     q = request.args.get("q", "").strip()
-    limit = request.args.get("limit", "8")
+    limit = max(1, min(request.args.get("limit", 8, type=int), 20))
     if not q or len(q) < 2:
         return jsonify([])
-    try:
-        resp = requests.get(
-            "https://nominatim.openstreetmap.org/search",
-            params={
-                "q": q,
-                "format": "jsonv2",
-                "limit": limit,
-                "addressdetails": 1,
-            },
-            headers={
-                # Provide a valid UA as required by Nominatim policy
-                "User-Agent": "AmchoPasroApp/1.0 (+http://localhost)",
-                "Accept": "application/json",
-            },
-            timeout=10,
-        )
-        if resp.status_code != 200:
-            return jsonify([]), resp.status_code
-        return jsonify(resp.json())
-    except Exception:
-        return jsonify([]), 502
+    status, payload = geocoder.search(q, limit)
+    if status == 429:
+        return jsonify([]), 429, {"Retry-After": "1"}
+    if status != 200:
+        return jsonify([]), status
+    return conditional_json(payload, max_age=current_app.config['GEOCODE_HTTP_MAX_AGE'])
 
-@app.route("/api/geocode/reverse")
+@route("/api/geocode/reverse")
 def geocode_reverse():
     """Server-side proxy to Nominatim reverse geocode to avoid CORS in browser."""
-    lat = request.args.get("lat")
-    lon = request.args.get("lon")
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
     if lat is None or lon is None:
         return jsonify({}), 400
-    try:
-        resp = requests.get(
-            "https://nominatim.openstreetmap.org/reverse",
-            params={
-                "format": "jsonv2",
-                "lat": lat,
-                "lon": lon,
-                "zoom": 14,
-                "addressdetails": 1,
-            },
-            headers={
-                "User-Agent": "AmchoPasroApp/1.0 (+http://localhost)",
-                "Accept": "application/json",
-            },
-            timeout=10,
-        )
-        if resp.status_code != 200:
-            return jsonify({}), resp.status_code
-        return jsonify(resp.json())
-    except Exception:
-        return jsonify({}), 502
+    status, payload = geocoder.reverse(lat, lon)
+    if status == 429:
+        return jsonify({}), 429, {"Retry-After": "1"}
+    if status != 200:
+        return jsonify({}), status
+    return conditional_json(payload, max_age=current_app.config['GEOCODE_HTTP_MAX_AGE'])
+
+@route("/api/geocode/stats")
+@login_required
+def geocode_stats():
+    """Cache hit/miss and upstream counters for this worker."""
+    return jsonify(geocoder.stats())
+
+@route("/metrics")
+def metrics():
+    """This worker's request metrics in the Prometheus text format."""
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+    return current_app.response_class(instrumentation.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route("/logout")
+@route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("You have been logged out", "info")
     return redirect(url_for("index"))
 
+def __getattr__(name):
+    # `app:app` (WSGI servers, `flask run`) builds the default app on first
+    # access instead of at import time
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()  # Creates database tables if they don't exist
-        print("Database tables created successfully!")
-        # Lightweight migration for new columns if they don't exist (SQLite only)
-        try:
-            engine = db.engine
-            # Use a transaction (BEGIN) so DDL persists reliably
-            with engine.begin() as con:
-                # Check existing columns in User table
-                res = con.execute(text("PRAGMA table_info(user)")).fetchall()
-                cols = {row[1] for row in res}
-                if 'store_latitude' not in cols:
-                    con.execute(text("ALTER TABLE user ADD COLUMN store_latitude REAL"))
-                    print("Added column: user.store_latitude")
-                if 'store_longitude' not in cols:
-                    con.execute(text("ALTER TABLE user ADD COLUMN store_longitude REAL"))
-                    print("Added column: user.store_longitude")
-                if 'store_address' not in cols:
-                    con.execute(text("ALTER TABLE user ADD COLUMN store_address TEXT"))
-                    print("Added column: user.store_address")
-                # Migrate old user_type 'fisherman' to 'seller'
-                con.execute(text("UPDATE user SET user_type='seller' WHERE user_type='fisherman'"))
-                print("Migrated user_type 'fisherman' -> 'seller' (if any)")
-                # Category migration
-                # Ensure category table exists
-                con.execute(text("CREATE TABLE IF NOT EXISTS category (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(120) NOT NULL UNIQUE, slug VARCHAR(140) NOT NULL UNIQUE)"))
-                # Seed default categories if table empty
-                existing = con.execute(text("SELECT COUNT(*) FROM category")).scalar()
-                if existing == 0:
-                    default_cats = [
-                        ('Seafood', 'seafood'),
-                        ('Handicrafts', 'handicrafts'),
-                        ('Spices', 'spices'),
-                        ('Organic Produce', 'organic-produce'),
-                        ('Beverages', 'beverages'),
-                        ('Art', 'art'),
-                        ('Clothing', 'clothing'),
-                        ('Other', 'other')
-                    ]
-                    for name, slug in default_cats:
-                        try:
-                            con.execute(text("INSERT INTO category (name, slug) VALUES (:n,:s)"), {"n": name, "s": slug})
-                        except Exception:
-                            pass
-                    print("Seeded default categories")
-                # Ensure product.category_id column exists
-                pres = con.execute(text("PRAGMA table_info(product)")).fetchall()
-                pcols = {row[1] for row in pres}
-                if 'category_id' not in pcols:
-                    try:
-                        con.execute(text("ALTER TABLE product ADD COLUMN category_id INTEGER REFERENCES category(id)"))
-                        print("Added column: product.category_id")
-                    except Exception as ce:
-                        print("Failed to add product.category_id column (may already exist)", ce)
-                else:
-                    print("product.category_id already present")
-        except Exception as e:
-            print("Migration check failed or not applicable:", e)
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host="0.0.0.0", port=5000)
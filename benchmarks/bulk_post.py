@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Throughput of posting products one form at a time vs the batch API.
+
+Seeds a small synthetic marketplace, logs in as a seller and creates
+--products products through
+
+  single      POST /post-product, one product per request (the seller form)
+  batch N     POST /api/products/batch with N products per request
+
+reporting products per second and SQL statements per product. With
+--images every product carries its own small JPEG: the form uploads it as
+`image`, the batch sends a multipart request with one file per product.
+Uploads go to a scratch folder and image variants are rendered in the
+background, as in production; that work isn't timed.
+
+Usage: python benchmarks/bulk_post.py [--products 400] [--batch-sizes 10,50,200] [--images]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from routes import QueryCounter
+from synthetic import PASSWORD, WORDS, build_database
+
+
+def make_products(count, images):
+    """(fields, JPEG bytes or None) for `count` distinct products."""
+    slugs = list(WORDS)
+    products = []
+    for i in range(count):
+        slug = slugs[i % len(slugs)]
+        adjectives, nouns = WORDS[slug]
+        fields = {
+            'title': f"{adjectives[i % len(adjectives)]} {nouns[i % len(nouns)]} #{i}",
+            'price': f"{50 + i % 500}.00",
+            'quantity': str(1 + i % 5),
+            'description': "Caught this morning.",
+            'category': slug,
+        }
+        photo = None
+        if images:
+            from PIL import Image
+
+            buffer = io.BytesIO()
+            # A different colour per product, so uploads aren't deduplicated
+            Image.new('RGB', (96, 96), (i % 256, (i // 256) % 256, 90)).save(buffer, 'JPEG')
+            photo = buffer.getvalue()
+        products.append((fields, photo))
+    return products
+
+
+def post_single(client, products):
+    for fields, photo in products:
+        data = dict(fields)
+        if photo:
+            data['image'] = (io.BytesIO(photo), 'catch.jpg')
+        response = client.post('/post-product', data=data, content_type='multipart/form-data')
+        if response.status_code != 302:
+            raise SystemExit(f"/post-product answered {response.status_code}")
+        with client.session_transaction() as sess:
+            sess.pop('_flashes', None)
+
+
+def post_batches(client, products, size):
+    for start in range(0, len(products), size):
+        chunk = products[start:start + size]
+        if any(photo for _fields, photo in chunk):
+            items, data = [], {}
+            for i, (fields, photo) in enumerate(chunk):
+                items.append(dict(fields, image=f"photo{i}"))
+                data[f"photo{i}"] = (io.BytesIO(photo), f"catch{i}.jpg")
+            data['products'] = json.dumps(items)
+            response = client.post('/api/products/batch', data=data, content_type='multipart/form-data')
+        else:
+            response = client.post('/api/products/batch', json=[fields for fields, _photo in chunk])
+        if response.status_code != 201:
+            raise SystemExit(f"/api/products/batch answered {response.status_code}: {response.get_data(as_text=True)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=400, help='products created per mode')
+    parser.add_argument('--batch-sizes', default='10,50,200')
+    parser.add_argument('--images', action='store_true', help='attach a photo to every product')
+    args = parser.parse_args()
+
+    from app import db, image_processor
+
+    workdir = tempfile.mkdtemp(prefix='amcho-bulk-')
+    app, _counts = build_database(os.path.join(workdir, 'bench.db'), 20, 2000, 200, log=lambda *_: None)
+    app.config.update({'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'), 'IMAGE_PROCESSING_ASYNC': True})
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+    image_processor.init_app(app)
+    client = app.test_client()
+    response = client.post('/login', data={'email': 'seller0@example.com', 'password': PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit("Could not log in as a seeded seller")
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    modes = [('single', lambda products: post_single(client, products))]
+    for size in (int(s) for s in args.batch_sizes.split(',')):
+        modes.append((f"batch {size}", lambda products, size=size: post_batches(client, products, size)))
+
+    print(f"{args.products} products per mode{', with images' if args.images else ''}\n")
+    print(f"{'Mode':<12} {'seconds':>8} {'products/s':>11} {'speedup':>8} {'SQL/product':>12}")
+    print("-" * 56)
+    baseline = None
+    for name, run in modes:
+        products = make_products(args.products, args.images)
+        counter.count = 0
+        started = time.perf_counter()
+        run(products)
+        elapsed = time.perf_counter() - started
+        rate = args.products / elapsed
+        baseline = baseline or rate
+        print(f"{name:<12} {elapsed:>8.2f} {rate:>11.0f} {rate / baseline:>7.1f}x "
+              f"{counter.count / args.products:>12.2f}")
+    image_processor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Check that slow geocoding doesn't starve the app's worker threads.
+
+Starts a stub Nominatim that takes --delay seconds to answer, serves a small
+synthetic marketplace from a WSGI server with a fixed pool of --workers
+threads (like gunicorn's gthread worker), logs in as a buyer and times
+/products while --geocoders clients keep geocoding new places:
+
+  sync     geocodes go to the app's own /api/geocode/search view; each one
+           holds a worker thread until the stub answers, so /products
+           queues behind them
+  async    geocodes go to geocode_service.py; the workers stay free
+
+Exits with status 1 when /products p95 with the async service is above
+--max-p95 ms.
+
+Usage: python benchmarks/geocode_isolation.py [--workers 4] [--geocoders 8]
+                                              [--delay 2] [--probes 30] [--max-p95 250]
+"""
+
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import PASSWORD, build_database
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def slow_nominatim(delay):
+    """Stub upstream answering every search after `delay` seconds."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            body = json.dumps([{'display_name': query.get('q', [''])[0], 'lat': '15.49', 'lon': '73.82'}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *_args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server handling connections on a fixed pool of threads."""
+
+    def __init__(self, address, workers):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_app(app, workers):
+    server = PooledWSGIServer(('127.0.0.1', free_port()), workers)
+    server.set_app(app)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_geocode_service(app):
+    """Run geocode_service.py on its own event loop thread; returns its port."""
+    from aiohttp import web
+
+    from geocode_service import create_service
+
+    port = free_port()
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_service(app), access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait(10)
+    return port
+
+
+def measure(app_url, geocode_url, opener, args):
+    """/products latencies (ms) while geocode clients keep the upstream busy."""
+    stop = threading.Event()
+    counter = iter(range(10 ** 9))
+
+    def geocode_loop():
+        while not stop.is_set():
+            # A new place every time, so each lookup misses the cache
+            url = f"{geocode_url}?{urllib.parse.urlencode({'q': f'place {next(counter)}'})}"
+            try:
+                opener.open(url, timeout=30).read()
+            except (urllib.error.URLError, OSError):
+                pass
+
+    clients = [threading.Thread(target=geocode_loop, daemon=True) for _ in range(args.geocoders)]
+    for client in clients:
+        client.start()
+    time.sleep(0.3)
+    latencies = []
+    for _ in range(args.probes):
+        started = time.perf_counter()
+        with opener.open(f"{app_url}/products", timeout=60) as response:
+            response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.05)
+    stop.set()
+    for client in clients:
+        client.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads')
+    parser.add_argument('--geocoders', type=int, default=8, help='concurrent geocoding clients')
+    parser.add_argument('--delay', type=float, default=2.0, help='stub upstream latency (seconds)')
+    parser.add_argument('--probes', type=int, default=30, help='timed /products requests per scenario')
+    parser.add_argument('--max-p95', type=float, default=250, help='async p95 budget (ms)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='amcho-geocode-')
+    upstream = slow_nominatim(args.delay)
+    app, _counts = build_database(os.path.join(workdir, 'bench.db'), 20, 500, 100, log=lambda *_: None)
+    app.config.update({
+        'NOMINATIM_URL': f"http://127.0.0.1:{upstream.server_address[1]}",
+        'GEOCODE_CACHE_PATH': os.path.join(workdir, 'geocode_cache.db'),
+        # The stub has no usage policy; keep the token bucket out of the way
+        'GEOCODE_RATE_LIMIT': 1000.0,
+        'GEOCODE_RATE_BURST': 1000,
+    })
+    from app import geocoder, User
+    geocoder.init_app(app)
+    with app.app_context():
+        email = User.query.filter_by(user_type='buyer').first().email
+
+    server = serve_app(app, args.workers)
+    app_url = f"http://127.0.0.1:{server.server_address[1]}"
+    service_port = serve_geocode_service(app)
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    opener.open(f"{app_url}/login", data=urllib.parse.urlencode({'email': email, 'password': PASSWORD}).encode())
+
+    print(f"{args.workers} worker threads, {args.geocoders} geocoding clients, upstream delay {args.delay}s\n")
+    print(f"{'Geocodes served by':<22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    print("-" * 50)
+    results = {}
+    for name, geocode_url in (('sync (Flask view)', f"{app_url}/api/geocode/search"),
+                              ('async service', f"http://127.0.0.1:{service_port}/api/geocode/search")):
+        latencies = measure(app_url, geocode_url, opener, args)
+        results[name] = percentile(latencies, 95)
+        print(f"{name:<22} {percentile(latencies, 50):>8.1f} {results[name]:>8.1f} {max(latencies):>8.1f}")
+
+    if results['async service'] > args.max_p95:
+        print(f"\nFAIL: /products p95 {results['async service']:.1f} ms with the async service "
+              f"(budget {args.max_p95:.0f} ms)")
+        sys.exit(1)
+    print(f"\nOK: /products stays under {args.max_p95:.0f} ms p95 while geocoding runs on the async service")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Route benchmark for the Amcho Pasro app on a synthetic marketplace.
+
+Seeds a scratch database with benchmarks/synthetic.py (or reuses one given
+with --db), logs in as a buyer and drives the busy routes through the
+Flask test client:
+
+  products            first listing page
+  products: page 2    the page after a cursor
+  products: category  one category's listing
+  products: search    full-text search for catalogue words
+  stores              store finder page
+  stores nearby       /api/stores/nearby around a random town
+  store page          a random seller's page (bigger stores more often)
+  product detail      a random product
+  review post         POST /store/<id>/review (new or updated review)
+
+Each route is warmed up, then timed for --requests requests and reported
+as p50/p95/p99 latency, SQL statements per request and peak Python memory
+allocated while serving one request (tracemalloc, measured in a separate
+pass so it doesn't skew the timings). Use --output to save the results as
+JSON and --compare to diff them against an earlier run.
+
+Usage: python benchmarks/routes.py [--sellers 200] [--products 20000] [--reviews 5000]
+                                   [--requests 200] [--db PATH] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from synthetic import PASSWORD, TOWNS, WORDS, build_database
+
+MEMORY_SAMPLES = 20
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Dataset:
+    """Ids and values the request generators pick from."""
+
+    def __init__(self, app):
+        from app import Category, Product, User, db, encode_cursor, product_list_query
+
+        with app.app_context():
+            rows = (db.session.query(User.id, db.func.count(Product.id))
+                    .join(Product, Product.user_id == User.id).group_by(User.id).all())
+            self.store_ids = [r[0] for r in rows]
+            self.store_weights = [r[1] for r in rows]
+            self.product_ids = [r[0] for r in db.session.query(Product.id)]
+            self.category_slugs = [c.slug for c in Category.all()]
+            self.buyer_email = db.session.query(User.email).filter(User.user_type == 'buyer').limit(1).scalar()
+            page = product_list_query().order_by(Product.created_at.desc(), Product.id.desc()).limit(24).all()
+            self.cursor = encode_cursor(page[-1]) if page else ''
+        self.search_terms = sorted({word.split()[0] for _adj, nouns in WORDS.values() for word in nouns})
+
+
+def route_table(data, rng):
+    """(name, method, url factory, form factory) for every benchmarked route."""
+    def store():
+        return rng.choices(data.store_ids, weights=data.store_weights)[0]
+
+    def town():
+        _name, lat, lng = rng.choice(TOWNS)
+        return f"lat={lat}&lng={lng}&radius=10"
+
+    return [
+        ('products', 'GET', lambda: '/products', None),
+        ('products: page 2', 'GET', lambda: f'/products?cursor={data.cursor}', None),
+        ('products: category', 'GET', lambda: f'/products?category={rng.choice(data.category_slugs)}', None),
+        ('products: search', 'GET', lambda: f'/products?q={rng.choice(data.search_terms)}', None),
+        ('stores', 'GET', lambda: '/stores', None),
+        ('stores nearby', 'GET', lambda: f'/api/stores/nearby?{town()}', None),
+        ('store page', 'GET', lambda: f'/store/{store()}', None),
+        ('product detail', 'GET', lambda: f'/product/{rng.choice(data.product_ids)}', None),
+        ('review post', 'POST', lambda: f'/store/{store()}/review',
+         lambda: {'rating': str(rng.randint(1, 5)), 'review_text': 'Benchmark review'}),
+    ]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *_args):
+        self.count += 1
+
+
+def run_route(client, counter, method, make_url, make_form, requests, warmup):
+    def call():
+        url = make_url()
+        if method == 'POST':
+            return client.post(url, data=make_form())
+        return client.get(url)
+
+    def settle():
+        # POSTs flash a message; drop it so the session cookie doesn't grow
+        if method == 'POST':
+            with client.session_transaction() as sess:
+                sess.pop('_flashes', None)
+
+    for _ in range(warmup):
+        call()
+        settle()
+    latencies, queries, errors = [], [], 0
+    for _ in range(requests):
+        counter.count = 0
+        started = time.perf_counter()
+        response = call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        errors += response.status_code >= 400
+        settle()
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(requests, MEMORY_SAMPLES)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        settle()
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+        'peak_kib': round(max(peaks) / 1024, 1),
+        'errors': errors,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from app import create_app, db
+
+    log = (lambda *_: None) if args.json else print
+    if args.db and os.path.exists(args.db):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{args.db}', 'IMAGE_PROCESSING_ASYNC': False})
+        dataset = None
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='amcho-routes-'), 'bench.db')
+        app, dataset = build_database(db_path, args.sellers, args.products, args.reviews, args.seed, log=log)
+    if args.no_fragment_cache:
+        from app import fragment_cache
+        app.config['FRAGMENT_CACHE_BACKEND'] = 'null'
+        fragment_cache.init_app(app)
+
+    data = Dataset(app)
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    response = client.post('/login', data={'email': data.buyer_email, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit("Could not log in as a seeded buyer")
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    only = set(args.routes.split(',')) if args.routes else None
+    results = {}
+    for name, method, make_url, make_form in route_table(data, rng):
+        if only and name not in only:
+            continue
+        log(f"  {name}...")
+        results[name] = run_route(client, counter, method, make_url, make_form, args.requests, args.warmup)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlite_profile': app.config['SQLITE_PROFILE'],
+            'fragment_cache': app.config['FRAGMENT_CACHE_BACKEND'],
+            'dataset': dataset or {'db': args.db},
+            'seed': args.seed,
+        },
+        'routes': results,
+    }
+
+
+def print_table(result, baseline=None):
+    print(f"\n{'Route':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KiB':>9} {'err':>4}")
+    print("-" * 70)
+    for name, r in result['routes'].items():
+        print(f"{name:<20} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['queries_per_request']:>8} {r['peak_kib']:>9} {r['errors']:>4}")
+        old = (baseline or {}).get('routes', {}).get(name)
+        if old:
+            deltas = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                deltas.append(f"{(r[key] - old[key]) / old[key] * 100:+.0f}%" if old[key] else '—')
+            query_delta = r['queries_per_request'] - old['queries_per_request']
+            peak_delta = r['peak_kib'] - old['peak_kib']
+            print(f"{'  vs baseline':<20} {deltas[0]:>8} {deltas[1]:>8} {deltas[2]:>8} "
+                  f"{query_delta:>+8.2f} {peak_delta:>+9.1f}")
+    meta = result['meta']
+    print(f"\ncommit {meta['commit']}, dataset {meta['dataset']}, fragment cache {meta['fragment_cache']}")
+    if baseline:
+        print(f"baseline: commit {baseline['meta'].get('commit')}, {baseline['meta'].get('timestamp')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='reuse this seeded database (created when missing)')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--routes', help='comma-separated route names to run (default: all)')
+    parser.add_argument('--no-fragment-cache', action='store_true', help='render every fragment')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to diff against')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(result, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the SQLite engine profiles in db_engine.py.
+
+Runs reader threads against a scratch database while writer threads keep
+inserting and committing, then reports read/write throughput, read latency
+and "database is locked" failures for each profile.
+
+Usage: python benchmarks/sqlite_concurrency.py [--seconds 5] [--readers 8]
+                                               [--writers 2] [--profiles legacy,production]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from db_engine import engine_options, install_pragmas
+
+SEED_ROWS = 20000
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_profile(profile, seconds, readers, writers):
+    tmp_dir = tempfile.mkdtemp(prefix='amcho-bench-')
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", **engine_options(profile))
+    install_pragmas(engine, profile)
+    with engine.begin() as con:
+        con.execute(text(
+            "CREATE TABLE product (id INTEGER PRIMARY KEY, title TEXT, price REAL, "
+            "user_id INTEGER, created_at REAL)"
+        ))
+        con.execute(text("CREATE INDEX ix_product_user ON product (user_id, created_at)"))
+        con.execute(
+            text("INSERT INTO product (title, price, user_id, created_at) VALUES (:t, :p, :u, :c)"),
+            [{"t": f"item {i}", "p": i % 500, "u": i % 200, "c": time.time()} for i in range(SEED_ROWS)],
+        )
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0}
+    latencies = []
+
+    def reader(n):
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as con:
+                    con.execute(text(
+                        "SELECT id, title, price FROM product WHERE user_id = :u "
+                        "ORDER BY created_at DESC LIMIT 24"
+                    ), {"u": n % 200}).fetchall()
+                local.append(time.perf_counter() - started)
+            except OperationalError:
+                with lock:
+                    stats["read_errors"] += 1
+            n += 1
+        with lock:
+            stats["reads"] += len(local)
+            latencies.extend(local)
+
+    def writer(n):
+        while not stop.is_set():
+            try:
+                with engine.begin() as con:
+                    con.execute(
+                        text("INSERT INTO product (title, price, user_id, created_at) VALUES (:t, :p, :u, :c)"),
+                        {"t": f"new {n}", "p": 1.0, "u": n % 200, "c": time.time()},
+                    )
+                with lock:
+                    stats["writes"] += 1
+            except OperationalError:
+                with lock:
+                    stats["write_errors"] += 1
+            n += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    return {
+        "profile": profile,
+        "reads_per_sec": round(stats["reads"] / seconds, 1),
+        "writes_per_sec": round(stats["writes"] / seconds, 1),
+        "read_p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "read_p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "read_errors": stats["read_errors"],
+        "write_errors": stats["write_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--profiles', default='legacy,production')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [run_profile(p, args.seconds, args.readers, args.writers) for p in args.profiles.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"\n{'Profile':<12} {'reads/s':>9} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'r.err':>6} {'w.err':>6}")
+    print("-" * 64)
+    for r in results:
+        print(f"{r['profile']:<12} {r['reads_per_sec']:>9} {r['writes_per_sec']:>9} "
+              f"{r['read_p50_ms']!s:>8} {r['read_p99_ms']!s:>8} {r['read_errors']:>6} {r['write_errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
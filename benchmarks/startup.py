@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Startup budget for the Amcho Pasro app.
+
+Each run starts a fresh interpreter and measures the three costs a new
+worker (or a db_manager.py command) pays before doing useful work:
+
+  import         `import app` (framework, models, helpers)
+  create_app     building a configured app with its extensions
+  first request  the first GET / through the test client (template compile)
+
+It also lists the optional heavy modules (requests, PIL) that are loaded by
+then; they should only be imported when a geocode or image job needs them.
+The median of each stage is compared with the budget and the script exits
+with status 1 when one is exceeded.
+
+Usage: python benchmarks/startup.py [--runs 7] [--budget-import-ms 800]
+                                    [--budget-create-ms 150] [--budget-first-request-ms 250]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ('requests', 'PIL')
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[1]})
+created = time.perf_counter()
+status = flask_app.test_client().get('/').status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'status': status,
+    'lazy_loaded': [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+def run_once(db_path):
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, db_path, *LAZY_MODULES],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(runs):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='amcho-startup-'), 'startup.db')
+    samples = [run_once(db_path) for _ in range(runs)]
+    result = {
+        stage: round(statistics.median(s[stage] for s in samples), 1)
+        for stage in ('import_ms', 'create_ms', 'first_request_ms')
+    }
+    result['runs'] = runs
+    result['status'] = samples[-1]['status']
+    result['lazy_loaded'] = sorted({m for s in samples for m in s['lazy_loaded']})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-import-ms', type=float, default=800)
+    parser.add_argument('--budget-create-ms', type=float, default=150)
+    parser.add_argument('--budget-first-request-ms', type=float, default=250)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    budgets = {
+        'import_ms': args.budget_import_ms,
+        'create_ms': args.budget_create_ms,
+        'first_request_ms': args.budget_first_request_ms,
+    }
+    over = [stage for stage, budget in budgets.items() if result[stage] > budget]
+    if args.json:
+        print(json.dumps(dict(result, budgets=budgets, over_budget=over), indent=2))
+    else:
+        print(f"\n{'Stage':<16} {'median ms':>10} {'budget ms':>10}")
+        print("-" * 38)
+        for stage, budget in budgets.items():
+            flag = '  OVER' if stage in over else ''
+            print(f"{stage:<16} {result[stage]:>10} {budget:>10}{flag}")
+        print(f"\n{result['runs']} runs, GET / -> {result['status']}; "
+              f"eagerly loaded optional modules: {', '.join(result['lazy_loaded']) or 'none'}")
+    if over or result['lazy_loaded']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
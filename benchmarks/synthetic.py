@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Synthetic marketplace data for benchmarks.
+
+Seeds a database through the app's own models: sellers with store
+coordinates scattered around Goa, products spread over the seeded
+categories with realistic titles, prices and listing dates, buyers, and
+store reviews (at most one per buyer and store, like the real table).
+Review aggregates are rebuilt from the reviews at the end, and the FTS and
+R-tree indexes are filled by their triggers, so the result looks exactly
+like a database grown through the web app.
+
+The same --seed always produces the same dataset.
+
+Usage: python benchmarks/synthetic.py --db /tmp/bench.db [--sellers 200]
+                                      [--products 20000] [--reviews 5000] [--seed 1]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+PASSWORD = 'benchmark'
+CHUNK = 2000
+
+# Store locations: jittered around these towns (lat, lng)
+TOWNS = [
+    ('Panaji', 15.4909, 73.8278), ('Margao', 15.2832, 73.9862), ('Vasco da Gama', 15.3860, 73.8440),
+    ('Mapusa', 15.5937, 73.8142), ('Ponda', 15.4027, 74.0078), ('Canacona', 15.0096, 74.0500),
+    ('Calangute', 15.5439, 73.7553), ('Bicholim', 15.5889, 73.9490),
+]
+
+WORDS = {
+    'seafood': (['Fresh', 'Line-caught', 'Dried', 'Smoked', 'Salted'],
+                ['Pomfret', 'Kingfish', 'Mackerel', 'Prawns', 'Crab', 'Squid', 'Sardines', 'Mussels']),
+    'handicrafts': (['Handwoven', 'Carved', 'Coconut shell', 'Bamboo', 'Terracotta'],
+                    ['Basket', 'Lamp', 'Bowl', 'Wall hanging', 'Tray', 'Coaster set']),
+    'spices': (['Organic', 'Sun-dried', 'Stone-ground', 'Whole', 'Roasted'],
+               ['Kokum', 'Black pepper', 'Cardamom', 'Cinnamon', 'Red chilli', 'Turmeric']),
+    'organic-produce': (['Organic', 'Farm-fresh', 'Heirloom', 'Seasonal'],
+                        ['Mangoes', 'Cashews', 'Jackfruit', 'Coconuts', 'Red rice', 'Okra']),
+    'beverages': (['Homemade', 'Cold-pressed', 'Traditional', 'Small-batch'],
+                  ['Feni', 'Kokum sherbet', 'Coconut water', 'Sol kadhi', 'Cashew juice']),
+    'art': (['Original', 'Framed', 'Hand-painted', 'Azulejo'],
+            ['Canvas', 'Tile panel', 'Print', 'Sketch', 'Watercolour']),
+    'clothing': (['Cotton', 'Block-printed', 'Handloom', 'Linen'],
+                 ['Kunbi saree', 'Shirt', 'Scarf', 'Kurta', 'Tote bag']),
+    'other': (['Assorted', 'Gift', 'Vintage', 'Reclaimed'],
+              ['Hamper', 'Box', 'Bundle', 'Set']),
+}
+
+
+def scatter(rng, lat, lng, km):
+    """A point within roughly `km` of (lat, lng)."""
+    r = km * math.sqrt(rng.random())
+    theta = rng.uniform(0, 2 * math.pi)
+    return (lat + (r / 111.0) * math.cos(theta),
+            lng + (r / (111.0 * math.cos(math.radians(lat)))) * math.sin(theta))
+
+
+def seed(sellers=200, products=20000, reviews=5000, buyers=None, rng_seed=1, log=print):
+    """Fill the current app's (migrated, empty) database; returns the row counts.
+
+    Must run inside an app context. `buyers` defaults to enough accounts to
+    place `reviews` reviews without repeating a (buyer, store) pair.
+    """
+    from app import Category, Product, StoreReview, User, db
+    from migrations import STORE_RATING_REBUILD_SQL
+
+    rng = random.Random(rng_seed)
+    if buyers is None:
+        buyers = max(10, math.ceil(reviews / max(sellers, 1)) * 2)
+    reviews = min(reviews, sellers * buyers)
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    def commit_chunks(objects):
+        for i in range(0, len(objects), CHUNK):
+            db.session.add_all(objects[i:i + CHUNK])
+            db.session.commit()
+
+    seller_rows = []
+    for i in range(sellers):
+        town, lat, lng = rng.choice(TOWNS)
+        lat, lng = scatter(rng, lat, lng, 12)
+        seller_rows.append(User(
+            username=f"seller{i}", email=f"seller{i}@example.com", password_hash=password_hash,
+            user_type='seller', store_name=f"{rng.choice(['Sea', 'Sun', 'Palm', 'Tide', 'Spice'])} "
+                                           f"{rng.choice(['Market', 'Traders', 'Co-op', 'House', 'Corner'])} {i}",
+            store_location=f"Ward {rng.randint(1, 30)}", store_city=town,
+            store_latitude=round(lat, 6), store_longitude=round(lng, 6),
+            store_address=f"{rng.randint(1, 400)} Market Road, {town}, Goa",
+        ))
+    buyer_rows = [
+        User(username=f"buyer{i}", email=f"buyer{i}@example.com", password_hash=password_hash, user_type='buyer')
+        for i in range(buyers)
+    ]
+    commit_chunks(seller_rows + buyer_rows)
+    seller_ids = [u.id for u in seller_rows]
+    buyer_ids = [u.id for u in buyer_rows]
+    log(f"  {sellers} sellers, {buyers} buyers")
+
+    categories = {c.slug: c.id for c in Category.query.all()}
+    slugs = [slug for slug in WORDS if slug in categories]
+    # A few big sellers carry most of the catalogue, as on the live site
+    weights = [1.0 / (rank + 1) ** 0.8 for rank in range(sellers)]
+    product_rows = []
+    for owner_id in rng.choices(seller_ids, weights=weights, k=products):
+        slug = rng.choice(slugs)
+        adjectives, nouns = WORDS[slug]
+        title = f"{rng.choice(adjectives)} {rng.choice(nouns)}"
+        product_rows.append(Product(
+            title=title, price=round(rng.lognormvariate(5.5, 0.8), 2), quantity=rng.choice([1, 1, 1, 2, 5, 10]),
+            description=f"{title} from our store. {rng.choice(['Packed fresh daily.', 'Limited stock.', 'Made to order.', ''])}",
+            user_id=owner_id, category_id=categories[slug],
+            created_at=now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600)),
+        ))
+    commit_chunks(product_rows)
+    log(f"  {products} products")
+
+    pairs = set()
+    review_rows = []
+    while len(review_rows) < reviews:
+        pair = (rng.choices(seller_ids, weights=weights)[0], rng.choice(buyer_ids))
+        if pair in pairs:
+            continue
+        pairs.add(pair)
+        review_rows.append(StoreReview(
+            store_owner_id=pair[0], reviewer_id=pair[1], rating=rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 6, 6])[0],
+            review_text=rng.choice(['Great quality', 'Friendly seller', 'Fresh and tasty', 'Would buy again', '']),
+            created_at=now - timedelta(seconds=rng.randint(0, 60 * 24 * 3600)),
+        ))
+    commit_chunks(review_rows)
+    db.session.execute(text(STORE_RATING_REBUILD_SQL))
+    db.session.commit()
+    log(f"  {len(review_rows)} reviews ({time.perf_counter() - started:.1f}s)")
+    return {"sellers": sellers, "buyers": buyers, "products": products, "reviews": len(review_rows)}
+
+
+def build_database(db_path, sellers, products, reviews, rng_seed=1, log=print):
+    """Create, migrate and seed a database file; returns (app, counts)."""
+    from app import create_app, db
+    from migrations import migrate
+
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} already exists; pick a new path")
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'IMAGE_PROCESSING_ASYNC': False})
+    with app.app_context():
+        migrate(db.engine, db.metadata, log=lambda *_: None)
+        log(f"Seeding {db_path}")
+        counts = seed(sellers, products, reviews, rng_seed=rng_seed, log=log)
+    return app, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='path of the database file to create')
+    parser.add_argument('--sellers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    build_database(args.db, args.sellers, args.products, args.reviews, args.seed)
+    print(f"Done. Every account's password is '{PASSWORD}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Streaming bulk export and import of catalogue data.
+
+`python db_manager.py export <kind>` and `import <kind> FILE` move
+categories, users (buyers, and sellers with their store details), products
+and store reviews as CSV or JSON Lines, one record per row/line. Records
+refer to each other by natural keys (category slug, user email), not by
+database ids, so an export from one database imports into another and an
+onboarding spreadsheet can list a cooperative's products by seller email.
+
+Export streams rows in CHUNK-sized batches (yield_per), so memory stays
+flat whatever the table size. Import reads the file lazily and writes each
+batch with one executemany INSERT in its own transaction, together with
+the batch's checkpoint in `import_checkpoint`: after a crash or a bad row,
+running the same import again resumes after the last committed batch
+(`restart` ignores the checkpoint). Resuming assumes the rows already
+imported haven't changed in the file. The written rows move the shared
+'fragments' cache version through triggers, so every web worker drops its
+rendered store fragments (see fragments.py).
+
+Rows that already exist:
+  categories, users  existing slugs/emails are kept (counted as skipped)
+  reviews            an existing (store, reviewer) review is replaced, as
+                     when the buyer posts it again
+  products           always appended; products have no natural key
+
+User exports include password hashes; treat them as secrets. Imported
+users need either a `password_hash` or a plain `password` (hashed on
+import, which is slow: minutes for tens of thousands of accounts).
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.security import generate_password_hash
+
+from migrations import STORE_RATING_REBUILD_SQL
+
+CHUNK = 5000
+FORMATS = ('csv', 'jsonl')
+
+# Columns of each kind's records, in file order
+FIELDS = {
+    'categories': ('name', 'slug'),
+    'users': ('email', 'username', 'user_type', 'password_hash', 'store_name', 'store_location',
+              'store_city', 'store_latitude', 'store_longitude', 'store_address', 'store_image',
+              'store_image_thumb'),
+    'products': ('seller_email', 'category_slug', 'title', 'price', 'quantity', 'description',
+                 'image_filename', 'image_thumb', 'image_card', 'created_at'),
+    'reviews': ('store_email', 'reviewer_email', 'rating', 'review_text', 'created_at'),
+}
+KINDS = tuple(FIELDS)
+
+CHECKPOINT_SELECT_SQL = text("SELECT rows_done, finished_at FROM import_checkpoint WHERE source = :source")
+CHECKPOINT_DELETE_SQL = text("DELETE FROM import_checkpoint WHERE source = :source")
+CHECKPOINT_SAVE_SQL = text(
+    "INSERT INTO import_checkpoint (source, rows_done, updated_at, finished_at) "
+    "VALUES (:source, :rows_done, :now, :finished_at) "
+    "ON CONFLICT(source) DO UPDATE SET rows_done = excluded.rows_done, "
+    "updated_at = excluded.updated_at, finished_at = excluded.finished_at"
+)
+
+# Review aggregates of just the stores a chunk of reviews touched
+STORE_RATING_REFRESH_SQL = text(STORE_RATING_REBUILD_SQL + "WHERE id IN :ids").bindparams(
+    bindparam('ids', expanding=True)
+)
+
+
+class BadRecord(ValueError):
+    """A record that can't be imported; the message names the file line."""
+
+
+def format_for(path, fmt=None):
+    """The explicit format, or the one implied by the file extension."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+        return fmt
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+class Progress:
+    """Rows-so-far and rate, rewritten in place on stderr."""
+
+    def __init__(self, label, stream=sys.stderr):
+        self.label = label
+        self.stream = stream
+        self.started = time.perf_counter()
+        # Rows already done before this run (a resumed import); not part of the rate
+        self.offset = 0
+
+    def update(self, rows, end=''):
+        elapsed = time.perf_counter() - self.started
+        rate = (rows - self.offset) / elapsed if elapsed else 0
+        self.stream.write(f"\r{self.label}: {rows:,} rows ({rate:,.0f}/s){end}")
+        self.stream.flush()
+
+    def done(self, rows):
+        self.update(rows, end='\n')
+
+
+# --- Export -----------------------------------------------------------------
+
+def _export_query(kind):
+    from app import Category, Product, StoreReview, User, db
+
+    if kind == 'categories':
+        return select(Category.name, Category.slug).order_by(Category.id)
+    if kind == 'users':
+        return select(*(getattr(User, name) for name in FIELDS['users'])).order_by(User.id)
+    if kind == 'products':
+        return (select(User.email, Category.slug, Product.title, Product.price, Product.quantity,
+                       Product.description, Product.image_filename, Product.image_thumb,
+                       Product.image_card, Product.created_at)
+                .join(User, User.id == Product.user_id)
+                .outerjoin(Category, Category.id == Product.category_id)
+                .order_by(Product.id))
+    reviewer = db.aliased(User)
+    return (select(User.email, reviewer.email, StoreReview.rating, StoreReview.review_text,
+                   StoreReview.created_at)
+            .join(User, User.id == StoreReview.store_owner_id)
+            .join(reviewer, reviewer.id == StoreReview.reviewer_id)
+            .order_by(StoreReview.id))
+
+
+def export_records(kind, chunk=CHUNK):
+    """Yield every record of `kind` as a dict, fetched from the database in chunks."""
+    from app import db
+
+    fields = FIELDS[kind]
+    rows = db.session.execute(_export_query(kind).execution_options(yield_per=chunk))
+    for row in rows:
+        yield {name: value.isoformat(sep=' ') if isinstance(value, datetime) else value
+               for name, value in zip(fields, row)}
+
+
+def export(kind, out, fmt='csv', progress=None, chunk=CHUNK):
+    """Write all records of `kind` to the text stream `out`; returns the row count."""
+    fields = FIELDS[kind]
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(record):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+    count = 0
+    for count, record in enumerate(export_records(kind, chunk), 1):
+        write(record)
+        if progress and count % chunk == 0:
+            progress.update(count)
+    if progress:
+        progress.done(count)
+    return count
+
+
+# --- Import -----------------------------------------------------------------
+
+def read_records(path, fmt):
+    """Yield (line number, record) from a CSV (with header) or JSON Lines file."""
+    if fmt == 'csv':
+        # utf-8-sig: spreadsheets often save CSV with a byte order mark
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        return
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise BadRecord(f"{path}, line {line_no}: invalid JSON ({e})") from None
+            if not isinstance(record, dict):
+                raise BadRecord(f"{path}, line {line_no}: expected a JSON object")
+            yield line_no, record
+
+
+def _text(record, name, required=False):
+    value = record.get(name)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    return value
+
+
+def _number(record, name, convert, default=None):
+    value = record.get(name)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}") from None
+
+
+def _timestamp(record, name, default):
+    value = _text(record, name)
+    if value is None:
+        return default
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date/time, got {value!r}") from None
+
+
+def _utcnow():
+    """Naive UTC, as stored by the models' datetime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _user_ids(con, emails):
+    """{email: (id, user_type)} for the emails that exist."""
+    from app import User
+
+    if not emails:
+        return {}
+    rows = con.execute(select(User.email, User.id, User.user_type).where(User.email.in_(emails)))
+    return {email: (user_id, user_type) for email, user_id, user_type in rows}
+
+
+class Importer:
+    """Turns one kind's records into INSERT parameters, a chunk at a time.
+
+    prepare() returns (params, errors) for a chunk of (line, record) pairs;
+    after_chunk() runs in the chunk's transaction once the rows are written
+    and returns the fragment cache tags the chunk made stale.
+    """
+
+    def __init__(self):
+        self.now = _utcnow()
+
+    def prepare(self, con, chunk):
+        params, errors = [], []
+        for line_no, record in chunk:
+            try:
+                params.append(self.row(record))
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+        return params, errors
+
+    def after_chunk(self, con, params):
+        return ()
+
+
+class CategoryImporter(Importer):
+    def statement(self):
+        from app import Category
+        return Category.__table__.insert().prefix_with('OR IGNORE')
+
+    def row(self, record):
+        return {'name': _text(record, 'name', required=True), 'slug': _text(record, 'slug', required=True)}
+
+
+class UserImporter(Importer):
+    def statement(self):
+        from app import User
+        return User.__table__.insert().prefix_with('OR IGNORE')
+
+    def row(self, record):
+        user_type = _text(record, 'user_type') or 'buyer'
+        if user_type not in ('buyer', 'seller'):
+            raise ValueError(f"user_type must be 'buyer' or 'seller', got {user_type!r}")
+        password_hash = _text(record, 'password_hash')
+        if password_hash is None:
+            password = _text(record, 'password')
+            if password is None:
+                raise ValueError("password_hash or password is required")
+            password_hash = generate_password_hash(password)
+        latitude = _number(record, 'store_latitude', float)
+        longitude = _number(record, 'store_longitude', float)
+        if latitude is not None and not -90 <= latitude <= 90:
+            raise ValueError("store_latitude must be between -90 and 90")
+        if longitude is not None and not -180 <= longitude <= 180:
+            raise ValueError("store_longitude must be between -180 and 180")
+        row = {name: _text(record, name) for name in FIELDS['users']}
+        row.update({
+            'email': _text(record, 'email', required=True),
+            'username': _text(record, 'username', required=True),
+            'user_type': user_type,
+            'password_hash': password_hash,
+            'store_latitude': latitude,
+            'store_longitude': longitude,
+            'store_review_count': 0,
+            'store_rating_sum': 0,
+        })
+        return row
+
+
+class ProductImporter(Importer):
+    # slug -> id, loaded with the first chunk
+    categories = None
+
+    def statement(self):
+        from app import Product
+        return Product.__table__.insert()
+
+    def prepare(self, con, chunk):
+        from app import Category
+
+        if self.categories is None:
+            self.categories = dict(con.execute(select(Category.slug, Category.id)).all())
+        self.sellers = _user_ids(con, {_text(r, 'seller_email') for _, r in chunk} - {None})
+        return super().prepare(con, chunk)
+
+    def row(self, record):
+        email = _text(record, 'seller_email', required=True)
+        seller = self.sellers.get(email)
+        if seller is None:
+            raise ValueError(f"no user with email {email!r}")
+        if seller[1] != 'seller':
+            raise ValueError(f"{email} is not a seller")
+        slug = _text(record, 'category_slug')
+        if slug is not None and slug not in self.categories:
+            raise ValueError(f"unknown category {slug!r}")
+        # Same rules as the post-product form
+        price = _number(record, 'price', float)
+        if price is None:
+            raise ValueError("price is required")
+        if price <= 0:
+            raise ValueError("price must be greater than 0")
+        quantity = _number(record, 'quantity', int, default=1)
+        if quantity <= 0:
+            raise ValueError("quantity must be greater than 0")
+        return {
+            'user_id': seller[0],
+            'category_id': self.categories.get(slug),
+            'title': _text(record, 'title', required=True),
+            'price': price,
+            'quantity': quantity,
+            'description': _text(record, 'description'),
+            'image_filename': _text(record, 'image_filename'),
+            'image_thumb': _text(record, 'image_thumb'),
+            'image_card': _text(record, 'image_card'),
+            'created_at': _timestamp(record, 'created_at', self.now),
+        }
+
+    def after_chunk(self, con, params):
+        return {f"store-activity:{row['user_id']}" for row in params}
+
+
+class ReviewImporter(Importer):
+    def statement(self):
+        from app import StoreReview
+
+        stmt = sqlite_insert(StoreReview.__table__)
+        return stmt.on_conflict_do_update(
+            index_elements=['store_owner_id', 'reviewer_id'],
+            set_={name: stmt.excluded[name] for name in ('rating', 'review_text', 'created_at')},
+        )
+
+    def prepare(self, con, chunk):
+        emails = set()
+        for _, record in chunk:
+            emails.update((_text(record, 'store_email'), _text(record, 'reviewer_email')))
+        self.users = _user_ids(con, emails - {None})
+        return super().prepare(con, chunk)
+
+    def row(self, record):
+        store_email = _text(record, 'store_email', required=True)
+        reviewer_email = _text(record, 'reviewer_email', required=True)
+        for email in (store_email, reviewer_email):
+            if email not in self.users:
+                raise ValueError(f"no user with email {email!r}")
+        if store_email == reviewer_email:
+            raise ValueError("a store can't review itself")
+        rating = _number(record, 'rating', int)
+        if rating is None or not 1 <= rating <= 5:
+            raise ValueError("rating must be between 1 and 5")
+        return {
+            'store_owner_id': self.users[store_email][0],
+            'reviewer_id': self.users[reviewer_email][0],
+            'rating': rating,
+            'review_text': _text(record, 'review_text'),
+            'created_at': _timestamp(record, 'created_at', self.now),
+        }
+
+    def after_chunk(self, con, params):
+        store_ids = sorted({row['store_owner_id'] for row in params})
+        con.execute(STORE_RATING_REFRESH_SQL, {'ids': store_ids})
+        return {f"store-activity:{store_id}" for store_id in store_ids}
+
+
+IMPORTERS = {
+    'categories': CategoryImporter,
+    'users': UserImporter,
+    'products': ProductImporter,
+    'reviews': ReviewImporter,
+}
+
+
+def import_file(kind, path, fmt=None, batch=CHUNK, restart=False, skip_invalid=False, progress=None, log=print):
+    """Import a CSV/JSONL file of `kind` records in batches; returns counters.
+
+    Raises BadRecord on the first invalid record unless skip_invalid, in
+    which case invalid records are logged and left out. Either way, the
+    batches committed before it stay imported and a rerun resumes after
+    them.
+    """
+    from app import db, fragment_cache
+
+    fmt = format_for(path, fmt)
+    source = f"{kind}:{os.path.abspath(path)}"
+    engine = db.engine
+    with engine.begin() as con:
+        if restart:
+            con.execute(CHECKPOINT_DELETE_SQL, {'source': source})
+        checkpoint = con.execute(CHECKPOINT_SELECT_SQL, {'source': source}).first()
+    importer = IMPORTERS[kind]()
+    statement = importer.statement()
+    stats = {'read': 0, 'written': 0, 'skipped': 0, 'invalid': 0, 'resumed_at': 0, 'already_done': False}
+    if checkpoint is not None:
+        if checkpoint.finished_at is not None:
+            stats['already_done'] = True
+            return stats
+        stats['resumed_at'] = checkpoint.rows_done
+        if progress:
+            progress.offset = checkpoint.rows_done
+
+    records = read_records(path, fmt)
+    done = stats['resumed_at']
+    for _ in islice(records, done):
+        pass
+    while True:
+        chunk = list(islice(records, batch))
+        if not chunk:
+            break
+        with engine.begin() as con:
+            params, errors = importer.prepare(con, chunk)
+            for line_no, message in errors:
+                if not skip_invalid:
+                    raise BadRecord(f"{path}, line {line_no}: {message}")
+                log(f"\nSkipping {path}, line {line_no}: {message}")
+            stale = ()
+            if params:
+                written = con.execute(statement, params).rowcount
+                stats['written'] += written
+                stats['skipped'] += len(params) - written
+                stale = importer.after_chunk(con, params)
+            done += len(chunk)
+            con.execute(CHECKPOINT_SAVE_SQL, {'source': source, 'rows_done': done,
+                                              'now': _utcnow(), 'finished_at': None})
+        stats['read'] += len(chunk)
+        stats['invalid'] += len(errors)
+        if stale:
+            # For a filesystem backend; memory backends follow the stamp
+            fragment_cache.invalidate(*stale)
+        if progress:
+            progress.update(done)
+
+    with engine.begin() as con:
+        now = _utcnow()
+        con.execute(CHECKPOINT_SAVE_SQL, {'source': source, 'rows_done': done, 'now': now, 'finished_at': now})
+    if progress:
+        progress.done(done)
+    return stats
@@ -0,0 +1,116 @@
+"""
+Small in-process caching helpers for the Amcho Pasro app.
+
+LRUCache is a thread-safe, size-bounded mapping with an optional per-entry
+time-to-live. It is per worker process: anything that must stay coherent
+across workers should also be invalidated through the database.
+
+VersionedValue holds one computed value (e.g. the category taxonomy) and
+rebuilds it when a version stamp kept in the database changes, which is
+how every worker notices a change made by another one.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL (seconds) and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionedValue:
+    """A shared computed value, rebuilt when its version stamp changes.
+
+    `load()` builds the value and `version()` returns a cheap stamp (a
+    counter bumped by database triggers, or None when unavailable). The
+    stamp is only checked every `check_interval` seconds, so reads in
+    between cost nothing and changes made by other workers show up within
+    the interval. invalidate() forces a rebuild on the next read; call it
+    after this process changes the underlying data.
+    """
+
+    def __init__(self, load, version, check_interval=30):
+        self.load = load
+        self.version = version
+        self.check_interval = check_interval
+        self.hits = 0
+        self.loads = 0
+        self._value = _MISSING
+        self._stamp = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not _MISSING and now < self._next_check:
+                self.hits += 1
+                return self._value
+            stamp = self.version()
+            if self._value is _MISSING or stamp is None or stamp != self._stamp:
+                # Read the stamp first: a change racing the load triggers another reload
+                self._value = self.load()
+                self._stamp = stamp
+                self.loads += 1
+            else:
+                self.hits += 1
+            self._next_check = now + self.check_interval
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = _MISSING
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "loads": self.loads, "version": self._stamp}
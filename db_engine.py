@@ -0,0 +1,78 @@
+"""
+SQLite engine profiles for the Amcho Pasro database.
+
+A profile is a set of PRAGMAs applied to every new DB-API connection plus
+SQLAlchemy pool options. The active profile is chosen with the
+SQLITE_PROFILE environment variable (default: "production").
+
+  production  WAL journal so readers never block on a writer, NORMAL sync
+              (durable across app crashes, only the last transactions can be
+              lost on power failure), a busy timeout instead of instant
+              "database is locked", a 256MB mmap window, 64MB page cache and
+              in-memory temp tables.
+  development same as production without the large mmap window.
+  legacy      SQLite defaults (rollback journal, FULL sync); useful as a
+              baseline for benchmarks.
+"""
+
+import os
+
+from sqlalchemy import event
+
+SQLITE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,         # ms to wait for a lock before failing
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,     # negative = KiB, i.e. 64MB per connection
+        'temp_store': 'MEMORY',
+    },
+    'development': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    'legacy': {},
+}
+
+# Pool sizing for threaded workers: one connection per request thread, with
+# headroom for background threads (image processing) before callers queue.
+POOL_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 10,
+    'pool_timeout': 10,
+    # Connections are only used by one thread at a time via the pool
+    'connect_args': {'check_same_thread': False, 'timeout': 5},
+}
+
+
+def current_profile():
+    return os.environ.get('SQLITE_PROFILE', 'production')
+
+
+def engine_options(profile=None):
+    """SQLAlchemy engine options for a profile (SQLALCHEMY_ENGINE_OPTIONS)."""
+    profile = profile or current_profile()
+    if profile == 'legacy':
+        return {}
+    return {key: (dict(value) if isinstance(value, dict) else value)
+            for key, value in POOL_OPTIONS.items()}
+
+
+def install_pragmas(engine, profile=None):
+    """Apply the profile's PRAGMAs on every new connection of `engine`."""
+    pragmas = SQLITE_PROFILES[profile or current_profile()]
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
@@ -4,10 +4,23 @@ Database management script for Amcho Pasro Flask app
 Usage: python db_manager.py [command]
 
 Commands:
+  migrate [--status] - Apply pending schema migrations (or list them)
   list_users    - List all users in the database
   create_user   - Create a new user (interactive)
   delete_user   - Delete a user by email
   reset_db      - Delete all data and recreate tables
+  rebuild_store_ratings - Recompute store review aggregates from reviews
+  verify_store_ratings  - Report stores whose review aggregates have drifted
+  gc_uploads [--dry-run] - Delete uploaded files no product or store references
+  check_query_plans     - EXPLAIN the hot queries and fail on full scans/sorts
+  profile_report [--endpoint NAME] [--top N] [--output FILE] [--clear]
+                        - Merge sampled request profiles (PROFILE_DIR) into one report;
+                          --output writes the merged collapsed stacks for a flamegraph
+  export KIND [--format csv|jsonl] [--output FILE]
+                        - Stream categories, users, products or reviews to a file (or stdout)
+  import KIND FILE [--format csv|jsonl] [--batch N] [--skip-invalid] [--restart]
+                        - Bulk import a CSV/JSONL file in batches; an interrupted import
+                          resumes where it stopped when run again (see bulk_io.py)
 """
 
 import sys
@@ -17,51 +30,36 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from werkzeug.security import generate_password_hash
+from sqlalchemy import text
 
-# Import Flask app components
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin
-
-# Recreate app context for database operations
-app = Flask(__name__)
-# Use instance folder DB like the app
-os.makedirs(app.instance_path, exist_ok=True)
-db_path = os.path.join(app.instance_path, 'amcho_pasro.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-
-    def __repr__(self):
-        return f'<User {self.email}>'
-
-    @staticmethod
-    def get(user_id):
-        return User.query.get(int(user_id))
-
-    @staticmethod
-    def get_by_email(email):
-        return User.query.filter_by(email=email).first()
+from uploads import collect_garbage, is_content_path
+from migrations import (
+    LATEST_VERSION, STORE_RATING_REBUILD_SQL, adopt_legacy_database, migrate as run_migrations,
+    pending_migrations,
+)
+from app import create_app, db, User
+
+# Same configuration and models as the web app
+app = create_app()
 
 def list_users():
     """List all users in the database"""
     with app.app_context():
-        users = User.query.all()
-        if not users:
+        # Streamed in chunks rather than loading every User at once
+        rows = db.session.execute(
+            db.select(User.id, User.username, User.email).order_by(User.id).execution_options(yield_per=1000)
+        )
+        total = 0
+        for user in rows:
+            if not total:
+                print(f"\n{'ID':<5} {'Username':<20} {'Email':<30}")
+                print("-" * 55)
+            print(f"{user.id:<5} {user.username:<20} {user.email:<30}")
+            total += 1
+        if not total:
             print("No users found in database.")
             return
-        
-        print(f"\n{'ID':<5} {'Username':<20} {'Email':<30}")
-        print("-" * 55)
-        for user in users:
-            print(f"{user.id:<5} {user.username:<20} {user.email:<30}")
-        print(f"\nTotal users: {len(users)}")
+        print(f"\nTotal users: {total}")
 
 def create_user():
     """Create a new user interactively"""
@@ -119,10 +117,205 @@ def reset_db():
             print("Reset cancelled.")
             return
         
+        with db.engine.begin() as con:
+            for name in ('product_fts', 'store_geo', 'cache_version', 'import_checkpoint', 'schema_version'):
+                con.execute(text(f"DROP TABLE IF EXISTS {name}"))
         db.drop_all()
-        db.create_all()
+        run_migrations(db.engine, db.metadata, log=lambda _msg: None)
         print("Success: Database reset. All tables recreated.")
 
+STORE_RATING_DRIFT_SQL = """
+SELECT u.id, u.store_name, u.store_review_count, u.store_rating_sum,
+       COUNT(r.id) AS actual_count, COALESCE(SUM(r.rating), 0) AS actual_sum
+FROM user u LEFT JOIN store_review r ON r.store_owner_id = u.id
+GROUP BY u.id
+HAVING u.store_review_count != COUNT(r.id) OR u.store_rating_sum != COALESCE(SUM(r.rating), 0)
+"""
+
+def migrate():
+    """Apply pending schema migrations, or show them with --status"""
+    with app.app_context():
+        engine = db.engine
+        if '--status' in sys.argv:
+            pending = pending_migrations(engine)
+            print(f"Latest schema version: {LATEST_VERSION}, {len(pending)} migration(s) pending.")
+            for step_version, name in pending:
+                print(f"  {step_version}: {name}")
+            return
+        db_path = app.config['DATABASE_PATH']
+        copied = adopt_legacy_database(app.instance_path, db_path)
+        if copied:
+            print(f"Copied legacy database {copied} -> {db_path}")
+        version = run_migrations(engine, db.metadata)
+        print(f"Success: Schema is at version {version}.")
+
+def rebuild_store_ratings():
+    """Recompute store review aggregates from the review table"""
+    with app.app_context():
+        result = db.session.execute(text(STORE_RATING_REBUILD_SQL))
+        db.session.commit()
+        print(f"Success: Rebuilt review aggregates for {result.rowcount} users.")
+
+def verify_store_ratings():
+    """Report stores whose review aggregates don't match their reviews"""
+    with app.app_context():
+        drifted = db.session.execute(text(STORE_RATING_DRIFT_SQL)).fetchall()
+        if not drifted:
+            print("OK: All store review aggregates match their reviews.")
+            return
+
+        print(f"\n{'ID':<5} {'Store':<25} {'Count':>12} {'Rating sum':>14}")
+        print("-" * 60)
+        for row in drifted:
+            count = f"{row.store_review_count}->{row.actual_count}"
+            total = f"{row.store_rating_sum}->{row.actual_sum}"
+            print(f"{row.id:<5} {(row.store_name or '-'):<25} {count:>12} {total:>14}")
+        print(f"\n{len(drifted)} store(s) drifted. Run 'rebuild_store_ratings' to fix.")
+        sys.exit(1)
+
+# Reference counts for stored uploads; variants are kept alongside their source
+UPLOAD_REFCOUNT_SQL = """
+SELECT path, COUNT(*) AS refs FROM (
+    SELECT image_filename AS path FROM product
+    UNION ALL
+    SELECT store_image AS path FROM user
+) WHERE path IS NOT NULL GROUP BY path
+"""
+
+def gc_uploads():
+    """Delete content-addressed uploads that no product or store references"""
+    dry_run = '--dry-run' in sys.argv
+    with app.app_context():
+        refcounts = {row.path: row.refs for row in db.session.execute(text(UPLOAD_REFCOUNT_SQL))}
+    referenced = {path for path in refcounts if is_content_path(path)}
+    shared = sum(1 for path in referenced if refcounts[path] > 1)
+    print(f"{len(referenced)} stored files referenced ({shared} shared by several rows).")
+    removed, freed = collect_garbage(app.config['UPLOAD_FOLDER'], referenced, dry_run=dry_run)
+    verb = "Would remove" if dry_run else "Removed"
+    print(f"{verb} {removed} orphaned file(s), {freed / 1024 / 1024:.1f} MB.")
+
+def check_query_plans():
+    """EXPLAIN every hot query and exit non-zero if one regressed"""
+    from query_plans import check_query_plans as run_checks
+
+    failed = 0
+    for name, details, problems in run_checks(app):
+        print(f"{'FAIL' if problems else 'ok':<5} {name}")
+        for detail in details:
+            marker = '!!' if detail in problems else '  '
+            print(f"      {marker} {detail}")
+        failed += bool(problems)
+    if failed:
+        print(f"\n{failed} query plan(s) regressed. Add or fix an index.")
+        sys.exit(1)
+    print("\nOK: All hot queries use an index.")
+
+def _option(name, default=None):
+    """Value following `name` on the command line, e.g. --top 20"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+def profile_report():
+    """Aggregate the profiler's dumps into a hot-frame report and flamegraph input"""
+    import pstats
+    from profiling import dump_files, hot_frames, merge_stacks
+
+    directory = app.config['PROFILE_DIR']
+    top = int(_option('--top', 25))
+    stack_files, pstats_files = dump_files(directory, _option('--endpoint'))
+    if not stack_files and not pstats_files:
+        print(f"No profiles in {directory}. Set PROFILE_SAMPLE_RATE to start sampling.")
+        return
+
+    if stack_files:
+        stacks = merge_stacks(stack_files)
+        samples = sum(stacks.values())
+        print(f"{len(stack_files)} sampled request(s), {samples} stack samples.\n")
+        print(f"{'Self %':>7} {'Total %':>8}  Frame")
+        print("-" * 70)
+        for frame, self_count, total_count in hot_frames(stacks, top):
+            print(f"{self_count / samples * 100:>7.1f} {total_count / samples * 100:>8.1f}  {frame}")
+        output = _option('--output')
+        if output:
+            with open(output, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"\nWrote merged stacks to {output} (flamegraph.pl {output} > flame.svg, or open in speedscope)")
+
+    if pstats_files:
+        print(f"\n{len(pstats_files)} cProfile dump(s), by cumulative time:")
+        stats = pstats.Stats(*pstats_files)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(top)
+
+    if '--clear' in sys.argv:
+        for path in stack_files + pstats_files:
+            os.remove(path)
+        print(f"Removed {len(stack_files) + len(pstats_files)} dump(s).")
+
+def _kind_argument():
+    from bulk_io import KINDS
+
+    kind = sys.argv[2] if len(sys.argv) > 2 else None
+    if kind not in KINDS:
+        print(f"Error: Give one of {', '.join(KINDS)}.")
+        sys.exit(1)
+    return kind
+
+def _require_migrated():
+    if pending_migrations(db.engine):
+        print("Error: The database schema is out of date. Run 'python db_manager.py migrate' first.")
+        sys.exit(1)
+
+def export_data():
+    """Stream one kind of catalogue data to CSV/JSONL"""
+    from bulk_io import Progress, export, format_for
+
+    kind = _kind_argument()
+    output = _option('--output')
+    fmt = format_for(output or '', _option('--format'))
+    with app.app_context():
+        _require_migrated()
+        if output:
+            with open(output, 'w', newline='', encoding='utf-8') as out:
+                count = export(kind, out, fmt, Progress(f"Exporting {kind}"))
+            print(f"Success: Exported {count} {kind} to {output}.")
+        else:
+            # Data on stdout, progress on stderr
+            export(kind, sys.stdout, fmt, Progress(f"Exporting {kind}"))
+
+def import_data():
+    """Bulk import one kind of catalogue data from CSV/JSONL, resumably"""
+    from bulk_io import BadRecord, Progress, import_file
+
+    kind = _kind_argument()
+    if len(sys.argv) < 4 or not os.path.isfile(sys.argv[3]):
+        print("Error: Give the file to import, e.g. import products listings.csv")
+        sys.exit(1)
+    path = sys.argv[3]
+    with app.app_context():
+        _require_migrated()
+        try:
+            stats = import_file(
+                kind, path, fmt=_option('--format'), batch=int(_option('--batch', 5000)),
+                restart='--restart' in sys.argv, skip_invalid='--skip-invalid' in sys.argv,
+                progress=Progress(f"Importing {kind}"),
+            )
+        except BadRecord as e:
+            print(f"\nError: {e}")
+            print("Batches before it were imported. Fix the row (or use --skip-invalid) and run "
+                  "the same command again to resume.")
+            sys.exit(1)
+    if stats['already_done']:
+        print(f"{path} was already imported completely. Use --restart to import it again.")
+        return
+    if stats['resumed_at']:
+        print(f"Resumed after row {stats['resumed_at']}.")
+    print(f"Success: {stats['written']} {kind} written, {stats['skipped']} already present, "
+          f"{stats['invalid']} invalid row(s) skipped.")
+
 def show_help():
     """Show help message"""
     print(__doc__)
@@ -135,10 +328,18 @@ def main():
     command = sys.argv[1].lower()
     
     commands = {
+        'migrate': migrate,
         'list_users': list_users,
         'create_user': create_user,
         'delete_user': delete_user,
         'reset_db': reset_db,
+        'rebuild_store_ratings': rebuild_store_ratings,
+        'verify_store_ratings': verify_store_ratings,
+        'gc_uploads': gc_uploads,
+        'check_query_plans': check_query_plans,
+        'profile_report': profile_report,
+        'export': export_data,
+        'import': import_data,
         'help': show_help
     }
     
@@ -0,0 +1,314 @@
+"""
+Fragment and page caching for rendered templates.
+
+Pages like the store page or product detail are mostly shared markup
+(product cards, the store hero) around a few per-viewer bits (owner
+controls, the viewer's own review, flash messages). FragmentCache stores
+the shared pieces as rendered HTML so a hot store doesn't re-render them
+for every visitor; `cached_page` does the same for whole anonymous pages.
+
+Invalidation is by tag. Every entry is stored under its key plus the
+current generation of each of its tags (e.g. "product:12", "store:3"),
+and invalidate(tag) just starts a new generation, so all entries carrying
+that tag stop matching at once and age out of the backend. Entries also
+expire after FRAGMENT_CACHE_TTL as a bound on anything not tagged.
+
+Tag generations live in the backend, so with the memory backend an
+invalidation is only seen by the worker that made it. Database triggers
+(migration 13) therefore also bump a shared stamp, the 'fragments' row of
+`cache_version`, on every product, review, category or store write, from
+any process. Each request reads the stamp once and memory-backend entries
+are keyed by it, so a write anywhere retires every worker's entries.
+
+Backends (FRAGMENT_CACHE_BACKEND):
+  memory      per-worker LRU; other workers' writes drop the whole cache
+              through the shared stamp
+  filesystem  files under FRAGMENT_CACHE_DIR shared by every worker on the
+              host, so invalidations are seen everywhere immediately
+  null        caching disabled
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from secrets import token_hex
+
+from flask import current_app, g, has_request_context, request
+from markupsafe import Markup
+
+from cache import LRUCache
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend:
+    """Per-worker LRU. A ttl of 0 stores the entry without expiry."""
+
+    def __init__(self, maxsize=2048, ttl=None):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(key, value, ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class FileSystemBackend:
+    """One pickled file per entry, written atomically, shared across workers.
+
+    Expired files are removed when read and by a sweep every
+    `sweep_every` writes. A ttl of 0 stores the entry without expiry.
+    """
+
+    def __init__(self, directory, ttl=None, sweep_every=1000):
+        self.directory = directory
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else None
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            self._remove(tmp)
+            return
+        self._writes += 1
+        if self.sweep_every and self._writes % self.sweep_every == 0:
+            self.sweep()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    def sweep(self):
+        """Remove expired entries and stale temp files."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-'):
+                try:
+                    if os.path.getmtime(path) < now - 60:
+                        self._remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    expires, _value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if expires is not None and expires < now:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class FragmentCache:
+    """Tag-invalidated cache of rendered HTML.
+
+    Configured per app from its config in init_app():
+      FRAGMENT_CACHE_BACKEND  'memory', 'filesystem' or 'null'
+      FRAGMENT_CACHE_TTL      lifetime of an entry (seconds)
+      FRAGMENT_CACHE_SIZE     entries kept per worker (memory backend)
+      FRAGMENT_CACHE_DIR      directory of the filesystem backend
+
+    `version()`, when given, returns the shared stamp (or None when
+    unavailable). It is read once per request, and entries of a per-worker
+    backend are keyed by it as well as by the deploy.
+    """
+
+    def __init__(self, app=None, version=None):
+        self.version = version
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+        kind = app.config.get('FRAGMENT_CACHE_BACKEND', 'memory')
+        if kind == 'memory':
+            backend = MemoryBackend(app.config.get('FRAGMENT_CACHE_SIZE', 2048), ttl)
+        elif kind == 'filesystem':
+            backend = FileSystemBackend(app.config['FRAGMENT_CACHE_DIR'], ttl)
+        elif kind == 'null':
+            backend = NullBackend()
+        else:
+            raise ValueError(f"Unknown FRAGMENT_CACHE_BACKEND {kind!r}")
+        # Entries rendered by an older deploy's templates must not be served
+        namespace = app.config.get('TEMPLATES_STAMP') or templates_stamp(app)
+        app.extensions['fragment_cache'] = _CacheState(backend, namespace)
+
+    @property
+    def _state(self):
+        return current_app.extensions['fragment_cache']
+
+    @property
+    def backend(self):
+        return self._state.backend
+
+    def stamp(self):
+        """The shared version stamp, read at most once per request."""
+        if self.version is None:
+            return None
+        if not has_request_context():
+            return self.version()
+        if '_fragment_stamp' not in g:
+            g._fragment_stamp = self.version()
+        return g._fragment_stamp
+
+    def _namespace(self, state):
+        if isinstance(state.backend, MemoryBackend):
+            # Only the stamp tells a worker about writes made by the others
+            stamp = self.stamp()
+            if stamp is not None:
+                return f"{state.namespace}.{stamp}"
+        return state.namespace
+
+    def _generation(self, backend, tag):
+        key = f"tag:{tag}"
+        generation = backend.get(key)
+        if generation is None:
+            # A lost generation (evicted, new worker) only invalidates its entries
+            generation = token_hex(4)
+            backend.set(key, generation, ttl=0)
+        return generation
+
+    def _entry_key(self, state, key, tags):
+        generations = ','.join(self._generation(state.backend, tag) for tag in tags)
+        return f"{self._namespace(state)}|{key}|{generations}"
+
+    def get_or_render(self, key, tags, render):
+        """Return the cached value for key, calling render() on a miss."""
+        state = self._state
+        entry_key = self._entry_key(state, key, tags)
+        value = state.backend.get(entry_key)
+        if value is not None:
+            state.hits += 1
+            return value
+        state.misses += 1
+        value = render()
+        state.backend.set(entry_key, value)
+        return value
+
+    def fragment(self, key, tags, render):
+        """Cached template fragment: render() returns HTML, the result is Markup."""
+        return Markup(self.get_or_render(key, tags, lambda: str(render())))
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying one of `tags`."""
+        backend = self.backend
+        for tag in tags:
+            backend.set(f"tag:{tag}", token_hex(4), ttl=0)
+
+    def clear(self):
+        self.backend.clear()
+
+    def cached_page(self, tags=(), unless=None):
+        """Cache a view's whole 200 response for GET requests.
+
+        Keyed by endpoint and query string. `unless()` returning True (for
+        instance for logged-in viewers or pending flash messages) renders
+        the page normally without touching the cache.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or (unless is not None and unless()):
+                    return view(*args, **kwargs)
+                state = self._state
+                key = f"page:{request.endpoint}:{sorted(request.args.items(multi=True))}"
+                entry_key = self._entry_key(state, key, tags)
+                cached = state.backend.get(entry_key)
+                if cached is not None:
+                    state.hits += 1
+                    body, mimetype = cached
+                    return current_app.response_class(body, mimetype=mimetype)
+                state.misses += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    state.backend.set(entry_key, (response.get_data(), response.mimetype))
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        state = self._state
+        return {
+            "backend": type(state.backend).__name__,
+            "hits": state.hits,
+            "misses": state.misses,
+        }
+
+
+class _CacheState:
+    """One app's backend, deploy namespace and counters."""
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+
+def templates_stamp(app):
+    """Short hash of the template files' mtimes."""
+    folder = os.path.join(app.root_path, app.template_folder or 'templates')
+    digest = hashlib.sha1()
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            try:
+                mtime = os.path.getmtime(os.path.join(root, name))
+            except OSError:
+                continue
+            digest.update(f"{name}:{mtime}".encode('utf-8'))
+    return digest.hexdigest()[:8]
@@ -0,0 +1,376 @@
+"""
+Caching client for the Nominatim geocoding proxy endpoints.
+
+Lookups go through two cache tiers before touching the network: a per-worker
+in-memory LRU and a SQLite file shared by all workers on the host (entries
+expire after a TTL). Upstream calls reuse a pooled requests.Session.
+
+Search results are keyed on the normalized query text and limit; reverse
+lookups are keyed on lat/lon rounded to GEOCODE_REVERSE_PRECISION decimals
+(4 decimals is roughly 11 m), so a dragged marker hits the cache.
+
+Cache misses are coalesced: concurrent requests for the same key wait for a
+single upstream fetch. Upstream calls are also metered by a token bucket to
+respect the Nominatim 1 request/second policy. The bucket lives in the
+shared SQLite file, so every worker and the async service
+(geocode_service.py) on the host draw from one budget. When it is empty (or
+the upstream fails) an expired cache entry is served if one exists,
+otherwise the caller gets an immediate 429 instead of queueing.
+
+`requests`, the cache file and the HTTP session are only set up on the
+first lookup, so workers that never geocode don't pay for them.
+
+These lookups block the calling thread for as long as the upstream takes;
+geocode_service.py serves the same endpoints from an asyncio event loop,
+so slow Nominatim answers don't tie up the app's worker threads.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from cache import LRUCache
+
+
+class GeocodeCache:
+    """In-memory LRU in front of a SQLite key/value table with expiry.
+
+    Expired rows stay available to get(allow_stale=True) for another `ttl`;
+    every `purge_every` writes, rows past that are deleted.
+    """
+
+    def __init__(self, path, ttl, memory_size=2048, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+        return con
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def _count(self, tier=None):
+        with self._counter_lock:
+            if tier is None:
+                self.misses += 1
+            else:
+                self.hits[tier] += 1
+
+    def get(self, key, allow_stale=False):
+        """Return the cached payload for key, or None.
+
+        With allow_stale the SQLite tier also returns expired entries, which
+        callers can serve when the upstream is unavailable.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory")
+            return value
+        try:
+            row = self._execute(
+                "SELECT payload, expires_at FROM geocode_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row and (allow_stale or row[1] >= time.time()):
+            value = json.loads(row[0])
+            remaining = row[1] - time.time()
+            if remaining > 0:
+                self.memory.set(key, value, ttl=remaining)
+            self._count("disk")
+            return value
+        self._count()
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        try:
+            self._execute(
+                "INSERT OR REPLACE INTO geocode_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl),
+            )
+        except sqlite3.Error:
+            # The disk tier is best-effort; the memory tier still has the entry
+            return
+        with self._counter_lock:
+            self._writes += 1
+            purge = self.purge_every and self._writes % self.purge_every == 0
+        if purge:
+            try:
+                self.purge_expired(older_than=self.ttl)
+            except sqlite3.Error:
+                pass
+
+    def purge_expired(self, older_than=0):
+        """Delete rows expired more than `older_than` seconds ago; returns the number removed."""
+        return self._execute(
+            "DELETE FROM geocode_cache WHERE expires_at < ?", (time.time() - older_than,)
+        ).rowcount
+
+    def take_token(self, name, rate, capacity):
+        """Take a token from the named bucket shared by every process using this file.
+
+        The bucket refills at `rate` tokens per second up to `capacity`.
+        Returns False when it is empty, or when the file is locked or
+        unavailable: without the meter, the upstream isn't called.
+        """
+        con = self._connection()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                row = con.execute("SELECT tokens, updated_at FROM rate_limit WHERE name = ?", (name,)).fetchone()
+                now = time.time()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                granted = tokens >= 1
+                con.execute(
+                    "INSERT OR REPLACE INTO rate_limit (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (name, tokens - 1 if granted else tokens, now),
+                )
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            return False
+        return granted
+
+    def stats(self):
+        with self._counter_lock:
+            hits = dict(self.hits)
+            misses = self.misses
+        total = hits["memory"] + hits["disk"] + misses
+        return {
+            "hits_memory": hits["memory"],
+            "hits_disk": hits["disk"],
+            "misses": misses,
+            "hit_ratio": round((hits["memory"] + hits["disk"]) / total, 3) if total else None,
+            "memory_entries": len(self.memory),
+        }
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn, wait_timeout=None):
+        """Run fn() once per key at a time; followers get the leader's result.
+
+        Followers that wait longer than wait_timeout get None.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call["done"].wait(wait_timeout)
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
+
+
+class Geocoder:
+    """Nominatim client with caching and a pooled HTTP session.
+
+    Configured from the Flask app config in init_app():
+      NOMINATIM_URL              base URL (point at a local stub in tests)
+      NOMINATIM_USER_AGENT       UA string required by the Nominatim policy
+      GEOCODE_TIMEOUT            (connect, read) timeout in seconds
+      GEOCODE_CACHE_PATH         SQLite file for the shared cache tier
+      GEOCODE_CACHE_TTL          entry lifetime in seconds
+      GEOCODE_REVERSE_PRECISION  decimals kept when keying reverse lookups
+      GEOCODE_RATE_LIMIT         upstream requests per second, shared by all
+                                 processes using GEOCODE_CACHE_PATH
+      GEOCODE_RATE_BURST         token bucket capacity
+
+    `on_upstream(seconds)`, when set, is called with the time each lookup
+    that missed the cache spent on (or waiting for) the upstream.
+    """
+
+    def __init__(self, app=None):
+        self.cache = None
+        self.session = None
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.rate_limited = 0
+        self.stale_served = 0
+        self.flights = SingleFlight()
+        self.on_upstream = None
+        self._setup_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.base_url = app.config["NOMINATIM_URL"].rstrip("/")
+        self.user_agent = app.config["NOMINATIM_USER_AGENT"]
+        self.timeout = app.config["GEOCODE_TIMEOUT"]
+        self.precision = app.config["GEOCODE_REVERSE_PRECISION"]
+        self.cache_path = app.config["GEOCODE_CACHE_PATH"]
+        self.cache_ttl = app.config["GEOCODE_CACHE_TTL"]
+        self.rate_limit = app.config["GEOCODE_RATE_LIMIT"]
+        self.rate_burst = app.config["GEOCODE_RATE_BURST"]
+        self.cache = None
+        self.session = None
+        app.extensions["geocoder"] = self
+
+    def _ensure_cache(self):
+        if self.cache is None:
+            with self._setup_lock:
+                if self.cache is None:
+                    self.cache = GeocodeCache(self.cache_path, self.cache_ttl)
+
+    def _ensure_ready(self):
+        """Open the cache and the pooled HTTP session on first use."""
+        if self.session is not None:
+            return
+        self._ensure_cache()
+        with self._setup_lock:
+            if self.session is not None:
+                return
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                # Provide a valid UA as required by Nominatim policy
+                "User-Agent": self.user_agent,
+                "Accept": "application/json",
+            })
+            self.session = session
+
+    @staticmethod
+    def normalize_query(q):
+        return re.sub(r"\s+", " ", q.strip().lower())
+
+    def search_key(self, q, limit):
+        return f"search:{limit}:{self.normalize_query(q)}"
+
+    def reverse_key(self, lat, lon):
+        return f"reverse:{round(lat, self.precision)}:{round(lon, self.precision)}"
+
+    def _fetch(self, path, params):
+        """Call the upstream; returns (status, payload or None)."""
+        import requests
+
+        self.upstream_calls += 1
+        try:
+            resp = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+        except requests.RequestException:
+            self.upstream_errors += 1
+            return 502, None
+        if resp.status_code != 200:
+            self.upstream_errors += 1
+            return resp.status_code, None
+        try:
+            return 200, resp.json()
+        except ValueError:
+            self.upstream_errors += 1
+            return 502, None
+
+    def take_token(self):
+        """One upstream call's worth of the host-wide Nominatim budget."""
+        return self.cache.take_token("nominatim", self.rate_limit, self.rate_burst)
+
+    def _settle(self, key, status, payload):
+        """Cache a fresh upstream answer, or fall back to stale cache data."""
+        if status == 200:
+            self.cache.set(key, payload)
+            return status, payload
+        stale = self.cache.get(key, allow_stale=True)
+        if stale is not None:
+            self.stale_served += 1
+            return 200, stale
+        return status, payload
+
+    def _fetch_or_stale(self, key, path, params):
+        """Upstream fetch under the rate limit, degrading to stale cache data."""
+        if self.take_token():
+            status, payload = self._fetch(path, params)
+        else:
+            self.rate_limited += 1
+            status, payload = 429, None
+        return self._settle(key, status, payload)
+
+    def _lookup(self, key, path, params):
+        self._ensure_ready()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return 200, cached
+        read_timeout = self.timeout[1] if isinstance(self.timeout, tuple) else self.timeout
+        started = time.perf_counter()
+        result = self.flights.do(
+            key, lambda: self._fetch_or_stale(key, path, params), wait_timeout=read_timeout
+        )
+        if self.on_upstream is not None:
+            self.on_upstream(time.perf_counter() - started)
+        # A follower whose leader overran the timeout gets no result
+        return result if result is not None else (504, None)
+
+    def search_request(self, q, limit=8):
+        """(cache key, upstream path, query params) of a forward lookup."""
+        params = {"q": q, "format": "jsonv2", "limit": limit, "addressdetails": 1}
+        return self.search_key(q, limit), "search", params
+
+    def reverse_request(self, lat, lon):
+        """(cache key, upstream path, query params) of a reverse lookup."""
+        lat = round(lat, self.precision)
+        lon = round(lon, self.precision)
+        params = {"format": "jsonv2", "lat": lat, "lon": lon, "zoom": 14, "addressdetails": 1}
+        return self.reverse_key(lat, lon), "reverse", params
+
+    def search(self, q, limit=8):
+        """Forward geocode free text; returns (status, payload)."""
+        return self._lookup(*self.search_request(q, limit))
+
+    def reverse(self, lat, lon):
+        """Reverse geocode a coordinate; returns (status, payload)."""
+        return self._lookup(*self.reverse_request(lat, lon))
+
+    def stats(self):
+        self._ensure_cache()
+        stats = self.cache.stats()
+        stats.update({
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "coalesced": self.flights.coalesced,
+            "rate_limited": self.rate_limited,
+            "stale_served": self.stale_served,
+        })
+        return stats
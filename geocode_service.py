@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Async geocoding service: the /api/geocode/* proxy endpoints on an event loop.
+
+The Flask views in app.py call Nominatim synchronously, so every lookup
+that misses the cache holds one of the app's worker threads until the
+upstream answers. A burst of slow upstream responses can then starve the
+pool that also serves /products. This small aiohttp app serves the same two
+endpoints, with the same cache, rate limit and responses, from one event
+loop: a slow upstream costs an open socket, not a worker thread.
+
+It runs next to the app and reads the app's config:
+
+    python geocode_service.py [--host 127.0.0.1] [--port 5001]
+
+Route /api/geocode/ to it in the reverse proxy, or set GEOCODE_SERVICE_URL
+(plus GEOCODE_SERVICE_CORS_ORIGIN when it runs on another origin) so the
+store finder calls it directly. The Flask views stay as the fallback when
+it isn't deployed.
+
+Upstream calls share one aiohttp session with at most
+GEOCODE_SERVICE_CONNECTIONS connections and GEOCODE_SERVICE_TIMEOUT
+(connect, read) timeouts. Cache reads and writes are SQLite calls and run
+in the default thread pool, off the event loop.
+"""
+
+import argparse
+import asyncio
+import json
+
+from werkzeug.http import generate_etag, parse_etags
+
+from geocode import Geocoder
+
+
+class AsyncGeocoder(Geocoder):
+    """Geocoder whose upstream calls are made with aiohttp.
+
+    Besides the Geocoder settings it reads GEOCODE_SERVICE_TIMEOUT and
+    GEOCODE_SERVICE_CONNECTIONS. start() and close() must run on the event
+    loop that serves the lookups.
+    """
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.service_timeout = app.config["GEOCODE_SERVICE_TIMEOUT"]
+        self.max_connections = app.config["GEOCODE_SERVICE_CONNECTIONS"]
+        self.http = None
+        self._inflight = {}
+
+    async def start(self):
+        import aiohttp
+
+        connect, read = self.service_timeout
+        self._ensure_cache()
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=connect + read, sock_connect=connect, sock_read=read),
+            headers={"User-Agent": self.user_agent, "Accept": "application/json"},
+        )
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    async def _fetch_async(self, path, params):
+        """Call the upstream; returns (status, payload or None)."""
+        import aiohttp
+
+        self.upstream_calls += 1
+        try:
+            async with self.http.get(f"{self.base_url}/{path}", params=params) as resp:
+                if resp.status != 200:
+                    self.upstream_errors += 1
+                    return resp.status, None
+                return 200, await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.upstream_errors += 1
+            return 502, None
+
+    async def _fetch_or_stale_async(self, key, path, params):
+        loop = asyncio.get_running_loop()
+        # The shared bucket is a SQLite write: off the event loop like the cache
+        if await loop.run_in_executor(None, self.take_token):
+            status, payload = await self._fetch_async(path, params)
+        else:
+            self.rate_limited += 1
+            status, payload = 429, None
+        return await loop.run_in_executor(None, self._settle, key, status, payload)
+
+    async def lookup(self, key, path, params):
+        """Async counterpart of Geocoder._lookup(); returns (status, payload)."""
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self.cache.get, key)
+        if cached is not None:
+            return 200, cached
+        # Coalesce concurrent misses; the shield keeps a client that hangs up
+        # from cancelling the fetch other requests are waiting on
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch_or_stale_async(key, path, params))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.flights.coalesced += 1
+        return await asyncio.shield(task)
+
+
+def create_service(flask_app):
+    """aiohttp application serving the geocode endpoints with flask_app's config."""
+    from aiohttp import web
+
+    config = flask_app.config
+    geocoder = AsyncGeocoder(flask_app)
+    max_age = config["GEOCODE_HTTP_MAX_AGE"]
+    cors_origin = config["GEOCODE_SERVICE_CORS_ORIGIN"]
+
+    def respond(request, status, payload, empty):
+        # Same statuses, headers and caching as the Flask views
+        if status == 429:
+            return web.json_response(empty, status=429, headers={"Retry-After": "1"})
+        if status != 200:
+            return web.json_response(empty, status=status)
+        body = json.dumps(payload).encode()
+        etag = generate_etag(body)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={max_age}"}
+        if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def search(request):
+        q = request.query.get("q", "").strip()
+        try:
+            limit = int(request.query.get("limit", 8))
+        except ValueError:
+            limit = 8
+        limit = max(1, min(limit, 20))
+        if not q or len(q) < 2:
+            return web.json_response([])
+        status, payload = await geocoder.lookup(*geocoder.search_request(q, limit))
+        return respond(request, status, payload, [])
+
+    async def reverse(request):
+        try:
+            lat = float(request.query["lat"])
+            lon = float(request.query["lon"])
+        except (KeyError, ValueError):
+            return web.json_response({}, status=400)
+        status, payload = await geocoder.lookup(*geocoder.reverse_request(lat, lon))
+        return respond(request, status, payload, {})
+
+    @web.middleware
+    async def cors(request, handler):
+        response = await handler(request)
+        if cors_origin:
+            response.headers["Access-Control-Allow-Origin"] = cors_origin
+            response.headers["Vary"] = "Origin"
+        return response
+
+    async def on_startup(_service):
+        await geocoder.start()
+
+    async def on_cleanup(_service):
+        await geocoder.close()
+
+    service = web.Application(middlewares=[cors])
+    service["geocoder"] = geocoder
+    service.router.add_get("/api/geocode/search", search)
+    service.router.add_get("/api/geocode/reverse", reverse)
+    service.on_startup.append(on_startup)
+    service.on_cleanup.append(on_cleanup)
+    return service
+
+
+def main():
+    from aiohttp import web
+
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+    web.run_app(create_service(create_app()), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Background image processing for uploaded product and store images.
+
+Uploads are saved as-is by the request, then handed to a small thread pool
+that renders resized variants (thumbnail and card size), strips metadata
+(EXIF, GPS, ICC comments) by re-encoding only pixel data, and records the
+variant paths on the model. Until a variant exists templates fall back to
+the original file.
+
+Pillow is an optional dependency: without it uploads still work, they just
+never get variants.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# name -> longest edge in pixels
+VARIANT_SIZES = {
+    'thumb': 320,
+    'card': 640,
+}
+
+
+def _load_pillow():
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return None
+    return Image, ImageOps, features
+
+
+class ImageProcessor:
+    """Generates image variants off the request thread.
+
+    Configured from the Flask app config in init_app():
+      UPLOAD_FOLDER           root folder that stored paths are relative to
+      IMAGE_PROCESSING_ASYNC  False renders variants inline (tests, CLI)
+      IMAGE_WORKERS           thread pool size
+      IMAGE_QUALITY           encoder quality for WebP/JPEG output
+
+    The thread pool is started by the first asynchronous submit(), so apps
+    that never queue work (tests, CLI commands) start no threads.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Let work queued for a previous app finish against that app
+        self.shutdown()
+        self.app = app
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.run_async = app.config.get('IMAGE_PROCESSING_ASYNC', True)
+        self.quality = app.config.get('IMAGE_QUALITY', 80)
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        app.extensions['image_processor'] = self
+
+    def _executor(self):
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='image-variants',
+                )
+            return self.executor
+
+    def shutdown(self, wait=True):
+        """Stop the thread pool; a later submit() starts a new one."""
+        with self._lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def submit(self, relpath, on_done):
+        """Schedule variant generation for an uploaded file.
+
+        `relpath` is relative to UPLOAD_FOLDER; `on_done(variants)` is called
+        inside an app context with a {variant name: relpath} dict.
+        """
+        if not relpath:
+            return None
+        if not self.run_async:
+            return self._run(relpath, on_done)
+        return self._executor().submit(self._run, relpath, on_done)
+
+    def _run(self, relpath, on_done):
+        try:
+            variants = self.render_variants(relpath)
+        except Exception:
+            log.exception("Image processing failed for %s", relpath)
+            return None
+        if variants:
+            with self.app.app_context():
+                on_done(variants)
+        return variants
+
+    def render_variants(self, relpath):
+        """Write resized, metadata-free variants next to the original.
+
+        Returns {variant name: relpath}; empty when Pillow is unavailable.
+        """
+        pillow = _load_pillow()
+        if pillow is None:
+            return {}
+        Image, ImageOps, features = pillow
+        fmt, ext = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+        src = os.path.join(self.upload_folder, relpath)
+        folder, name = os.path.split(relpath)
+        stem = os.path.splitext(name)[0]
+        out_folder = os.path.join(folder, 'variants')
+        os.makedirs(os.path.join(self.upload_folder, out_folder), exist_ok=True)
+
+        variants = {
+            variant: os.path.join(out_folder, f"{stem}_{variant}.{ext}").replace(os.sep, '/')
+            for variant in VARIANT_SIZES
+        }
+        missing = [v for v, rel in variants.items()
+                   if not os.path.exists(os.path.join(self.upload_folder, rel))]
+        if not missing:
+            # Content-addressed sources make variants immutable: reuse existing ones
+            return variants
+        with Image.open(src) as original:
+            # Apply the EXIF orientation before the metadata is dropped
+            image = ImageOps.exif_transpose(original)
+            if fmt == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if fmt == 'WEBP' and 'A' in image.getbands() else 'RGB')
+            for variant in missing:
+                edge = VARIANT_SIZES[variant]
+                resized = image.copy()
+                resized.thumbnail((edge, edge), Image.LANCZOS)
+                self._save(resized, os.path.join(self.upload_folder, variants[variant]), fmt)
+        return variants
+
+    def _save(self, image, path, fmt):
+        """Encode to a temporary file next to `path`, then move it into place.
+
+        Readers (and the exists() check above) never see a half-written
+        variant, even when two workers render the same source.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, fmt, quality=self.quality)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
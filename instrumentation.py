@@ -0,0 +1,221 @@
+"""
+Per-request instrumentation for the Amcho Pasro app.
+
+Every request records its SQL statement count and time (SQLAlchemy engine
+events), template render time (Flask template signals) and time spent on
+the Nominatim upstream (reported by the geocoder). From that:
+
+  - statements slower than SLOW_QUERY_MS are logged with their endpoint,
+    and requests issuing more than QUERY_COUNT_WARN statements (the usual
+    sign of an N+1 loop) are logged too;
+  - with SERVER_TIMING (default: on in debug mode) responses carry a
+    `Server-Timing` header, so the breakdown shows up in browser devtools;
+  - per-endpoint counters and latency histograms are kept for the
+    Prometheus text format served at /metrics (with METRICS_ENABLED, off
+    by default; set METRICS_TOKEN to require a bearer token).
+
+Metrics are per worker process: with several workers each scrape sees the
+worker that answered it, which Prometheus aggregates across scrapes.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# Histogram upper bounds: latency in seconds, statements per request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'db_time', 'template_time', 'upstream_time', '_template_depth',
+                 '_template_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.upstream_time = 0.0
+        self._template_depth = 0
+        self._template_started = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _current():
+    return g.get('_metrics') if has_request_context() else None
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+class Instrumentation:
+    """Request/SQL/template timing with a slow-query log and Prometheus output.
+
+    Configured from the Flask app config in init_app():
+      SLOW_QUERY_MS     log statements slower than this (0 disables)
+      QUERY_COUNT_WARN  log requests issuing more statements than this
+      SERVER_TIMING     add Server-Timing headers (None: only in debug mode)
+
+    Initialise it after Flask-SQLAlchemy, whose engine it listens to.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.requests = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.template_seconds = defaultdict(float)
+        self.upstream_seconds = defaultdict(float)
+        self.slow_queries = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_s = app.config.get('SLOW_QUERY_MS', 100) / 1000
+        self.query_count_warn = app.config.get('QUERY_COUNT_WARN', 50)
+        self.server_timing = app.config.get('SERVER_TIMING')
+
+        with app.app_context():
+            engine = app.extensions['sqlalchemy'].engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['instrumentation'] = self
+
+    # --- Collection ----------------------------------------------------------
+
+    def _before_request(self):
+        g._metrics = RequestMetrics()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+        metrics = _current()
+        if metrics is None:
+            return
+        metrics.queries += 1
+        metrics.db_time += elapsed
+        if self.slow_query_s and elapsed >= self.slow_query_s:
+            endpoint = request.endpoint or 'unmatched'
+            with self._lock:
+                self.slow_queries[endpoint] += 1
+            log.warning("Slow query (%.1f ms) in %s %s: %s",
+                        elapsed * 1000, request.method, endpoint, ' '.join(statement.split()))
+
+    def _handle_error(self, context):
+        started = context.connection.info.get('_query_started') if context.connection else None
+        if started:
+            started.pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        metrics = _current()
+        if metrics is not None:
+            # Fragments render templates inside templates; only time the outermost
+            if metrics._template_depth == 0:
+                metrics._template_started = time.perf_counter()
+            metrics._template_depth += 1
+
+    def _after_render(self, sender, template, context, **extra):
+        metrics = _current()
+        if metrics is not None and metrics._template_depth:
+            metrics._template_depth -= 1
+            if metrics._template_depth == 0:
+                metrics.template_time += time.perf_counter() - metrics._template_started
+
+    def record_upstream(self, seconds):
+        """Add time spent waiting on an upstream service to the current request."""
+        metrics = _current()
+        if metrics is not None:
+            metrics.upstream_time += seconds
+
+    def _after_request(self, response):
+        metrics = g.pop('_metrics', None)
+        if metrics is None:
+            return response
+        total = time.perf_counter() - metrics.started
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.latency[endpoint].observe(total)
+            self.queries[endpoint].observe(metrics.queries)
+            self.requests[(endpoint, request.method, response.status_code)] += 1
+            self.db_seconds[endpoint] += metrics.db_time
+            self.template_seconds[endpoint] += metrics.template_time
+            self.upstream_seconds[endpoint] += metrics.upstream_time
+        if self.query_count_warn and metrics.queries > self.query_count_warn:
+            log.warning("%s %s issued %d queries (%.1f ms in the database)",
+                        request.method, request.full_path.rstrip('?'), metrics.queries, metrics.db_time * 1000)
+        # Debug mode is often switched on after create_app() (app.run(debug=True))
+        if current_app.debug if self.server_timing is None else self.server_timing:
+            response.headers.add('Server-Timing', ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'upstream;dur={metrics.upstream_time * 1000:.1f}',
+                f'app;dur={total * 1000:.1f}',
+            ]))
+        return response
+
+    # --- Export --------------------------------------------------------------
+
+    def render(self):
+        """This worker's metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            self._histogram(lines, 'amcho_request_duration_seconds', 'Request latency by endpoint.', self.latency)
+            self._histogram(lines, 'amcho_db_queries_per_request', 'SQL statements per request.', self.queries)
+            lines += ['# HELP amcho_requests_total Requests by endpoint, method and status.',
+                      '# TYPE amcho_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'amcho_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+            for name, help_text, values in (
+                ('amcho_db_seconds_total', 'Time spent executing SQL.', self.db_seconds),
+                ('amcho_template_seconds_total', 'Time spent rendering templates.', self.template_seconds),
+                ('amcho_upstream_seconds_total', 'Time spent waiting on Nominatim.', self.upstream_seconds),
+                ('amcho_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', self.slow_queries),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{_labels(endpoint=endpoint)} {value:.6g}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram(lines, name, help_text, histograms):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for endpoint, hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets + ('+Inf',), hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(endpoint=endpoint)} {hist.sum:.6g}')
+            lines.append(f'{name}_count{_labels(endpoint=endpoint)} {hist.count}')
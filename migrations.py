@@ -0,0 +1,306 @@
+"""
+Versioned schema migrations for the Amcho Pasro database.
+
+Applied migrations are recorded in a `schema_version` table; running the
+migrations applies only the steps newer than the recorded version, in
+order, each one committed before the next starts. The app itself never
+touches the schema on startup: run `python db_manager.py migrate` after
+deploying (and once on a fresh checkout).
+
+Rules for steps:
+  - Append new steps to MIGRATIONS with the next version number; never
+    renumber or edit a step that has shipped.
+  - Databases created before versioning existed can be in any state, and
+    SQLite runs most DDL outside the step's transaction, so every step
+    must be safe to re-run: check for columns/tables before creating them.
+  - Step 1 creates missing tables from the current models, so later steps
+    must also accept a schema that is already up to date.
+"""
+
+import os
+import shutil
+from datetime import datetime
+
+from sqlalchemy import text
+
+DB_FILENAME = 'amcho_pasro.db'
+
+SCHEMA_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at DATETIME NOT NULL)"
+)
+
+# Recompute the denormalized review aggregates from the store_review table
+STORE_RATING_REBUILD_SQL = """
+UPDATE user SET
+    store_review_count = (SELECT COUNT(*) FROM store_review r WHERE r.store_owner_id = user.id),
+    store_rating_sum = (SELECT COALESCE(SUM(r.rating), 0) FROM store_review r WHERE r.store_owner_id = user.id)
+"""
+
+# Keep only the newest review per (store, reviewer) so the unique index can be built
+STORE_REVIEW_DEDUPE_SQL = """
+DELETE FROM store_review WHERE id NOT IN (
+    SELECT MAX(id) FROM store_review GROUP BY store_owner_id, reviewer_id
+)
+"""
+
+# Full-text search index over product title/description (SQLite FTS5).
+# The index is an external-content table: it stores only the tokens and reads
+# the text back from `product`, and triggers keep it in sync on every write.
+PRODUCT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "title, description, content='product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF title, description ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO product_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+# Spatial index over seller coordinates (SQLite R-tree). Each store is a
+# zero-area box; triggers keep it in sync with the user table.
+STORE_GEO_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    "CREATE TRIGGER IF NOT EXISTS store_geo_ai AFTER INSERT ON user "
+    "WHEN new.user_type = 'seller' AND new.store_latitude IS NOT NULL AND new.store_longitude IS NOT NULL BEGIN "
+    "INSERT OR REPLACE INTO store_geo VALUES (new.id, new.store_latitude, new.store_latitude, new.store_longitude, new.store_longitude); END",
+    "CREATE TRIGGER IF NOT EXISTS store_geo_au AFTER UPDATE OF store_latitude, store_longitude, user_type ON user BEGIN "
+    "DELETE FROM store_geo WHERE id = old.id; "
+    "INSERT INTO store_geo SELECT new.id, new.store_latitude, new.store_latitude, new.store_longitude, new.store_longitude "
+    "WHERE new.user_type = 'seller' AND new.store_latitude IS NOT NULL AND new.store_longitude IS NOT NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS store_geo_ad AFTER DELETE ON user BEGIN "
+    "DELETE FROM store_geo WHERE id = old.id; END",
+]
+
+# Version stamps for in-process caches (see cache.VersionedValue): triggers
+# bump a named counter on every write so each worker can tell its copy is stale.
+CACHE_VERSION_DDL = [
+    "CREATE TABLE IF NOT EXISTS cache_version ("
+    "name VARCHAR(50) PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+    "INSERT OR IGNORE INTO cache_version (name, version) VALUES ('category', 0)",
+] + [
+    f"CREATE TRIGGER IF NOT EXISTS category_version_{suffix} AFTER {event} ON category BEGIN "
+    "UPDATE cache_version SET version = version + 1 WHERE name = 'category'; END"
+    for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE'))
+]
+
+# Stamp for the rendered fragment cache (see fragments.py)
+FRAGMENT_VERSION_DDL = "INSERT OR IGNORE INTO cache_version (name, version) VALUES ('fragments', 0)"
+
+# Every write to what fragments show moves the stamp, whichever process makes
+# it. A new seller isn't on any cached fragment yet, so user INSERTs don't.
+FRAGMENT_VERSION_TRIGGERS_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS {table}_fragments_{suffix} AFTER {event} ON {table} {when}BEGIN "
+    "UPDATE cache_version SET version = version + 1 WHERE name = 'fragments'; END"
+    for table, suffix, event, when in (
+        ('product', 'ai', 'INSERT', ''), ('product', 'au', 'UPDATE', ''), ('product', 'ad', 'DELETE', ''),
+        ('store_review', 'ai', 'INSERT', ''), ('store_review', 'au', 'UPDATE', ''),
+        ('store_review', 'ad', 'DELETE', ''),
+        ('category', 'ai', 'INSERT', ''), ('category', 'au', 'UPDATE', ''), ('category', 'ad', 'DELETE', ''),
+        ('user', 'au', 'UPDATE', "WHEN old.user_type = 'seller' "),
+        ('user', 'ad', 'DELETE', "WHEN old.user_type = 'seller' "),
+    )
+]
+
+# Progress of `db_manager.py import` runs, committed with each imported chunk
+IMPORT_CHECKPOINT_DDL = (
+    "CREATE TABLE IF NOT EXISTS import_checkpoint ("
+    "source VARCHAR(500) PRIMARY KEY, rows_done INTEGER NOT NULL, "
+    "updated_at DATETIME NOT NULL, finished_at DATETIME)"
+)
+
+DEFAULT_CATEGORIES = [
+    ('Seafood', 'seafood'),
+    ('Handicrafts', 'handicrafts'),
+    ('Spices', 'spices'),
+    ('Organic Produce', 'organic-produce'),
+    ('Beverages', 'beverages'),
+    ('Art', 'art'),
+    ('Clothing', 'clothing'),
+    ('Other', 'other'),
+]
+
+
+def _columns(con, table_name):
+    return {row[1] for row in con.execute(text(f"PRAGMA table_info({table_name})"))}
+
+
+def _table_exists(con, name):
+    return con.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+    ).first() is not None
+
+
+def _add_columns(con, table_name, columns):
+    """ALTER TABLE ADD COLUMN for each (name, ddl type) the table lacks."""
+    existing = _columns(con, table_name)
+    for name, ddl in columns:
+        if name not in existing:
+            con.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {ddl}"))
+
+
+# --- Steps ------------------------------------------------------------------
+# Each step receives a Connection inside a transaction and the models' MetaData.
+
+def create_tables(con, metadata):
+    metadata.create_all(con)
+
+
+def add_store_location(con, metadata):
+    _add_columns(con, 'user', [
+        ('store_latitude', 'REAL'),
+        ('store_longitude', 'REAL'),
+        ('store_address', 'TEXT'),
+    ])
+
+
+def rename_fisherman_to_seller(con, metadata):
+    con.execute(text("UPDATE user SET user_type = 'seller' WHERE user_type = 'fisherman'"))
+
+
+def add_categories(con, metadata):
+    _add_columns(con, 'product', [('category_id', 'INTEGER REFERENCES category(id)')])
+    if not con.execute(text("SELECT COUNT(*) FROM category")).scalar():
+        con.execute(
+            text("INSERT OR IGNORE INTO category (name, slug) VALUES (:name, :slug)"),
+            [{"name": name, "slug": slug} for name, slug in DEFAULT_CATEGORIES],
+        )
+
+
+def add_product_search_index(con, metadata):
+    exists = _table_exists(con, 'product_fts')
+    for stmt in PRODUCT_FTS_DDL:
+        con.execute(text(stmt))
+    if not exists:
+        con.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+def add_store_rating_aggregates(con, metadata):
+    _add_columns(con, 'user', [
+        ('store_review_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('store_rating_sum', 'INTEGER NOT NULL DEFAULT 0'),
+    ])
+    con.execute(text(STORE_RATING_REBUILD_SQL))
+
+
+def add_store_geo_index(con, metadata):
+    exists = _table_exists(con, 'store_geo')
+    for stmt in STORE_GEO_DDL:
+        con.execute(text(stmt))
+    if not exists:
+        con.execute(text(
+            "INSERT INTO store_geo SELECT id, store_latitude, store_latitude, store_longitude, store_longitude "
+            "FROM user WHERE user_type = 'seller' AND store_latitude IS NOT NULL AND store_longitude IS NOT NULL"
+        ))
+
+
+def add_image_variants(con, metadata):
+    _add_columns(con, 'user', [('store_image_thumb', 'VARCHAR(255)')])
+    _add_columns(con, 'product', [('image_thumb', 'VARCHAR(255)'), ('image_card', 'VARCHAR(255)')])
+
+
+def add_hot_query_indexes(con, metadata):
+    """Build the model indexes; duplicate reviews are collapsed before the unique one."""
+    existing = {row[0] for row in con.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    for table_name in ('user', 'product', 'store_review'):
+        for index in metadata.tables[table_name].indexes:
+            if index.name in existing:
+                continue
+            if index.name == 'uq_store_review_owner_reviewer':
+                if con.execute(text(STORE_REVIEW_DEDUPE_SQL)).rowcount:
+                    con.execute(text(STORE_RATING_REBUILD_SQL))
+            index.create(con)
+    # Superseded by the (category_id, created_at, id) index
+    con.execute(text("DROP INDEX IF EXISTS ix_product_category_id"))
+
+
+def add_cache_versions(con, metadata):
+    for stmt in CACHE_VERSION_DDL:
+        con.execute(text(stmt))
+
+
+def add_import_checkpoints(con, metadata):
+    con.execute(text(IMPORT_CHECKPOINT_DDL))
+
+
+def add_fragment_version(con, metadata):
+    con.execute(text(FRAGMENT_VERSION_DDL))
+
+
+def add_fragment_version_triggers(con, metadata):
+    for stmt in FRAGMENT_VERSION_TRIGGERS_DDL:
+        con.execute(text(stmt))
+
+
+MIGRATIONS = [
+    (1, 'create tables', create_tables),
+    (2, 'store location columns', add_store_location),
+    (3, "rename user type 'fisherman' to 'seller'", rename_fisherman_to_seller),
+    (4, 'product categories', add_categories),
+    (5, 'product full-text search index', add_product_search_index),
+    (6, 'store review aggregates', add_store_rating_aggregates),
+    (7, 'store location R-tree', add_store_geo_index),
+    (8, 'image variant columns', add_image_variants),
+    (9, 'hot query indexes', add_hot_query_indexes),
+    (10, 'cache version stamps', add_cache_versions),
+    (11, 'bulk import checkpoints', add_import_checkpoints),
+    (12, 'fragment cache version stamp', add_fragment_version),
+    (13, 'fragment cache version triggers', add_fragment_version_triggers),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# --- Runner -----------------------------------------------------------------
+
+def current_version(con):
+    """Highest applied version; 0 for a database that was never migrated."""
+    if not _table_exists(con, 'schema_version'):
+        return 0
+    return con.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def pending_migrations(engine):
+    with engine.connect() as con:
+        version = current_version(con)
+    return [(v, name) for v, name, _step in MIGRATIONS if v > version]
+
+
+def migrate(engine, metadata, target=None, log=print):
+    """Apply pending steps up to `target` (default: latest); returns the new version."""
+    with engine.begin() as con:
+        con.execute(text(SCHEMA_VERSION_DDL))
+        version = current_version(con)
+    for step_version, name, step in MIGRATIONS:
+        if step_version <= version or (target is not None and step_version > target):
+            continue
+        with engine.begin() as con:
+            step(con, metadata)
+            con.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": step_version, "n": name, "t": datetime.utcnow()},
+            )
+        log(f"Applied migration {step_version}: {name}")
+        version = step_version
+    return version
+
+
+def adopt_legacy_database(instance_path, db_path):
+    """Copy a database saved under an older file name to db_path.
+
+    Only done when db_path doesn't exist yet; returns the copied file or None.
+    """
+    if os.path.exists(db_path) or not os.path.isdir(instance_path):
+        return None
+    # The geocode cache lives in the instance folder too but isn't an app database
+    skip = {os.path.basename(db_path), 'geocode_cache.db'}
+    for fname in sorted(os.listdir(instance_path)):
+        if fname.lower().endswith('.db') and fname not in skip:
+            src = os.path.join(instance_path, fname)
+            shutil.copyfile(src, db_path)
+            return src
+    return None
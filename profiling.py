@@ -0,0 +1,216 @@
+"""
+Opt-in sampling profiler for hot routes.
+
+With PROFILE_SAMPLE_RATE above 0, that fraction of requests to the
+PROFILE_ENDPOINTS views is profiled and the result written to PROFILE_DIR
+(one file per request), so real traffic can be profiled on a production
+worker without a debugger. Two modes (PROFILE_MODE):
+
+  stack     a timer thread samples the request thread's stack every
+            PROFILE_INTERVAL_MS and writes collapsed stacks
+            (`endpoint;frame;frame... count`), the input of flamegraph.pl
+            and speedscope. Low overhead; the default.
+  cprofile  deterministic cProfile of the whole request, written as a
+            pstats dump. Exact call counts, but slows the request down.
+
+At most one request per worker is profiled at a time; requests arriving
+meanwhile are not sampled. `python db_manager.py profile_report` merges
+the dumps into one report.
+
+The default config takes three settings from the environment, so a
+worker can be profiled by restarting it rather than editing code:
+
+  PROFILE_SAMPLE_RATE  fraction of requests to profile, e.g. 0.01 (default 0)
+  PROFILE_MODE         'stack' (default) or 'cprofile'
+  PROFILE_ENDPOINTS    comma-separated endpoint names (default: products,
+                       store_finder, store_page); empty profiles every view
+
+Values passed to create_app() override them.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+log = logging.getLogger(__name__)
+
+STACK_SUFFIX = '.collapsed'
+PSTATS_SUFFIX = '.prof'
+DEFAULT_ENDPOINTS = ('products', 'store_finder', 'store_page')
+
+
+def settings_from_env(environ=os.environ):
+    """PROFILE_SAMPLE_RATE, PROFILE_MODE and PROFILE_ENDPOINTS config from environment variables."""
+    rate = environ.get('PROFILE_SAMPLE_RATE') or '0'
+    try:
+        rate = float(rate)
+    except ValueError:
+        raise ValueError(f"PROFILE_SAMPLE_RATE must be a number, got {rate!r}") from None
+    endpoints = environ.get('PROFILE_ENDPOINTS')
+    return {
+        'PROFILE_SAMPLE_RATE': rate,
+        'PROFILE_MODE': environ.get('PROFILE_MODE') or 'stack',
+        'PROFILE_ENDPOINTS': (DEFAULT_ENDPOINTS if endpoints is None
+                              else tuple(name.strip() for name in endpoints.split(',') if name.strip())),
+    }
+
+
+def frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                if frame.f_code is _STOP_CODE:
+                    # The request is already over, waiting for this thread to exit
+                    stack = []
+                    break
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path, root):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{root};{stack} {count}\n")
+
+
+_STOP_CODE = StackSampler.stop.__code__
+
+
+class RequestProfiler:
+    """Profiles a sample of requests to selected endpoints.
+
+    Configured from the Flask app config in init_app():
+      PROFILE_SAMPLE_RATE   fraction of matching requests to profile (0 = off)
+      PROFILE_ENDPOINTS     endpoint names to sample (empty: every endpoint)
+      PROFILE_MODE          'stack' or 'cprofile'
+      PROFILE_INTERVAL_MS   stack sampling interval
+      PROFILE_DIR           where dumps are written
+    """
+
+    def __init__(self, app=None):
+        self.rate = 0.0
+        self.profiled = 0
+        self._busy = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.endpoints = set(app.config.get('PROFILE_ENDPOINTS') or ())
+        self.mode = app.config.get('PROFILE_MODE', 'stack')
+        if self.mode not in ('stack', 'cprofile'):
+            raise ValueError(f"Unknown PROFILE_MODE {self.mode!r}")
+        self.interval = app.config.get('PROFILE_INTERVAL_MS', 5) / 1000
+        self.directory = app.config['PROFILE_DIR']
+        if self.rate > 0:
+            os.makedirs(self.directory, exist_ok=True)
+            app.before_request(self._start)
+            app.teardown_request(self._finish)
+        app.extensions['request_profiler'] = self
+
+    def _start(self):
+        if self.endpoints and request.endpoint not in self.endpoints:
+            return
+        if random.random() >= self.rate or not self._busy.acquire(blocking=False):
+            return
+        try:
+            if self.mode == 'cprofile':
+                import cProfile
+                profiler = cProfile.Profile()
+                # Fails when another profiler (a debugger, coverage) is active
+                profiler.enable()
+            else:
+                profiler = StackSampler(threading.get_ident(), self.interval)
+                profiler.start()
+        except (ValueError, RuntimeError):
+            self._busy.release()
+            log.exception("Could not start the profiler")
+            return
+        g._profile = (profiler, time.perf_counter())
+
+    def _finish(self, exc=None):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return
+        profiler, started = profile
+        try:
+            endpoint = request.endpoint or 'unmatched'
+            stem = os.path.join(self.directory, f"{endpoint}.{time.time_ns()}.{os.getpid()}")
+            if self.mode == 'cprofile':
+                profiler.disable()
+                profiler.dump_stats(stem + PSTATS_SUFFIX)
+            else:
+                profiler.stop()
+                profiler.dump(stem + STACK_SUFFIX, endpoint)
+            self.profiled += 1
+            log.info("Profiled %s %s (%.1f ms)", request.method, request.path,
+                     (time.perf_counter() - started) * 1000)
+        except OSError:
+            log.exception("Could not write the profile for %s", request.path)
+        finally:
+            self._busy.release()
+
+
+def dump_files(directory, endpoint=None):
+    """Profile dumps in `directory`, optionally only those of one endpoint."""
+    if not os.path.isdir(directory):
+        return [], []
+    names = sorted(os.listdir(directory))
+    if endpoint:
+        names = [n for n in names if n.split('.', 1)[0] == endpoint]
+    paths = [os.path.join(directory, n) for n in names]
+    return ([p for p in paths if p.endswith(STACK_SUFFIX)],
+            [p for p in paths if p.endswith(PSTATS_SUFFIX)])
+
+
+def merge_stacks(paths):
+    """Sum collapsed stack files into one Counter."""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+
+def hot_frames(stacks, top=20):
+    """(frame, self samples, total samples) for the busiest frames."""
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+    return [(frame, count, total_counts[frame]) for frame, count in self_counts.most_common(top)]
@@ -0,0 +1,106 @@
+"""
+Query plan regression checks for the hot queries of the Amcho Pasro app.
+
+Every statement a busy route issues is built through the same helpers the
+route uses, compiled with sample values and run through SQLite's
+EXPLAIN QUERY PLAN. A plan fails the check when it
+
+  - scans a table without an index ("SCAN product"),
+  - walks a whole index where a search was expected (allowed only for
+    LIMITed listings, which stop after one page of index entries, and
+    aggregates that never touch the table rows), or
+  - sorts in a temporary B-tree for queries that should be read in index
+    order (allowed for relevance/distance rankings over a bounded match set).
+
+Virtual tables (FTS5, R-tree) and subquery/co-routine scans are not flagged.
+Run it with `python db_manager.py check_query_plans`; tests/test_query_plans.py
+runs the same checks against a freshly migrated database.
+"""
+
+import re
+from datetime import datetime
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+
+# Sample parameters; plans don't depend on the values
+SAMPLE_ID = 1
+SAMPLE_POSITION = (datetime(2024, 1, 1), 1000)
+SAMPLE_BBOX = (15.0, 73.0, 16.0, 74.5)
+SAMPLE_CENTER = (15.5, 73.8)
+
+
+def hot_queries():
+    """Yield (name, ORM query, options) for every hot statement.
+
+    Options: `index_walk` allows a full index scan (LIMITed keyset pages,
+    aggregates answered from an index alone), `sort` allows a temp B-tree
+    for ORDER BY/GROUP BY.
+    """
+    from app import (
+        Category, Product, StoreReview, User, category_counts_query, keyset_page_query,
+        product_list_query, product_match, product_search_query, store_extent_query,
+        store_product_stats_query, store_reviews_query, store_summary_query, stores_in_bbox_query,
+        tile_cluster_queries,
+    )
+
+    listing = {'index_walk': True}
+    yield 'products: first page', keyset_page_query(product_list_query(), None, 25), listing
+    yield 'products: next page', keyset_page_query(product_list_query(), SAMPLE_POSITION, 25), listing
+    by_category = product_list_query().filter(Product.category_id == SAMPLE_ID)
+    yield 'products: category page', keyset_page_query(by_category, SAMPLE_POSITION, 25), {}
+    yield 'products: search', product_search_query(product_list_query(), 'fish', 60), {'sort': True}
+    yield 'products: category counts', category_counts_query(), {'index_walk': True}
+    yield 'products: search facets', category_counts_query(product_match('fish')), {'sort': True}
+    by_store = Product.query.filter_by(user_id=SAMPLE_ID)
+    yield 'store page: products', keyset_page_query(by_store, SAMPLE_POSITION, 25), {}
+    yield 'store page: product stats', store_product_stats_query(SAMPLE_ID), {}
+    yield 'store page: latest review', StoreReview.for_store(SAMPLE_ID).with_entities(StoreReview.created_at).limit(1), {}
+    yield 'store page: reviews', store_reviews_query(SAMPLE_ID).limit(21), {}
+    yield 'store page: older reviews', store_reviews_query(SAMPLE_ID, SAMPLE_POSITION).limit(21), {}
+    yield 'store page: existing review', StoreReview.by_reviewer(SAMPLE_ID, 2), {}
+    yield 'store finder: extent', store_extent_query(), {}
+    # The correlated product count must seek the product index per store
+    yield 'store summaries', store_summary_query().filter(User.id == SAMPLE_ID), {}
+    yield 'stores nearby', stores_in_bbox_query(SAMPLE_BBOX, SAMPLE_CENTER, 50), {'sort': True}
+    yield 'stores in viewport', stores_in_bbox_query(SAMPLE_BBOX, None, 500), {'sort': True}
+    cells, top_stores = tile_cluster_queries(SAMPLE_BBOX)
+    yield 'store clusters: cells', cells, {'sort': True}
+    yield 'store clusters: top stores', top_stores, {'sort': True}
+    yield 'login: user by email', User.query.filter_by(email='someone@example.com'), {}
+    yield 'category by slug', Category.query.filter_by(slug='seafood'), {}
+
+
+def explain(connection, query):
+    """EXPLAIN QUERY PLAN detail lines for an ORM query."""
+    sql = str(query.statement.compile(
+        dialect=connection.dialect, compile_kwargs={'literal_binds': True}
+    ))
+    return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def plan_problems(details, index_walk=False, sort=False):
+    """Return the plan lines that violate the rules in the module docstring."""
+    subqueries = {m.group(1) for m in map(_SUBQUERY.match, details) if m}
+    problems = []
+    for detail in details:
+        scan = _SCAN.match(detail)
+        if scan and scan.group(1) not in subqueries and 'VIRTUAL TABLE' not in detail:
+            if 'USING' not in detail or not index_walk:
+                problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE') and not sort:
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(app):
+    """Explain every hot query; returns a list of (name, plan, problems)."""
+    from app import db
+
+    results = []
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for name, query, options in hot_queries():
+                details = explain(connection, query)
+                results.append((name, details, plan_problems(details, **options)))
+    return results
@@ -166,3 +166,36 @@ document.addEventListener("DOMContentLoaded", function () {
     });
   });
 });
+
+// "Load more" pagination: fetch the next page of cards and append them in place.
+// Links keep a plain ?cursor= href so the listing still pages without JavaScript.
+document.addEventListener("click", async function (e) {
+  const trigger = e.target.closest("[data-load-more]");
+  if (!trigger) return;
+  e.preventDefault();
+  if (trigger.dataset.loading === "1") return;
+
+  const grid = document.getElementById(trigger.dataset.target);
+  const url = new URL(trigger.dataset.endpoint, window.location.origin);
+  url.searchParams.set("cursor", trigger.dataset.cursor);
+
+  trigger.dataset.loading = "1";
+  trigger.classList.add("is-loading");
+  try {
+    const resp = await fetch(url, { headers: { Accept: "application/json" } });
+    if (!resp.ok) throw new Error("HTTP " + resp.status);
+    const data = await resp.json();
+    if (grid) grid.insertAdjacentHTML("beforeend", data.html);
+    if (data.next_cursor) {
+      trigger.dataset.cursor = data.next_cursor;
+    } else {
+      trigger.parentElement.remove();
+    }
+  } catch (err) {
+    // Fall back to a full page load of the next page
+    window.location.href = trigger.href;
+  } finally {
+    trigger.dataset.loading = "";
+    trigger.classList.remove("is-loading");
+  }
+});
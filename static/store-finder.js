@@ -1,4 +1,4 @@
-// Store Finder: plots all stores on Leaflet map, supports search/geolocate, filters by radius, and renders cards.
+// Store Finder: plots the stores inside the current map viewport (fetched from the server), supports search/geolocate and renders cards.
 (function () {
   const mapEl = document.getElementById("stores-map");
   if (!mapEl || !window.L) return;
@@ -14,24 +14,20 @@
   const resetBtn = document.getElementById("finder-reset");
   const storeNameFilter = document.getElementById("store-name-filter");
 
-  let stores = [];
+  // Stores and marker clusters are fetched per viewport from the server
+  const endpoint = mapEl.dataset.endpoint || "/api/stores/nearby";
+  const clustersEndpoint = mapEl.dataset.clustersEndpoint || "/api/stores/clusters";
+  // May point at the async geocode service on another origin
+  const geocodeSearchEndpoint = mapEl.dataset.geocodeSearch || "/api/geocode/search";
+  const geocodeReverseEndpoint = mapEl.dataset.geocodeReverse || "/api/geocode/reverse";
+  let initialBounds = null;
   try {
-    // Prefer dataset but fall back to global var injected in template
-    const raw = mapEl.dataset.stores;
-    if (raw && raw.trim().length) {
-      stores = JSON.parse(raw) || [];
-    } else if (Array.isArray(window.AMCHO_PASRO_STORES)) {
-      stores = window.AMCHO_PASRO_STORES;
-    }
+    initialBounds = JSON.parse(mapEl.dataset.bounds || "null");
   } catch (e) {
-    if (Array.isArray(window.AMCHO_PASRO_STORES)) {
-      stores = window.AMCHO_PASRO_STORES;
-    } else {
-      console.warn("Failed to parse stores from dataset.", e);
-      stores = [];
-    }
+    initialBounds = null;
   }
-  if (!Array.isArray(stores)) stores = [];
+  let stores = [];
+  let center = null; // { lat, lng } picked via search or geolocation
 
   const DEFAULT_CENTER = [20, 0];
   const DEFAULT_ZOOM = 2;
@@ -45,9 +41,8 @@
       '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
   }).addTo(map);
 
-  // Use a MarkerClusterGroup for better performance with many stores; fallback to FeatureGroup if plugin missing
-  const clusterGroup =
-    (L.markerClusterGroup && L.markerClusterGroup()) || L.featureGroup();
+  // Markers and server-computed clusters share one layer
+  const clusterGroup = L.featureGroup();
   map.addLayer(clusterGroup);
 
   function setCenterReadout(lat, lng, addr) {
@@ -56,26 +51,66 @@
     if (addr) centerAddr.textContent = addr;
   }
 
-  function haversineKm(aLat, aLng, bLat, bLng) {
-    function toRad(d) {
-      return (d * Math.PI) / 180;
+  function viewportBbox() {
+    const b = map.getBounds();
+    let west = b.getWest();
+    let east = b.getEast();
+    if (east - west >= 360) {
+      west = -180;
+      east = 180;
+    } else {
+      // Leaflet can report longitudes outside [-180, 180] with worldCopyJump
+      west = ((((west + 180) % 360) + 360) % 360) - 180;
+      east = ((((east + 180) % 360) + 360) % 360) - 180;
     }
-    const R = 6371;
-    const dLat = toRad(bLat - aLat);
-    const dLng = toRad(bLng - aLng);
-    const A =
-      Math.sin(dLat / 2) * Math.sin(dLat / 2) +
-      Math.cos(toRad(aLat)) *
-        Math.cos(toRad(bLat)) *
-        Math.sin(dLng / 2) *
-        Math.sin(dLng / 2);
-    const c = 2 * Math.atan2(Math.sqrt(A), Math.sqrt(1 - A));
-    return R * c;
+    const south = Math.max(-90, b.getSouth());
+    const north = Math.min(90, b.getNorth());
+    return [south, west, north, east].map((v) => v.toFixed(6)).join(",");
+  }
+
+  // One in-flight request per kind; a newer viewport aborts the older fetch
+  const controllers = {};
+  async function fetchJson(kind, url) {
+    try {
+      if (controllers[kind]) controllers[kind].abort();
+      controllers[kind] = new AbortController();
+      const resp = await fetch(url.toString(), {
+        signal: controllers[kind].signal,
+        headers: { Accept: "application/json" },
+      });
+      if (!resp.ok) return null;
+      return await resp.json();
+    } catch (e) {
+      if (e.name !== "AbortError") console.warn(e);
+      return null;
+    }
+  }
+
+  async function fetchStores() {
+    const url = new URL(endpoint, window.location.origin);
+    const name = storeNameFilter ? storeNameFilter.value.trim() : "";
+    // A name search covers every store, including those not on the map yet
+    if (name) url.searchParams.set("q", name);
+    else url.searchParams.set("bbox", viewportBbox());
+    if (center) {
+      url.searchParams.set("lat", center.lat);
+      url.searchParams.set("lng", center.lng);
+    }
+    const data = await fetchJson("stores", url);
+    return data ? data.stores || [] : null;
+  }
+
+  async function fetchClusters() {
+    const url = new URL(clustersEndpoint, window.location.origin);
+    url.searchParams.set("bbox", viewportBbox());
+    url.searchParams.set("zoom", map.getZoom());
+    const data = await fetchJson("clusters", url);
+    return data ? data.clusters || [] : null;
   }
 
   async function reverseGeocode(lat, lng) {
     try {
-      const url = new URL("/api/geocode/reverse", window.location.origin);
+      const url = new URL(geocodeReverseEndpoint, window.location.origin);
       url.searchParams.set("lat", lat);
       url.searchParams.set("lon", lng);
       const resp = await fetch(url.toString(), {
@@ -95,7 +130,7 @@
     try {
       if (searchController) searchController.abort();
       searchController = new AbortController();
-      const url = new URL("/api/geocode/search", window.location.origin);
+      const url = new URL(geocodeSearchEndpoint, window.location.origin);
       url.searchParams.set("q", q);
       url.searchParams.set("limit", "8");
       const resp = await fetch(url.toString(), {
@@ -143,12 +178,35 @@
     return m;
   }
 
-  function renderCards(list, center) {
+  function addClusterMarker(c) {
+    if (c.count === 1 && c.top_stores && c.top_stores.length) {
+      return addStoreMarker(c.top_stores[0]);
+    }
+    const size = c.count < 10 ? "small" : c.count < 100 ? "medium" : "large";
+    const icon = L.divIcon({
+      html: `<div><span>${c.count}</span></div>`,
+      className: `marker-cluster marker-cluster-${size}`,
+      iconSize: L.point(40, 40),
+    });
+    const m = L.marker([c.lat, c.lng], { icon });
+    const names = (c.top_stores || [])
+      .map((s) => `${s.name || "Store"}${s.rating ? ` · ${s.rating}/5` : ""}`)
+      .join("<br/>");
+    m.bindTooltip(`${c.count} stores${names ? "<br/>" + names : ""}`);
+    // Zoom into the cluster to break it apart
+    m.on("click", () => map.setView([c.lat, c.lng], Math.min(map.getZoom() + 2, 19)));
+    clusterGroup.addLayer(m);
+    return m;
+  }
+
+  function renderCards(list, filtering) {
     cardsEl.innerHTML = "";
     if (!list || list.length === 0) {
       const empty = document.createElement("div");
       empty.className = "no-products";
-      empty.innerHTML = "<p>No stores found in this area.</p>";
+      empty.innerHTML = filtering
+        ? "<p>No stores match that name.</p>"
+        : "<p>No stores found in this area.</p>";
       cardsEl.appendChild(empty);
       return;
     }
@@ -158,10 +216,7 @@
       card.addEventListener("click", () => {
         window.location.href = `/store/${s.id}`;
       });
-      const distKm =
-        center && s.lat != null && s.lng != null
-          ? haversineKm(center.lat, center.lng, s.lat, s.lng)
-          : null;
+      const distKm = s.distance_km != null ? s.distance_km : null;
       card.innerHTML = `
         <div class="product-content">
           <h3 class="product-title">${s.name || "Store"}</h3>
@@ -183,50 +238,51 @@
               ? `<div class="distance-chip">~${distKm.toFixed(1)} km away</div>`
               : ""
           }
+          ${
+            s.lat == null || s.lng == null
+              ? `<div class="store-meta">Not on the map yet</div>`
+              : ""
+          }
         </div>`;
       cardsEl.appendChild(card);
     });
   }
 
-  function showAllStores(center) {
+  async function refreshStores() {
+    const filtering = storeNameFilter && storeNameFilter.value.trim();
+    // Name filtering shows the matching stores themselves instead of clusters
+    const [list, clusters] = await Promise.all([
+      fetchStores(),
+      filtering ? Promise.resolve(null) : fetchClusters(),
+    ]);
+    if (list === null) return; // aborted or failed; keep what is shown
+    stores = list;
     clearMarkers();
-    const list = stores.slice();
-    // Add markers and fit bounds
-    const bounds = [];
-    list.forEach((s) => {
-      const m = addStoreMarker(s);
-      if (m) bounds.push(m.getLatLng());
-    });
-    if (bounds.length > 0) {
-      map.fitBounds(L.latLngBounds(bounds), { padding: [20, 20] });
+    if (clusters) {
+      clusters.forEach(addClusterMarker);
     } else {
-      map.setView(DEFAULT_CENTER, DEFAULT_ZOOM);
+      // Stores without coordinates get a card only
+      stores.forEach(addStoreMarker);
     }
-    renderCards(list, center);
-  }
-
-  function filterStoresByName(q) {
-    const term = (q || "").trim().toLowerCase();
-    if (!term) return stores.slice();
-    return stores.filter((s) => (s.name || "").toLowerCase().includes(term));
+    renderCards(stores, filtering);
   }
 
-  function renderFilteredStores() {
-    const q = storeNameFilter ? storeNameFilter.value : "";
-    const list = filterStoresByName(q);
-    clearMarkers();
-    const bounds = [];
-    list.forEach((s) => {
-      const m = addStoreMarker(s);
-      if (m) bounds.push(m.getLatLng());
-    });
-    if (bounds.length > 0) {
-      // Do not force zoom out drastically if user already focused somewhere; just fit filtered
-      map.fitBounds(L.latLngBounds(bounds), { padding: [20, 20] });
+  function fitInitialView() {
+    if (initialBounds) {
+      map.fitBounds(L.latLngBounds(initialBounds), { padding: [20, 20], maxZoom: 13 });
+    } else {
+      map.setView(DEFAULT_CENTER, DEFAULT_ZOOM);
     }
-    renderCards(list, null);
   }
 
+  // Reload stores whenever the viewport settles
+  let moveTimer = null;
+  const MOVE_DELAY = 200;
+  map.on("moveend", () => {
+    if (moveTimer) clearTimeout(moveTimer);
+    moveTimer = setTimeout(refreshStores, MOVE_DELAY);
+  });
+
   let typingTimer = null;
   const TYPING_DELAY = 250;
   let lastResults = [];
@@ -245,7 +301,8 @@
     if (match) {
       const { lat, lon } = match;
       setCenterReadout(lat, lon, match.label);
-      // Pan to the searched place; keep all stores visible
+      center = { lat, lng: lon };
+      // Pan to the searched place; the viewport reload sorts stores by distance from it
       map.setView([lat, lon], 13, { animate: true });
     }
   });
@@ -263,7 +320,8 @@
           const { latitude: lat, longitude: lng } = pos.coords;
           const addr = await reverseGeocode(lat, lng);
           setCenterReadout(lat, lng, addr);
-          // Pan to user's location; keep all stores visible
+          center = { lat, lng };
+          // Pan to user's location; the viewport reload sorts stores by distance from it
           map.setView([lat, lng], 13, { animate: true });
         },
         (err) => {
@@ -278,14 +336,16 @@
       });
   });
 
-  // Reset view to show all stores and fit bounds
+  // Reset view to the full store extent
   resetBtn?.addEventListener("click", () => {
     // Clear center readout
     centerLat.textContent = "—";
     centerLng.textContent = "—";
     centerAddr.textContent = "—";
+    center = null;
     if (storeNameFilter) storeNameFilter.value = ""; // clear name filter
-    showAllStores(null);
+    fitInitialView();
+    refreshStores();
   });
 
   // Store name filtering (debounced)
@@ -293,9 +353,10 @@
   const STORE_FILTER_DELAY = 200;
   storeNameFilter?.addEventListener("input", () => {
     if (storeFilterTimer) clearTimeout(storeFilterTimer);
-    storeFilterTimer = setTimeout(renderFilteredStores, STORE_FILTER_DELAY);
+    storeFilterTimer = setTimeout(refreshStores, STORE_FILTER_DELAY);
   });
 
-  // Initial: add markers for all stores and fit bounds, then render all cards
-  showAllStores(null);
+  // Initial: fit the overall store extent; stores load for that viewport
+  fitInitialView();
+  refreshStores();
 })();
@@ -0,0 +1,105 @@
+"""
+Shared fixtures: a migrated scratch database per test and helpers to seed
+users and log in through the test client. Run with `python -m pytest`.
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    User, category_cache, category_count_cache, create_app, db, store_cluster_cache, user_cache,
+)
+from migrations import migrate
+
+PASSWORD = 'secret'
+# Cheap hash: tests create many accounts
+PASSWORD_HASH = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+
+
+def make_app(tmp_path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'GEOCODE_CACHE_PATH': str(tmp_path / 'geocode_cache.db'),
+        'IMAGE_PROCESSING_ASYNC': False,
+    })
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    # Per-worker caches are module globals; don't let one test's rows leak into the next
+    for cache in (user_cache, category_count_cache, store_cluster_cache):
+        cache.clear()
+    category_cache.invalidate()
+    with app.app_context():
+        migrate(db.engine, db.metadata, log=lambda *_: None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def other_app(app, tmp_path):
+    """A second app on the same database, like another worker process."""
+    other = make_app(tmp_path)
+    yield other
+    with other.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def add_user(app, email, user_type='buyer', **fields):
+    """Insert a user and return its id."""
+    with app.app_context():
+        user = User(username=email.split('@')[0], email=email, password_hash=PASSWORD_HASH,
+                    user_type=user_type, **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login(client, email):
+    response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302, "login failed"
+    with client.session_transaction() as sess:
+        sess.pop('_flashes', None)
+
+
+class StatementCounter:
+    """Counts SQL statements sent to an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *_args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *_exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+@pytest.fixture
+def count_statements(app):
+    with app.app_context():
+        engine = db.engine
+    return lambda: StatementCounter(engine)
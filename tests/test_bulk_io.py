@@ -0,0 +1,42 @@
+import json
+
+from app import Product, _cache_version, db, fragment_cache
+from bulk_io import import_file
+from conftest import add_user
+
+
+def write_products(path, seller_email, titles):
+    with open(path, 'w') as f:
+        for title in titles:
+            f.write(json.dumps({'seller_email': seller_email, 'title': title, 'price': '120'}) + '\n')
+
+
+def test_import_moves_the_shared_fragment_stamp(app, tmp_path):
+    add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    path = tmp_path / 'products.jsonl'
+    write_products(path, 'seller@example.com', [f"Catch {i}" for i in range(5)])
+    with app.app_context():
+        before = _cache_version('fragments')
+        stats = import_file('products', str(path), batch=2, log=lambda *_: None)
+        assert stats['written'] == 5
+        # Moved by the product triggers, for the web workers' caches
+        assert _cache_version('fragments') > before
+        assert db.session.scalar(db.select(db.func.count(Product.id))) == 5
+
+
+def test_worker_drops_fragments_when_the_stamp_moves(app):
+    renders = []
+
+    def render():
+        renders.append(1)
+        return 'html'
+
+    with app.app_context():
+        fragment_cache.get_or_render('key', ('tag',), render)
+        fragment_cache.get_or_render('key', ('tag',), render)
+        assert len(renders) == 1
+        # What another process's import does; this worker's tags are untouched
+        db.session.execute(db.text("UPDATE cache_version SET version = version + 1 WHERE name = 'fragments'"))
+        db.session.commit()
+        fragment_cache.get_or_render('key', ('tag',), render)
+        assert len(renders) == 2
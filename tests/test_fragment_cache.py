@@ -0,0 +1,79 @@
+from app import Category, category_cache, db, fragment_cache
+from conftest import add_user, login
+
+
+def test_store_edit_in_one_worker_reaches_another(app, other_app):
+    store_id = add_user(app, 'seller@example.com', 'seller', store_name='Old Name')
+    add_user(app, 'buyer@example.com')
+    seller, buyer = app.test_client(), other_app.test_client()
+    login(seller, 'seller@example.com')
+    login(buyer, 'buyer@example.com')
+    assert 'Old Name' in buyer.get(f'/store/{store_id}').get_data(as_text=True)
+
+    assert seller.post('/edit-store', data={'store_name': 'New Name'}).status_code == 302
+    page = buyer.get(f'/store/{store_id}').get_data(as_text=True)
+    assert 'New Name' in page
+    assert 'Old Name' not in page
+
+
+def test_review_in_one_worker_reaches_another(app, other_app):
+    store_id = add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    add_user(app, 'reviewer@example.com')
+    add_user(app, 'buyer@example.com')
+    reviewer, buyer = app.test_client(), other_app.test_client()
+    login(reviewer, 'reviewer@example.com')
+    login(buyer, 'buyer@example.com')
+    # Warm both workers' hero fragments
+    reviewer.get(f'/store/{store_id}')
+    assert review_count(buyer.get(f'/store/{store_id}')) == '0'
+
+    response = reviewer.post(f'/store/{store_id}/review', data={'rating': '5', 'review_text': 'Fresh!'})
+    assert response.status_code == 302
+    assert review_count(buyer.get(f'/store/{store_id}')) == '1'
+
+
+def review_count(response):
+    page = response.get_data(as_text=True)
+    stat = page.split('Customer Reviews</span>', 1)[1]
+    return stat.split('<span class="stat-value">', 1)[1].split('<', 1)[0]
+
+
+def test_category_rename_elsewhere_changes_the_product_page_etag(app, client):
+    add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    login(client, 'seller@example.com')
+    with app.app_context():
+        category = db.session.execute(db.select(Category.id, Category.slug)).first()
+    response = client.post('/api/products/batch', json=[
+        {'title': 'Pomfret', 'price': '300', 'quantity': '2', 'category': category.slug}])
+    url = response.get_json()['results'][0]['url']
+    etag = client.get(url).headers['ETag']
+
+    # Renamed by another process; the product and seller rows are unchanged
+    with app.app_context():
+        Category.query.filter_by(id=category.id).update({'name': 'Renamed Catch'})
+        db.session.commit()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Renamed Catch' in response.get_data(as_text=True)
+
+
+def test_category_rename_drops_tagged_product_fragments(app, client, tmp_path):
+    # A filesystem cache follows tag invalidations only, not the memory stamp
+    app.config.update(FRAGMENT_CACHE_BACKEND='filesystem', FRAGMENT_CACHE_DIR=str(tmp_path / 'fragments'))
+    fragment_cache.init_app(app)
+    category_cache.check_interval = 0
+    add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    login(client, 'seller@example.com')
+    with app.app_context():
+        category = db.session.execute(db.select(Category.id, Category.slug, Category.name)).first()
+    response = client.post('/api/products/batch', json=[
+        {'title': 'Pomfret', 'price': '300', 'quantity': '2', 'category': category.slug}])
+    url = response.get_json()['results'][0]['url']
+    assert category.name in client.get(url).get_data(as_text=True)
+
+    with app.app_context():
+        Category.query.filter_by(id=category.id).update({'name': 'Renamed Catch'})
+        db.session.commit()
+    page = client.get(url).get_data(as_text=True)
+    assert 'Renamed Catch' in page
+    assert category.name not in page
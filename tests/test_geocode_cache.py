@@ -0,0 +1,42 @@
+import multiprocessing
+import time
+
+from geocode import GeocodeCache
+
+
+def stored_keys(cache):
+    return {key for key, in cache._execute("SELECT key FROM geocode_cache")}
+
+
+def test_writes_purge_rows_past_the_stale_window(tmp_path):
+    cache = GeocodeCache(str(tmp_path / 'geocode.db'), ttl=60, purge_every=2)
+    now = time.time()
+    cache._execute("INSERT INTO geocode_cache VALUES ('long-gone', '{}', ?)", (now - 120,))
+    cache._execute("INSERT INTO geocode_cache VALUES ('just-expired', '{}', ?)", (now - 1,))
+
+    cache.set('a', {'lat': 15.0})
+    assert 'long-gone' in stored_keys(cache)
+    cache.set('b', {'lat': 15.1})
+    assert stored_keys(cache) == {'just-expired', 'a', 'b'}
+    # Still there for the upstream-down fallback
+    assert cache.get('just-expired', allow_stale=True) == {}
+
+
+def take_token(path):
+    return GeocodeCache(path, ttl=60).take_token('nominatim', rate=0.001, capacity=1)
+
+
+def test_rate_limit_is_shared_by_every_process(tmp_path):
+    path = str(tmp_path / 'geocode.db')
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        granted = pool.map(take_token, [path] * 8)
+    assert granted.count(True) == 1
+
+
+def test_rate_limit_refills_at_its_rate(tmp_path):
+    path = str(tmp_path / 'geocode.db')
+    worker, service = GeocodeCache(path, ttl=60), GeocodeCache(path, ttl=60)
+    assert worker.take_token('nominatim', rate=20, capacity=1)
+    assert not service.take_token('nominatim', rate=20, capacity=1)
+    time.sleep(0.06)
+    assert service.take_token('nominatim', rate=20, capacity=1)
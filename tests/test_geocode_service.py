@@ -0,0 +1,106 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from conftest import add_user, login
+from geocode_service import create_service
+
+DELAY = 0.4
+
+
+def nominatim_stub(calls):
+    """A Nominatim that takes DELAY seconds to answer."""
+    async def answer(request):
+        calls.append(request.path_qs)
+        await asyncio.sleep(DELAY)
+        if request.path == '/search':
+            return web.json_response([{'display_name': request.query['q']}])
+        return web.json_response({'display_name': f"{request.query['lat']},{request.query['lon']}"})
+
+    stub = web.Application()
+    stub.router.add_get('/search', answer)
+    stub.router.add_get('/reverse', answer)
+    return stub
+
+
+@asynccontextmanager
+async def geocode_service(app):
+    calls = []
+    async with TestServer(nominatim_stub(calls)) as upstream:
+        app.config['NOMINATIM_URL'] = str(upstream.make_url(''))
+        async with TestClient(TestServer(create_service(app))) as client:
+            yield client, calls
+
+
+def search(client, q):
+    return client.get('/api/geocode/search', params={'q': q})
+
+
+def test_concurrent_misses_share_one_upstream_call_then_hit_the_cache(app):
+    async def scenario():
+        async with geocode_service(app) as (client, calls):
+            responses = await asyncio.gather(*(search(client, 'Panjim market') for _ in range(5)))
+            assert [r.status for r in responses] == [200] * 5
+            bodies = [await r.json() for r in responses]
+            assert bodies == [[{'display_name': 'Panjim market'}]] * 5
+            assert len(calls) == 1
+
+            started = time.perf_counter()
+            response = await search(client, '  PANJIM   market ')
+            assert response.status == 200
+            assert time.perf_counter() - started < DELAY
+            assert len(calls) == 1
+    asyncio.run(scenario())
+
+
+def test_upstream_budget_is_enforced(app):
+    async def scenario():
+        async with geocode_service(app) as (client, calls):
+            assert (await search(client, 'Mapusa')).status == 200
+            response = await search(client, 'Margao')
+            assert response.status == 429
+            assert response.headers['Retry-After'] == '1'
+            assert len(calls) == 1
+    asyncio.run(scenario())
+
+
+def test_slow_upstream_does_not_block_other_requests(app):
+    add_user(app, 'buyer@example.com')
+    flask_client = app.test_client()
+    login(flask_client, 'buyer@example.com')
+
+    async def timed(call):
+        started = time.perf_counter()
+        response = await call
+        return response, time.perf_counter() - started
+
+    # Room in the budget for both lookups
+    app.config.update(GEOCODE_RATE_LIMIT=100.0, GEOCODE_RATE_BURST=10)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        async with geocode_service(app) as (client, calls):
+            assert (await search(client, 'Vasco')).status == 200
+            slow = asyncio.ensure_future(client.get('/api/geocode/reverse', params={'lat': 15.4, 'lon': 73.8}))
+            await asyncio.sleep(DELAY / 4)
+            assert not slow.done()
+            # The service keeps answering from its cache...
+            cached, cached_time = await timed(search(client, 'Vasco'))
+            # ...and the Flask app's views don't wait on the upstream either
+            page, page_time = await timed(loop.run_in_executor(None, flask_client.get, '/products'))
+            assert not slow.done()
+            assert (await slow).status == 200
+        assert cached.status == 200 and page.status_code == 200
+        assert cached_time < DELAY / 2 and page_time < DELAY / 2
+    asyncio.run(scenario())
+
+
+def test_store_finder_sends_geocodes_to_the_service(app, client):
+    app.config['GEOCODE_SERVICE_URL'] = 'http://geo.example.com'
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    page = client.get('/stores').get_data(as_text=True)
+    assert 'http://geo.example.com/api/geocode/search' in page
@@ -0,0 +1,67 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from conftest import make_app
+from images import ImageProcessor
+
+
+def pool_threads():
+    return [t for t in threading.enumerate() if t.name.startswith('image-variants')]
+
+
+def write_photo(folder, name='photo.png'):
+    os.makedirs(folder, exist_ok=True)
+    Image.new('RGB', (1200, 800), 'teal').save(os.path.join(folder, name))
+    return name
+
+
+def configured(tmp_path, **config):
+    app = make_app(tmp_path)
+    app.config.update(IMAGE_PROCESSING_ASYNC=True, **config)
+    processor = ImageProcessor(app)
+    return app, processor
+
+
+def test_pool_starts_on_first_submit_and_stops_on_reinit(tmp_path):
+    app, processor = configured(tmp_path)
+    processor.init_app(app)
+    assert processor.executor is None
+
+    name = write_photo(app.config['UPLOAD_FOLDER'])
+    done = []
+    processor.submit(name, done.append).result()
+    assert done and pool_threads()
+
+    # Another create_app() shuts the previous pool down instead of leaking it
+    processor.init_app(make_app(tmp_path))
+    assert processor.executor is None
+    assert not pool_threads()
+
+
+def test_variants_are_moved_into_place_whole(tmp_path, monkeypatch):
+    app, processor = configured(tmp_path)
+    folder = app.config['UPLOAD_FOLDER']
+    name = write_photo(folder)
+    variants = processor.render_variants(name)
+    for relpath in variants.values():
+        with Image.open(os.path.join(folder, relpath)) as variant:
+            variant.verify()
+    assert not [f for f in os.listdir(os.path.join(folder, 'variants')) if f.endswith('.tmp')]
+
+    def fail_midway(image, fp, *args, **kwargs):
+        if isinstance(fp, str):
+            with open(fp, 'wb') as out:
+                out.write(b'partial')
+        else:
+            fp.write(b'partial')
+        raise OSError('disk full')
+
+    other = write_photo(folder, 'other.png')
+    monkeypatch.setattr(Image.Image, 'save', fail_midway)
+    with pytest.raises(OSError):
+        processor.render_variants(other)
+    assert sorted(os.listdir(os.path.join(folder, 'variants'))) == sorted(
+        os.path.basename(relpath) for relpath in variants.values())
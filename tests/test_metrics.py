@@ -0,0 +1,10 @@
+def test_metrics_are_off_by_default(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_token_is_required_when_set(app, client):
+    app.config.update(METRICS_ENABLED=True, METRICS_TOKEN='scrape-me')
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
@@ -0,0 +1,76 @@
+import io
+import json
+
+from app import Product, db
+from conftest import add_user, login
+
+
+def seller_client(app, client):
+    add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    login(client, 'seller@example.com')
+    return client
+
+
+def batch(count, prefix='Catch'):
+    return [{'title': f"{prefix} {i}", 'price': '100.00', 'quantity': '1'} for i in range(count)]
+
+
+def test_batch_ids_follow_request_order(app, client):
+    seller_client(app, client)
+    assert client.post('/api/products/batch', json=batch(3, 'Earlier')).status_code == 201
+    titles = [f"Catch {i}" for i in range(25, 0, -1)]
+    response = client.post('/api/products/batch',
+                           json=[{'title': title, 'price': '100.00', 'quantity': '1'} for title in titles])
+    assert response.status_code == 201
+    results = response.get_json()['results']
+    assert len(results) == len(titles)
+    with app.app_context():
+        stored = dict(db.session.execute(db.select(Product.id, Product.title)).all())
+    assert [stored[result['id']] for result in results] == titles
+
+
+def test_batch_statements_do_not_grow_with_items(app, client, count_statements):
+    seller_client(app, client)
+    # Warm the per-worker identity and category caches
+    client.post('/api/products/batch', json=batch(1, 'Warm-up'))
+    counts = []
+    for size in (5, 50):
+        with count_statements() as counter:
+            response = client.post('/api/products/batch', json=batch(size))
+        assert response.status_code == 201
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+
+def test_batch_rejects_a_shared_image_field(app, client):
+    seller_client(app, client)
+    items = [{'title': title, 'price': '100.00', 'quantity': '1', 'image': 'photo'}
+             for title in ('Pomfret', 'Mackerel')]
+    response = client.post('/api/products/batch', content_type='multipart/form-data', data={
+        'products': json.dumps(items),
+        'photo': (io.BytesIO(b'not really a jpeg'), 'catch.jpg'),
+    })
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert results[0] == {'ok': True}
+    assert 'already used' in results[1]['error']
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Product.id))) == 0
+
+
+def test_batch_rejects_fractional_quantities(app, client):
+    seller_client(app, client)
+    response = client.post('/api/products/batch', json=[
+        {'title': 'Pomfret', 'price': '300', 'quantity': 3.0},
+        {'title': 'Mackerel', 'price': '120', 'quantity': 2.5},
+        {'title': 'Prawns', 'price': '450', 'quantity': '1.5'},
+        {'title': 'Crab', 'price': '600', 'quantity': True},
+    ])
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert results[0] == {'ok': True}
+    assert results[1]['error'] == 'Quantity must be a whole number'
+    assert 'valid numbers' in results[2]['error']
+    assert results[3]['error'] == 'Quantity must be a whole number'
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Product.id))) == 0
@@ -0,0 +1,29 @@
+import pytest
+
+from app import create_app
+from profiling import DEFAULT_ENDPOINTS, settings_from_env
+
+
+def test_profiler_settings_default_to_off():
+    assert settings_from_env({}) == {
+        'PROFILE_SAMPLE_RATE': 0.0, 'PROFILE_MODE': 'stack', 'PROFILE_ENDPOINTS': DEFAULT_ENDPOINTS,
+    }
+
+
+def test_profiler_settings_come_from_the_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILE_SAMPLE_RATE', '0.25')
+    monkeypatch.setenv('PROFILE_MODE', 'cprofile')
+    monkeypatch.setenv('PROFILE_ENDPOINTS', 'products, store_page')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                      'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'PROFILE_DIR': str(tmp_path / 'profiles')})
+    profiler = app.extensions['request_profiler']
+    assert (profiler.rate, profiler.mode, profiler.endpoints) == (0.25, 'cprofile', {'products', 'store_page'})
+
+
+def test_empty_endpoint_list_profiles_every_view():
+    assert settings_from_env({'PROFILE_ENDPOINTS': ''})['PROFILE_ENDPOINTS'] == ()
+
+
+def test_bad_sample_rate_is_reported():
+    with pytest.raises(ValueError, match='PROFILE_SAMPLE_RATE'):
+        settings_from_env({'PROFILE_SAMPLE_RATE': 'often'})
@@ -0,0 +1,17 @@
+from app import Product, db
+from query_plans import check_query_plans, explain, plan_problems
+
+
+def test_hot_queries_use_indexes(app):
+    results = check_query_plans(app)
+    names = {name for name, _details, _problems in results}
+    assert {'store summaries', 'store clusters: cells', 'store clusters: top stores',
+            'store page: reviews', 'store page: older reviews'} <= names
+    regressed = {name: problems for name, _details, problems in results if problems}
+    assert regressed == {}
+
+
+def test_a_table_scan_is_reported(app):
+    with app.app_context(), db.engine.connect() as connection:
+        details = explain(connection, Product.query.filter_by(description='fresh'))
+    assert plan_problems(details) == ['SCAN product']
@@ -0,0 +1,57 @@
+import pytest
+from flask import jsonify, session
+from flask_login import current_user, login_required
+
+from app import User, db, user_cache
+from conftest import add_user, login
+
+
+@pytest.fixture
+def whoami(app):
+    """A test-only view echoing the identity load_user() served."""
+    @login_required
+    def view():
+        return jsonify(store_name=current_user.store_name, user_rev=session.get('user_rev'))
+
+    app.add_url_rule('/_whoami', 'whoami', view)
+    return lambda client: client.get('/_whoami').get_json()
+
+
+def session_rev(client):
+    with client.session_transaction() as sess:
+        return sess.get('user_rev')
+
+
+def test_edit_store_refreshes_cached_identity(app, client, whoami):
+    add_user(app, 'seller@example.com', 'seller', store_name='Old Name')
+    login(client, 'seller@example.com')
+    assert whoami(client)['store_name'] == 'Old Name'
+    rev_before = session_rev(client)
+
+    response = client.post('/edit-store', data={'store_name': 'New Name'})
+    assert response.status_code == 302
+
+    rev_after = session_rev(client)
+    assert rev_after != rev_before
+    served = whoami(client)
+    assert served == {'store_name': 'New Name', 'user_rev': rev_after}
+
+
+def test_identity_is_reloaded_after_cache_is_emptied(app, client, whoami, count_statements):
+    user_id = add_user(app, 'seller@example.com', 'seller', store_name='Cached Name')
+    login(client, 'seller@example.com')
+    assert whoami(client)['store_name'] == 'Cached Name'
+
+    # A change the cache doesn't know about is hidden until the cache is emptied
+    with app.app_context():
+        User.query.filter_by(id=user_id).update({'store_name': 'Database Name'})
+        db.session.commit()
+    with count_statements() as counter:
+        assert whoami(client)['store_name'] == 'Cached Name'
+    assert counter.count == 0
+
+    user_cache.clear()
+    with count_statements() as counter:
+        assert whoami(client)['store_name'] == 'Database Name'
+    assert counter.count == 1
+    assert len(user_cache) == 1
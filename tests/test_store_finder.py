@@ -0,0 +1,88 @@
+from conftest import add_user, login
+
+
+def add_sellers(app, start, count):
+    for i in range(start, start + count):
+        add_user(app, f"seller{i}@example.com", 'seller', store_name=f"Store {i}",
+                 store_latitude=15.0 + i / 1000, store_longitude=73.8 + i / 1000)
+
+
+def stores_statements(client, count_statements):
+    # Warm the per-worker identity cache so only the page's own statements count
+    client.get('/stores')
+    with count_statements() as counter:
+        response = client.get('/stores')
+    assert response.status_code == 200
+    return counter.count
+
+
+def test_store_finder_statements_do_not_grow_with_sellers(app, client, count_statements):
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    add_sellers(app, 0, 5)
+    with_n = stores_statements(client, count_statements)
+    add_sellers(app, 5, 5)
+    with_2n = stores_statements(client, count_statements)
+    assert with_n == with_2n
+
+
+def test_nearby_store_summaries_do_not_grow_with_sellers(app, client, count_statements):
+    # store_summary_query() behind the map: ratings and product counts in one statement
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    client.get('/api/stores/nearby?lat=15.0&lng=73.8')
+    counts = []
+    for start in (0, 5):
+        add_sellers(app, start, 5)
+        with count_statements() as counter:
+            response = client.get('/api/stores/nearby?lat=15.0&lng=73.8&radius=50')
+        assert len(response.get_json()['stores']) == start + 5
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+
+def test_store_count_only_includes_stores_on_the_map(app, client):
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    add_sellers(app, 0, 3)
+    add_user(app, 'unmapped@example.com', 'seller', store_name='No Pin Yet')
+    page = client.get('/stores').get_data(as_text=True)
+    assert '<strong>3</strong> verified stores on the map' in page
+
+
+def test_name_search_ignores_the_viewport_and_finds_unmapped_stores(app, client):
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    add_sellers(app, 0, 2)
+    add_user(app, 'far@example.com', 'seller', store_name='Far Store',
+             store_latitude=19.0, store_longitude=72.8)
+    add_user(app, 'unmapped@example.com', 'seller', store_name='Unmapped Store')
+
+    # A viewport around the first sellers only
+    viewport = client.get('/api/stores/nearby?bbox=14.9,73.7,15.1,73.9&q=Store').get_json()
+    names = [store['name'] for store in viewport['stores']]
+    assert names == ['Store 0', 'Store 1', 'Far Store', 'Unmapped Store']
+
+    nearest = client.get('/api/stores/nearby?lat=19.0&lng=72.8&q=store').get_json()['stores']
+    assert [store['name'] for store in nearest] == ['Far Store', 'Store 1', 'Store 0', 'Unmapped Store']
+    assert nearest[0]['distance_km'] == 0
+    assert nearest[-1]['lat'] is None and 'distance_km' not in nearest[-1]
+
+
+def test_truncated_counts_only_stores_inside_the_radius(app, client):
+    add_user(app, 'buyer@example.com')
+    login(client, 'buyer@example.com')
+    # ~1 km north and inside; ~1.3 km away in the box corner, outside a 1.1 km circle
+    add_user(app, 'inside@example.com', 'seller', store_name='Inside',
+             store_latitude=15.009, store_longitude=73.8)
+    add_user(app, 'corner@example.com', 'seller', store_name='Corner',
+             store_latitude=15.009, store_longitude=73.809)
+
+    response = client.get('/api/stores/nearby?lat=15.0&lng=73.8&radius=1.1&limit=1').get_json()
+    assert [store['name'] for store in response['stores']] == ['Inside']
+    assert response['truncated'] is False
+
+    add_user(app, 'second@example.com', 'seller', store_name='Also Inside',
+             store_latitude=14.992, store_longitude=73.8)
+    response = client.get('/api/stores/nearby?lat=15.0&lng=73.8&radius=1.1&limit=1').get_json()
+    assert response['truncated'] is True
@@ -0,0 +1,87 @@
+from app import StoreReview, db
+from conftest import add_user, login
+
+
+def add_reviews(app, store_id, start, count):
+    with app.app_context():
+        for i in range(start, start + count):
+            reviewer_id = add_user(app, f"buyer{i}@example.com")
+            db.session.add(StoreReview(store_owner_id=store_id, reviewer_id=reviewer_id,
+                                       rating=1 + i % 5, review_text=f"Review {i}"))
+        db.session.commit()
+
+
+def store_page_statements(client, store_id, count_statements):
+    # Warm the per-worker identity cache so only the page's own statements count
+    client.get(f'/store/{store_id}')
+    with count_statements() as counter:
+        response = client.get(f'/store/{store_id}')
+    assert response.status_code == 200
+    return counter.count, response.get_data(as_text=True)
+
+
+def test_store_page_statements_do_not_grow_with_reviews(app, client, count_statements):
+    store_id = add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    add_user(app, 'visitor@example.com')
+    login(client, 'visitor@example.com')
+    add_reviews(app, store_id, 0, 3)
+    with_n, page = store_page_statements(client, store_id, count_statements)
+    assert 'buyer2' in page
+    add_reviews(app, store_id, 3, 3)
+    with_2n, page = store_page_statements(client, store_id, count_statements)
+    assert 'buyer5' in page
+    assert with_n == with_2n
+
+
+def review_texts(page):
+    return [card.split('<p>', 1)[1].split('</p>', 1)[0]
+            for card in page.split('class="review-card"')[1:]]
+
+
+def older_reviews_url(page):
+    if 'Older reviews' not in page:
+        return None
+    return page.split('>Older reviews<', 1)[0].rsplit('href="', 1)[1].split('"', 1)[0].replace('&amp;', '&')
+
+
+def test_store_page_pages_through_every_review(app, client):
+    app.config['STORE_PAGE_REVIEWS'] = 2
+    store_id = add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    add_user(app, 'visitor@example.com')
+    login(client, 'visitor@example.com')
+    add_reviews(app, store_id, 0, 5)
+
+    pages = []
+    url = f'/store/{store_id}'
+    while url:
+        page = client.get(url).get_data(as_text=True)
+        pages.append(review_texts(page))
+        url = older_reviews_url(page)
+    assert pages == [['Review 4', 'Review 3'], ['Review 2', 'Review 1'], ['Review 0']]
+
+
+def revalidate(client, store_id, etag, count_statements):
+    with count_statements() as counter:
+        response = client.get(f'/store/{store_id}', headers={'If-None-Match': etag})
+    return response, counter.count
+
+
+def test_store_page_revalidation_statements_do_not_grow_with_reviews(app, client, count_statements):
+    store_id = add_user(app, 'seller@example.com', 'seller', store_name='Fresh Catch')
+    add_user(app, 'visitor@example.com')
+    login(client, 'visitor@example.com')
+    etag = client.get(f'/store/{store_id}').headers['ETag']
+
+    counts = []
+    for start in (0, 3):
+        add_reviews(app, store_id, start, 3)
+        response, statements = revalidate(client, store_id, etag, count_statements)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        counts.append(statements)
+    assert counts[0] == counts[1]
+
+    # An up-to-date client is answered before any review is loaded
+    response, not_modified = revalidate(client, store_id, etag, count_statements)
+    assert response.status_code == 304
+    assert not_modified < counts[1]
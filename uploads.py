@@ -0,0 +1,109 @@
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are streamed to a temporary file while being hashed (SHA-256) and
+then moved to a path derived from the digest:
+
+    <UPLOAD_FOLDER>/content/3f/a2/3fa2...e9.jpg
+
+Identical files therefore share one copy on disk, two uploads can never
+collide on a name, and a stored path always refers to the same bytes, so
+it is safe to serve with far-future immutable cache headers. Generated
+variants live next to their source under variants/.
+
+Files are shared, so they may only be deleted once nothing references
+them: references are counted from the database (Product.image_filename,
+User.store_image) and collect_garbage() removes the files whose count
+dropped to zero (see `python db_manager.py gc_uploads`).
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+CONTENT_DIR = 'content'
+CHUNK_SIZE = 64 * 1024
+
+
+def content_path(digest, ext):
+    """Sharded path (relative to the upload folder) for a digest."""
+    return f"{CONTENT_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def is_content_path(relpath):
+    return bool(relpath) and relpath.startswith(CONTENT_DIR + '/')
+
+
+def save_upload(file_storage, upload_folder, ext):
+    """Stream an uploaded file into content-addressed storage.
+
+    Returns the stored path relative to upload_folder and whether the bytes
+    were already present (a deduplicated upload).
+    """
+    tmp_dir = os.path.join(upload_folder, CONTENT_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            stream = file_storage.stream
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        relpath = content_path(digest.hexdigest(), ext.lower())
+        final_path = os.path.join(upload_folder, relpath)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            # Refresh mtime so garbage collection's grace period covers the new reference
+            os.utime(final_path)
+            return relpath, True
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # Atomic: a concurrent upload of the same bytes just replaces it with itself
+        os.replace(tmp_path, final_path)
+        return relpath, False
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def variant_prefix(relpath):
+    """Path prefix shared by the generated variants of a stored file."""
+    folder, name = os.path.split(relpath)
+    return f"{folder}/variants/{os.path.splitext(name)[0]}_"
+
+
+def iter_content_files(upload_folder):
+    """Yield (relpath, mtime, size) for every file in content storage."""
+    root = os.path.join(upload_folder, CONTENT_DIR)
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, upload_folder).replace(os.sep, '/')
+            st = os.stat(full)
+            yield rel, st.st_mtime, st.st_size
+
+
+def collect_garbage(upload_folder, referenced, grace_seconds=3600, dry_run=False):
+    """Delete content files that nothing references.
+
+    `referenced` is the set of stored paths still in use. Variants are kept
+    while their source is referenced. Files younger than grace_seconds are
+    skipped so uploads whose row hasn't been committed yet survive.
+    Returns (files removed, bytes freed).
+    """
+    keep_prefixes = tuple(variant_prefix(p) for p in referenced if is_content_path(p))
+    cutoff = time.time() - grace_seconds
+    removed = freed = 0
+    for rel, mtime, size in iter_content_files(upload_folder):
+        if rel in referenced or rel.startswith(keep_prefixes) or mtime > cutoff:
+            continue
+        if not dry_run:
+            os.remove(os.path.join(upload_folder, rel))
+        removed += 1
+        freed += size
+    return removed, freed